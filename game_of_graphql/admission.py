@@ -0,0 +1,95 @@
+# Copyright 2017 Kensho Technologies, Inc.
+"""Bound the number of queries executing at once, turning away queries that would wait long."""
+from contextlib import contextmanager
+import threading
+import time
+
+
+class AdmissionRejectedError(RuntimeError):
+    """Raised when a query is turned away, since too many queries are executing or waiting."""
+
+
+class AdmissionController(object):
+    """Admit at most a fixed number of queries at once, with a bounded queue for the rest."""
+
+    def __init__(self, max_concurrent, max_queued, queue_timeout):
+        """Create a controller that executes up to "max_concurrent" queries at the same time.
+
+        Args:
+            max_concurrent: int, maximum number of queries admitted at the same time
+            max_queued: int, maximum number of queries waiting to be admitted. Queries that
+                        arrive when the queue is full are rejected right away.
+            queue_timeout: float, seconds a query may wait to be admitted before it is rejected
+        """
+        if max_concurrent < 1:
+            raise ValueError(u'Concurrency limit must be at least 1, got: {}'.format(
+                max_concurrent))
+        if max_queued < 0:
+            raise ValueError(u'Queue size must not be negative, got: {}'.format(max_queued))
+
+        self._max_concurrent = max_concurrent
+        self._max_queued = max_queued
+        self._queue_timeout = queue_timeout
+
+        self._condition = threading.Condition()
+        self._active = 0
+        self._queued = 0
+        self._counters = {
+            'admitted': 0,
+            'rejected': 0,
+        }
+
+    def acquire(self):
+        """Wait until the query may be executed, raising AdmissionRejectedError if it may not.
+
+        Every successful call must be matched by a call to release().
+        """
+        with self._condition:
+            if self._active >= self._max_concurrent:
+                if self._queued >= self._max_queued:
+                    self._counters['rejected'] += 1
+                    raise AdmissionRejectedError(
+                        u'Too many queries in progress: {} executing and {} waiting.'.format(
+                            self._active, self._queued))
+
+                self._queued += 1
+                try:
+                    deadline = time.time() + self._queue_timeout
+                    while self._active >= self._max_concurrent:
+                        remaining = deadline - time.time()
+                        if remaining <= 0:
+                            self._counters['rejected'] += 1
+                            raise AdmissionRejectedError(
+                                u'Timed out after waiting {} seconds for one of the {} '
+                                u'executing queries to finish.'.format(
+                                    self._queue_timeout, self._max_concurrent))
+                        self._condition.wait(remaining)
+                finally:
+                    self._queued -= 1
+
+            self._active += 1
+            self._counters['admitted'] += 1
+
+    def release(self):
+        """Mark an admitted query as finished, letting a waiting query in."""
+        with self._condition:
+            self._active -= 1
+            self._condition.notify()
+
+    @contextmanager
+    def admit(self):
+        """Execute the "with" block as an admitted query, see acquire()."""
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self):
+        """Return a dict of admission counters and current occupancy."""
+        with self._condition:
+            result = dict(self._counters)
+            result['active'] = self._active
+            result['queued'] = self._queued
+            result['max_concurrent'] = self._max_concurrent
+        return result
@@ -0,0 +1,99 @@
+# Copyright 2017 Kensho Technologies, Inc.
+"""Benchmark the Demo notebook's queries against the Game of GraphQL database."""
+import json
+import time
+
+import click
+from pyorient.ogm import Config
+import six
+
+from game_of_graphql.connection_pool import OrientDBConnectionPool
+from game_of_graphql.demo_queries import DEMO_QUERIES
+from game_of_graphql.new_dataset import read_schema_commands
+from game_of_graphql.query_cache import bind_arguments, compile_query
+from game_of_graphql.server import schema
+
+
+def _get_index_commands():
+    """Return the (create command, drop command) tuples for each index in the schema."""
+    index_prefix = 'CREATE INDEX '
+    result = []
+    for command in read_schema_commands():
+        if command.startswith(index_prefix):
+            index_name = command[len(index_prefix):].split()[0]
+            result.append((command, 'DROP INDEX {}'.format(index_name)))
+    return result
+
+
+def summarize_timings(timings):
+    """Return a dict of summary statistics, in milliseconds, for the given timings in seconds."""
+    ordered = sorted(timings)
+    return {
+        'min_ms': ordered[0] * 1000.0,
+        'median_ms': ordered[len(ordered) // 2] * 1000.0,
+        'p90_ms': ordered[min(len(ordered) - 1, int(len(ordered) * 0.9))] * 1000.0,
+        'max_ms': ordered[-1] * 1000.0,
+    }
+
+
+def benchmark_demo_queries(client, repetitions):
+    """Run each Demo query the given number of times, and return its timing statistics.
+
+    Returns:
+        dict, Demo query name -> dict with the number of result rows and timing statistics
+    """
+    results = {}
+    for demo_query in DEMO_QUERIES:
+        bound_query = bind_arguments(compile_query(schema, demo_query.query), demo_query.args)
+
+        timings = []
+        row_count = None
+        for _ in six.moves.xrange(repetitions):
+            start_time = time.time()
+            row_count = len(client.command(bound_query.match_query, -1))
+            timings.append(time.time() - start_time)
+
+        result = summarize_timings(timings)
+        result['rows'] = row_count
+        results[demo_query.name] = result
+
+    return results
+
+
+@click.command()
+@click.option('--graph-location', type=str, default='127.0.0.1:2424',
+              help='OrientDB host and port')
+@click.option('--graph-user', type=str, default='root',
+              help='OrientDB username')
+@click.option('--graph-password', type=str, default='root',
+              help='OrientDB password')
+@click.option('--repetitions', type=int, default=20,
+              help='Number of times to run each query')
+@click.option('--compare-without-indexes', is_flag=True, default=False,
+              help='Also benchmark with the schema\'s indexes temporarily dropped')
+def run(graph_location, graph_user, graph_password, repetitions, compare_without_indexes):
+    """Print the timings of the Demo queries as JSON."""
+    config = Config.from_url(
+        'plocal://{}/game_of_graphql'.format(graph_location), graph_user, graph_password)
+    pool = OrientDBConnectionPool(config, size=1)
+
+    report = {}
+    with pool.connection() as client:
+        report['with_indexes'] = benchmark_demo_queries(client, repetitions)
+
+        if compare_without_indexes:
+            index_commands = _get_index_commands()
+            for _, drop_command in index_commands:
+                client.command(drop_command)
+            try:
+                report['without_indexes'] = benchmark_demo_queries(client, repetitions)
+            finally:
+                for create_command, _ in index_commands:
+                    client.command(create_command)
+
+    pool.close()
+    click.echo(json.dumps(report, indent=4, sort_keys=True))
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,194 @@
+# Copyright 2017 Kensho Technologies, Inc.
+"""A bounded, thread-safe pool of open OrientDB database sessions."""
+from contextlib import contextmanager
+import logging
+import socket
+import threading
+import time
+
+from pyorient import OrientDB, PyOrientConnectionException, PyOrientException
+from six.moves import queue
+
+
+logger = logging.getLogger(__name__)
+
+
+class ConnectionPoolTimeout(RuntimeError):
+    """Raised when no database session could be checked out before the timeout expired."""
+
+
+class OrientDBConnectionPool(object):
+    """Hand out open OrientDB sessions, reusing them across requests."""
+
+    def __init__(self, config, size=8, checkout_timeout=10.0, health_check_interval=30.0):
+        """Create a pool of at most "size" sessions to the database described by the config.
+
+        Args:
+            config: pyorient.ogm.Config object, describing the database to connect to
+            size: int, maximum number of sessions the pool will keep open at the same time
+            checkout_timeout: float, seconds to wait for a free session before giving up
+            health_check_interval: float, sessions idle for longer than this many seconds
+                                   are checked for liveness before being handed out
+
+        Sessions are opened lazily, so an idle server holds no more sessions than it needs.
+        """
+        if size < 1:
+            raise ValueError(u'Pool size must be at least 1, got: {}'.format(size))
+
+        self._config = config
+        self._size = size
+        self._checkout_timeout = checkout_timeout
+        self._health_check_interval = health_check_interval
+
+        # Most-recently-used sessions are handed out first, so that rarely-used ones go idle
+        # and are health-checked rather than all sessions being kept barely warm.
+        # Each item is a (client, last_used_timestamp) tuple. A client of None marks a slot
+        # whose session was found to be broken, and needs to be reopened.
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._opened_slots = 0
+        self._closed = False
+
+        self._counters = {
+            'checkouts': 0,
+            'waits': 0,
+            'reconnects': 0,
+        }
+
+    def _increment(self, counter_name):
+        """Increment the named counter."""
+        with self._lock:
+            self._counters[counter_name] += 1
+
+    def _open_client(self):
+        """Return a new connection to the graph."""
+        config = self._config
+        client = OrientDB(config.host, config.port, config.serialization_type)
+        client.connect(config.user, config.cred)
+        client.db_open(config.db_name, config.user, config.cred)
+        return client
+
+    @staticmethod
+    def _close_client(client):
+        """Close the given client, only logging any errors since it may already be broken."""
+        try:
+            client.close()
+        except (PyOrientException, socket.error) as e:
+            logger.debug(u'Ignoring an error while closing an OrientDB client: %s', e)
+
+    @staticmethod
+    def _is_healthy(client):
+        """Return True if the client's session is still usable, and False otherwise."""
+        try:
+            client.db_reload()
+            return True
+        except (PyOrientException, socket.error):
+            return False
+
+    def _reserve_slot(self):
+        """Return True if a new session may be opened without exceeding the pool size."""
+        with self._lock:
+            if self._opened_slots < self._size:
+                self._opened_slots += 1
+                return True
+            return False
+
+    def _release_slot(self):
+        """Give back a slot reserved by _reserve_slot, since its session could not be opened."""
+        with self._lock:
+            self._opened_slots -= 1
+
+    def _get_idle_or_new_slot(self):
+        """Return a (client, last_used_timestamp) tuple, waiting for one if necessary."""
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        if self._reserve_slot():
+            try:
+                return self._open_client(), time.time()
+            except Exception:
+                self._release_slot()
+                raise
+
+        self._increment('waits')
+        try:
+            return self._idle.get(timeout=self._checkout_timeout)
+        except queue.Empty:
+            raise ConnectionPoolTimeout(
+                u'Could not check out an OrientDB session within {} seconds; all {} sessions '
+                u'are in use.'.format(self._checkout_timeout, self._size))
+
+    def _reconnect(self, client):
+        """Replace the given broken client (or None) with a freshly-opened one."""
+        if client is not None:
+            self._close_client(client)
+
+        self._increment('reconnects')
+        try:
+            return self._open_client()
+        except Exception:
+            # Keep the slot in the pool, so that a later checkout retries the connection.
+            self._idle.put((None, 0.0))
+            raise
+
+    def _checkout(self):
+        """Return a live client, reconnecting if its session has gone stale."""
+        if self._closed:
+            raise RuntimeError(u'Cannot check out a session from a closed connection pool.')
+
+        client, last_used = self._get_idle_or_new_slot()
+        self._increment('checkouts')
+
+        if client is None:
+            return self._reconnect(None)
+
+        if time.time() - last_used > self._health_check_interval and not self._is_healthy(client):
+            return self._reconnect(client)
+
+        return client
+
+    def _checkin(self, client, healthy):
+        """Return the client to the pool, or mark its slot for reconnection if it is broken."""
+        if self._closed:
+            self._close_client(client)
+        elif healthy:
+            self._idle.put((client, time.time()))
+        else:
+            self._close_client(client)
+            self._idle.put((None, 0.0))
+
+    @contextmanager
+    def connection(self):
+        """Check out a client for the duration of the "with" block, then return it to the pool."""
+        client = self._checkout()
+        healthy = True
+        try:
+            yield client
+        except (PyOrientConnectionException, socket.error):
+            healthy = False
+            raise
+        finally:
+            self._checkin(client, healthy)
+
+    def stats(self):
+        """Return a dict of pool counters and current occupancy."""
+        with self._lock:
+            result = dict(self._counters)
+            result['size'] = self._size
+            result['open'] = self._opened_slots
+        result['idle'] = self._idle.qsize()
+        return result
+
+    def close(self):
+        """Close all idle sessions. Sessions in use are closed when they are returned."""
+        self._closed = True
+        while True:
+            try:
+                client, _ = self._idle.get_nowait()
+            except queue.Empty:
+                return
+
+            if client is not None:
+                self._close_client(client)
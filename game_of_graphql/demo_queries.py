@@ -0,0 +1,116 @@
+# Copyright 2017 Kensho Technologies, Inc.
+"""The example queries from the Demo notebook, for use in benchmarks and checks."""
+from collections import namedtuple
+
+
+DemoQuery = namedtuple('DemoQuery', ('name', 'query', 'args'))
+
+
+DEMO_QUERIES = (
+    DemoQuery(
+        name='all_region_names',
+        query='''{
+            Region {
+                name @output(out_name: "region_name")
+            }
+        }''',
+        args={},
+    ),
+    DemoQuery(
+        name='houses_with_seat_named_after_them',
+        query='''{
+            NobleHouse {
+                name @output(out_name: "house") @tag(tag_name: "h")
+
+                out_Has_Seat {
+                    name @filter(op_name: "has_substring", value: ["%h"])
+                         @output(out_name: "region")
+                }
+            }
+        }''',
+        args={},
+    ),
+    DemoQuery(
+        name='parent_regions_of_region',
+        query='''{
+            Region @filter(op_name: "name_or_alias", value: ["$region"]) {
+                out_Has_Parent_Region {
+                    out_Has_Parent_Region @recurse(depth: 10) {
+                        name @output(out_name: "parent_region")
+                    }
+                }
+            }
+        }''',
+        args={
+            'region': 'Great Sept of Baelor',
+        },
+    ),
+    DemoQuery(
+        name='people_living_in_region',
+        query='''{
+            Region @filter(op_name: "name_or_alias", value: ["$region"]) {
+                in_Has_Parent_Region @recurse(depth: 10) {
+                    name @output(out_name: "region_name")
+
+                    in_Lives_In {
+                        name @output(out_name: "character_name")
+
+                        out_Owes_Allegiance_To @fold {
+                            ... on NobleHouse {
+                                name @output(out_name: "loyal_to_noble_houses")
+                            }
+                        }
+                    }
+                }
+            }
+        }''',
+        args={
+            'region': 'The Riverlands',
+        },
+    ),
+    DemoQuery(
+        name='allegiances_of_character',
+        query='''{
+            Character @filter(op_name: "name_or_alias", value: ["$character"]) {
+                out_Owes_Allegiance_To @fold {
+                    __typename @output(out_name: "allegiance_type")
+                    name @output(out_name: "allegiances")
+                }
+            }
+        }''',
+        args={
+            'character': 'Sansa Stark',
+        },
+    ),
+    DemoQuery(
+        name='characters_with_many_allegiances',
+        query='''{
+            Character {
+                name @output(out_name: "character")
+                out_Owes_Allegiance_To @fold {
+                    ... on NobleHouse {
+                        _x_count @filter(op_name: ">=", value: ["$min_allegiances"])
+                        name @output(out_name: "allegiances")
+                    }
+                }
+            }
+        }''',
+        args={
+            'min_allegiances': 3,
+        },
+    ),
+    DemoQuery(
+        name='characters_owing_many_allegiances',
+        query='''{
+            Character {
+                name @output(out_name: "character")
+                out_Owes_Allegiance_To @fold {
+                    _x_count @filter(op_name: ">=", value: ["$min_allegiances"])
+                }
+            }
+        }''',
+        args={
+            'min_allegiances': 3,
+        },
+    ),
+)
@@ -0,0 +1,31 @@
+# Copyright 2017 Kensho Technologies, Inc.
+"""Run database work on a dedicated pool of threads, off the request-handling threads."""
+from multiprocessing.pool import ThreadPool
+
+
+class QueryExecutor(object):
+    """A fixed-size pool of threads on which to run OrientDB queries."""
+
+    def __init__(self, thread_count):
+        """Create an executor that runs at most "thread_count" queries at the same time."""
+        if thread_count < 1:
+            raise ValueError(u'Thread count must be at least 1, got: {}'.format(thread_count))
+
+        self._thread_pool = ThreadPool(processes=thread_count)
+
+    def run(self, func, *args):
+        """Run func(*args) on one of the executor's threads, and return its result."""
+        return self._thread_pool.apply_async(func, args).get()
+
+    def submit(self, func, *args):
+        """Run func(*args) on one of the executor's threads, without waiting for it to finish."""
+        self._thread_pool.apply_async(func, args)
+
+    def map(self, func, items):
+        """Run func on each of the items in parallel, and return the list of results in order."""
+        return self._thread_pool.map(func, items)
+
+    def close(self):
+        """Wait for all submitted work to finish, then stop the executor's threads."""
+        self._thread_pool.close()
+        self._thread_pool.join()
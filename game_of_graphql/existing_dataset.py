@@ -1,27 +1,130 @@
 # Copyright 2017 Kensho Technologies, Inc.
 """Load the existing dataset into a form we can manipulate."""
+from functools import partial
+import logging
 import re
 import string
 
-from pyorient.ogm import Graph
-from pyorient.ogm.declarative import declarative_node, declarative_relationship
-
-
-def _initialize_graph_connection(config):
-    """Initialize a graph connection with the given configuration."""
-    graph = Graph(config, strict=True)
-    base_node = declarative_node()
-    base_relationship = declarative_relationship()
-    graph.include(graph.build_mapping(base_node, base_relationship, auto_plural=True))
-    return graph
-
-
-def _load_vertices_from_query(graph, query):
-    """Return all vertex data (keyed by @rid) from a given query."""
-    return {
-        x.oRecordData['rid'].get_hash(): x.oRecordData
-        for x in graph.client.query(query, -1)
-    }
+import six
+
+from game_of_graphql.connection_pool import OrientDBConnectionPool
+from game_of_graphql.execution import QueryExecutor
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PAGE_SIZE = 1000
+
+# The class names and record ids that may be put into the text of a query.
+_CLASS_NAME_PATTERN = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+_RID_PATTERN = re.compile(r'^#[0-9]+:[0-9]+$')
+
+# Selects a record for each class of the database schema, with its name, superclasses
+# and the ids of its clusters.
+SCHEMA_CLASSES_QUERY = u'SELECT expand(classes) FROM metadata:schema'
+
+
+def get_polymorphic_cluster_ids(schema_classes, class_name):
+    """Return the sorted list of ids of the clusters holding records of the class or a subclass.
+
+    Args:
+        schema_classes: list of dicts, the data of each record selected by SCHEMA_CLASSES_QUERY
+        class_name: str, name of the class
+
+    Returns:
+        list of ints, the cluster ids
+    """
+    superclass_names = {}
+    cluster_ids = {}
+    for schema_class in schema_classes:
+        name = schema_class['name']
+        superclass_names[name] = schema_class.get('superClasses') or (
+            [schema_class['superClass']] if schema_class.get('superClass') else [])
+        cluster_ids[name] = schema_class.get('clusterIds') or []
+    if class_name not in cluster_ids:
+        raise ValueError(u'No class {} in the database schema.'.format(class_name))
+
+    subclass_names = set([class_name])
+    unvisited_names = set(cluster_ids) - subclass_names
+    found_subclass = True
+    while found_subclass:
+        found_subclass = False
+        for name in list(unvisited_names):
+            if subclass_names.intersection(superclass_names[name]):
+                subclass_names.add(name)
+                unvisited_names.remove(name)
+                found_subclass = True
+
+    # Abstract classes have no clusters of their own, which is recorded as cluster id -1.
+    return sorted(set(
+        cluster_id
+        for name in subclass_names
+        for cluster_id in cluster_ids[name]
+        if cluster_id >= 0
+    ))
+
+
+def iterate_query_records(client, projection, target, condition, page_size):
+    """Yield the data of each record selected by the query, reading it one page at a time.
+
+    Args:
+        client: OrientDB client, connected to the database to query
+        projection: str, the SELECT query's projection. The record's @rid is always
+                    selected as well, as "rid". Must be a constant of this package.
+        target: str, the class to select records from, including those of its subclasses
+        condition: str, the query's WHERE condition, or None to select all records.
+                   Must be a constant of this package.
+        page_size: int, maximum number of records read per query
+
+    Yields:
+        dict, the data of each record, in @rid order
+
+    Pages are read with keyset pagination: each page starts after the @rid of the last
+    record of the previous page. Unlike SKIP, this does not get slower for later pages.
+    Each cluster of the class and its subclasses is paged through on its own, in order of
+    cluster id. A cluster is scanned in @rid order, so a page of a single cluster needs no
+    sorting, while a page of a class such as V or E would need the records of all its
+    subclasses' clusters merged and sorted, for every page anew.
+    """
+    if not _CLASS_NAME_PATTERN.match(target):
+        raise ValueError(u'Invalid class name: {}'.format(target))
+    page_size = int(page_size)
+
+    schema_classes = [record.oRecordData for record in client.query(SCHEMA_CLASSES_QUERY, -1)]
+    for cluster_id in get_polymorphic_cluster_ids(schema_classes, target):
+        for record_data in _iterate_cluster_records(
+                client, projection, int(cluster_id), condition, page_size):
+            yield record_data
+
+
+def _iterate_cluster_records(client, projection, cluster_id, condition, page_size):
+    """Yield the data of each record of the cluster selected by the query, one page at a time."""
+    last_rid = None
+    while True:
+        conditions = []
+        if condition is not None:
+            conditions.append(u'({})'.format(condition))
+        if last_rid is not None:
+            if not _RID_PATTERN.match(last_rid):
+                raise ValueError(u'Invalid record id: {}'.format(last_rid))
+            conditions.append(u'@rid > {}'.format(last_rid))
+        where_clause = u' WHERE {}'.format(u' AND '.join(conditions)) if conditions else u''
+
+        # Only the package's own constants, a checked record id, and ints are put into
+        # the query's text.
+        query = u'SELECT @rid AS rid, {} FROM cluster:{}{} LIMIT {}'.format(  # nosec
+            projection, cluster_id, where_clause, page_size)
+        records = client.query(query, -1)
+        # Records are modified by their consumers, so the next page's key is read beforehand.
+        is_last_page = len(records) < page_size
+        if not is_last_page:
+            last_rid = records[-1].oRecordData['rid'].get_hash()
+
+        for record in records:
+            yield record.oRecordData
+
+        if is_last_page:
+            return
 
 
 def _split_up_multiple_entries(entry):
@@ -61,18 +164,16 @@ def _strip_parenthesized_portions_of_names(name):
     return _parenthesized_name_part.sub('', name)
 
 
-def _load_characters(graph):
+def _load_characters(client, page_size):
     """Load all character data."""
-    characters = _load_vertices_from_query(
-        graph, 'SELECT @rid AS rid, name, Aka FROM Character')
-
     alias_potential_suffixes = [
         '(formerly)',
         '(given name)',
         '(player-determined)',
     ]
 
-    for character in characters.values():
+    characters = dict()
+    for character in iterate_query_records(client, 'name, Aka', 'Character', None, page_size):
         alias = []
         if 'Aka' in character:
             aka_items = character['Aka']
@@ -88,22 +189,23 @@ def _load_characters(graph):
         character['name'] = _clean_up_string_entry(
             _strip_parenthesized_portions_of_names(character['name']))
 
+        characters[character['rid']] = character
+
     return characters
 
 
-def _load_houses(graph):
+def _load_houses(client, page_size):
     """Load all noble house data."""
-    raw_houses = _load_vertices_from_query(
-        graph,
-        'SELECT @rid AS rid, * FROM V WHERE @this INSTANCEOF "Noble_house" OR '
-        '@this INSTANCEOF "Noblehouse"')
+    raw_houses = iterate_query_records(
+        client, '*', 'V',
+        '@this INSTANCEOF "Noble_house" OR @this INSTANCEOF "Noblehouse"', page_size)
     potential_suffixes = [
         '(official)',
         '(common saying)',
     ]
 
     houses = dict()
-    for key, raw_house in raw_houses.items():
+    for raw_house in raw_houses:
         raw_name = raw_house['name']
         house_prefix = 'House '
         if raw_name.startswith(house_prefix):
@@ -132,7 +234,7 @@ def _load_houses(graph):
             motto = [_clean_up_string_entry(x) for x in temp_motto]
         house['motto'] = motto
 
-        houses[key] = house
+        houses[house['rid']] = house
 
     return houses
 
@@ -163,19 +265,58 @@ def _fill_in_missing_regions():
     }
 
 
-def _get_rid_for_name(entries, name):
-    """Get the rid of the entry with the given name."""
-    for entry in entries.values():
-        if entry['name'] == name:
-            return entry['rid']
+class NameLookupError(ValueError):
+    """Raised when a name matches no entry, or more than one entry, of a NameIndex."""
 
-    raise ValueError(u'No entry with name {} found in entries {}'.format(name, entries))
 
+class AmbiguousNameError(NameLookupError):
+    """Raised when a name matches more than one entry of a NameIndex."""
 
-def _load_missing_region_edges(regions):
-    """Fill in the missing Has_Parent_Region edges."""
-    # Existing regions whose parent region is Westeros.
-    westeros_children = [
+
+class NameIndex(object):
+    """Look up the rids of entries by their name or alias."""
+
+    def __init__(self, entries, description):
+        """Index the entries of a dict of rid -> entry, each with a "name" and "alias" list.
+
+        Args:
+            entries: dict, rid -> entry data
+            description: str, what the entries are, used in error messages
+        """
+        self._description = description
+        self._rids_by_name = {}
+        self._rids_by_alias = {}
+        for rid, entry in six.iteritems(entries):
+            self._rids_by_name.setdefault(entry['name'], []).append(rid)
+            for alias in set(entry['alias']):
+                self._rids_by_alias.setdefault(alias, []).append(rid)
+
+    def get_rid(self, name):
+        """Return the rid of the only entry with the given name, or else with the given alias.
+
+        Raises:
+            AmbiguousNameError if more than one entry has the name. If no entry has the name,
+            the same applies to entries with the name as an alias.
+            NameLookupError if no entry has the name, either as its name or as an alias.
+        """
+        for match_type, rids_by_key in (('name', self._rids_by_name),
+                                        ('alias', self._rids_by_alias)):
+            rids = rids_by_key.get(name, [])
+            if len(rids) == 1:
+                return rids[0]
+            elif len(rids) > 1:
+                raise AmbiguousNameError(u'Ambiguous {} {}: {} entries have it as their {}, '
+                                         u'with rids {}'.format(self._description, name,
+                                                                len(rids), match_type,
+                                                                sorted(rids)))
+
+        raise NameLookupError(u'No {} has the name or alias {}'.format(self._description, name))
+
+
+# Existing regions whose parent region is one of the regions missing from the source graph,
+# by the rid of that parent region.
+MISSING_PARENT_REGION_CHILD_NAMES = {
+    WESTEROS_REGION_RID: [
         'Beyond the Wall',
         'The North',
         'Iron Islands',
@@ -186,14 +327,8 @@ def _load_missing_region_edges(regions):
         'The Reach',
         'The Stormlands',
         'Dorne',
-    ]
-    westeros_children_rids = [
-        _get_rid_for_name(regions, x)
-        for x in westeros_children
-    ]
-
-    # Existing regions whose parent region is Essos.
-    essos_children = [
+    ],
+    ESSOS_REGION_RID: [
         'Free Cities',
         'Red Waste',
         "Slaver's Bay",
@@ -204,111 +339,124 @@ def _load_missing_region_edges(regions):
         'Dothraki Sea',
         'Bayasabhad',
         'Samyrian',
-    ]
-    essos_children_rids = [
-        _get_rid_for_name(regions, x)
-        for x in essos_children
-    ]
-
-    # Existing regions whose parent region is World.
-    world_children = [
+    ],
+    WORLD_REGION_RID: [
         'Summer Islands',
         'Basilisk Isles',
         'Ibben',
         'Naath',
-    ]
-    world_children_rids = [
-        _get_rid_for_name(regions, x)
-        for x in world_children
-    ] + [WESTEROS_REGION_RID, ESSOS_REGION_RID]
-
-    existing_region_links = {
-        'Beyond the Wall': [
-            'North Grove',
-            'Thenn',
-        ],
-        'The North': [
-            'Cerwyn',
-            'Winter town',
-        ],
-        'The Wall': [
-            'The Nightfort',
-            'Eastwatch-by-the-Sea',
-        ],
-        'The Gift': [
-            'The Nightfort',
-            'Eastwatch-by-the-Sea',
-        ],
-        'The Riverlands': [
-            'Stone Mill',
-            'Inn at the Crossroads',
-            'Salt Rock',
-        ],
-        'The Reach': [
-            'Long Table',
-        ],
-        'The Westerlands': [
-            'The Banefort',
-            'Ashemark',
-        ],
-        'The Vale of Arryn': [
-            'Baelish Castle',
-            'The Redfort',
-        ],
-        'Iron Islands': [
-            'Hammerhorn',
-        ],
-        'The Stormlands': [
-            'Estermont',
-        ],
-        'Dorne': [
-            'Wyl',
-            'Planky Town',
-        ],
-        "King's Landing": [
-            "Littlefinger's brothel",
-            'Dragonpit',
-        ],
-        'Oldtown': [
-            'The Citadel',
-        ],
-        'Meereen': [
-            "Daznak's Pit",
-        ],
-        'House of Black and White': [
-            'Hall of Faces',
-        ],
-        'Dothraki Sea': [
-            'Vaes Dothrak',
-        ],
-    }
-
-    final_data = {
-        WESTEROS_REGION_RID: westeros_children_rids,
-        ESSOS_REGION_RID: essos_children_rids,
-        WORLD_REGION_RID: world_children_rids,
-    }
+    ],
+}
+
+# Existing regions, by name, and the names of their existing child regions
+# that the source graph does not link them to.
+MISSING_REGION_LINKS = {
+    'Beyond the Wall': [
+        'North Grove',
+        'Thenn',
+    ],
+    'The North': [
+        'Cerwyn',
+        'Winter town',
+    ],
+    'The Wall': [
+        'The Nightfort',
+        'Eastwatch-by-the-Sea',
+    ],
+    'The Gift': [
+        'The Nightfort',
+        'Eastwatch-by-the-Sea',
+    ],
+    'The Riverlands': [
+        'Stone Mill',
+        'Inn at the Crossroads',
+        'Salt Rock',
+    ],
+    'The Reach': [
+        'Long Table',
+    ],
+    'The Westerlands': [
+        'The Banefort',
+        'Ashemark',
+    ],
+    'The Vale of Arryn': [
+        'Baelish Castle',
+        'The Redfort',
+    ],
+    'Iron Islands': [
+        'Hammerhorn',
+    ],
+    'The Stormlands': [
+        'Estermont',
+    ],
+    'Dorne': [
+        'Wyl',
+        'Planky Town',
+    ],
+    "King's Landing": [
+        "Littlefinger's brothel",
+        'Dragonpit',
+    ],
+    'Oldtown': [
+        'The Citadel',
+    ],
+    'Meereen': [
+        "Daznak's Pit",
+    ],
+    'House of Black and White': [
+        'Hall of Faces',
+    ],
+    'Dothraki Sea': [
+        'Vaes Dothrak',
+    ],
+}
+
+
+def _get_linked_region_rid(region_index, name):
+    """Return the rid of the region with the given name, or None if several regions have it.
+
+    The missing links are only a best effort to fill in the gaps of the source graph, so a link
+    to a name that has become ambiguous is skipped rather than guessed. A name that no region
+    has at all means the links are out of date, and still raises NameLookupError.
+    """
+    try:
+        return region_index.get_rid(name)
+    except AmbiguousNameError as e:
+        logger.warning(u'Skipping the missing Has_Parent_Region links of a region: %s', e)
+        return None
+
+
+def _load_missing_region_edges(region_index):
+    """Fill in the missing Has_Parent_Region edges."""
+    links = []
+    for parent_rid, children_names in MISSING_PARENT_REGION_CHILD_NAMES.items():
+        links.extend(
+            (_get_linked_region_rid(region_index, x), parent_rid) for x in children_names)
 
-    result = []
-    for parent_rid, child_rids in final_data.items():
-        result.extend((x, parent_rid) for x in child_rids)
+    # Westeros and Essos are missing from the source graph altogether.
+    links.extend((x, WORLD_REGION_RID) for x in (WESTEROS_REGION_RID, ESSOS_REGION_RID))
 
-    for parent_name, children_names in existing_region_links.items():
-        parent_rid = _get_rid_for_name(regions, parent_name)
-        result.extend((_get_rid_for_name(regions, x), parent_rid) for x in children_names)
+    for parent_name, children_names in MISSING_REGION_LINKS.items():
+        parent_rid = _get_linked_region_rid(region_index, parent_name)
+        links.extend(
+            (_get_linked_region_rid(region_index, x), parent_rid) for x in children_names)
 
-    return result
+    return [
+        (child_rid, parent_rid)
+        for child_rid, parent_rid in links
+        if child_rid is not None and parent_rid is not None
+    ]
 
 
-def _load_regions(graph):
+def _load_regions(client, page_size):
     """Load all region data."""
-    raw_regions = _load_vertices_from_query(
-        graph,
-        'SELECT @rid AS rid, name FROM V WHERE @this INSTANCEOF "Region" OR '
-        '@this INSTANCEOF "Settlement"')
+    raw_regions = iterate_query_records(
+        client, 'name', 'V', '@this INSTANCEOF "Region" OR @this INSTANCEOF "Settlement"',
+        page_size)
 
     regions = _fill_in_missing_regions()
-    for key, raw_region in raw_regions.items():
+    for raw_region in raw_regions:
+        key = raw_region['rid'].get_hash()
         potential_suffixes = [
             '(region)',
             '(castle)',
@@ -326,35 +474,29 @@ def _load_regions(graph):
     return regions
 
 
-def _load_vertex_data(graph):
-    """Load and return all relevant vertices from the graph."""
-    characters = _load_characters(graph)
-    houses = _load_houses(graph)
-    regions = _load_regions(graph)
+_EDGE_PROJECTION = 'inV().@rid AS in_rid, outV().@rid AS out_rid'
 
-    return characters, houses, regions
 
+def _load_edges(client, target, condition, page_size, projection=_EDGE_PROJECTION):
+    """Return the set of (out rid, in rid) tuples of the edges selected by the query."""
+    return set(
+        (x['out_rid'].get_hash(), x['in_rid'].get_hash())
+        for x in iterate_query_records(client, projection, target, condition, page_size)
+    )
 
-def _load_edges_from_query(graph, query):
-    """Return edge data from the given query."""
-    return [
-        (x.oRecordData['out_rid'].get_hash(), x.oRecordData['in_rid'].get_hash())
-        for x in graph.client.query(query, -1)
-    ]
 
+def _load_has_seat_edges(client, page_size):
+    """Load all Has_Seat edges."""
+    return _load_edges(client, 'Has_Seat', None, page_size)
 
-def _load_edge_data(graph, regions):
-    """Load and return all relevant edges from the graph."""
-    has_seat = _load_edges_from_query(
-        graph,
-        'SELECT inV().@rid AS in_rid, outV().@rid AS out_rid FROM Has_Seat')
 
+def _load_has_parent_region_edges(client, page_size):
+    """Load the Has_Parent_Region edges present in the existing dataset."""
     # The edges in the existing dataset point from parent to child region / settlement.
     # In the desired dataset, we want the edge to be the other way, so we switch
     # the "in_rid" and "out_rid" names.
-    has_parent_region = _load_edges_from_query(
-        graph, '''
-        SELECT inV().@rid AS out_rid, outV().@rid AS in_rid FROM E WHERE
+    return _load_edges(
+        client, 'E', '''
             (
                 @this INSTANCEOF "Has_Castles" OR
                 @this INSTANCEOF "Has_Cities" OR
@@ -367,18 +509,22 @@ def _load_edge_data(graph, regions):
             ) AND (
                 outV() INSTANCEOF "Region" OR outV() INSTANCEOF "Settlement"
             )
-        ''') + _load_missing_region_edges(regions)
+        ''', page_size, projection='inV().@rid AS out_rid, outV().@rid AS in_rid')
+
 
-    lives_in = _load_edges_from_query(
-        graph, '''
-        SELECT inV().@rid AS in_rid, outV().@rid AS out_rid FROM Has_Place WHERE (
+def _load_lives_in_edges(client, page_size):
+    """Load all Lives_In edges."""
+    return _load_edges(
+        client, 'Has_Place', '''
             (inV() INSTANCEOF "Region" OR inV() INSTANCEOF "Settlement") AND
             outV() INSTANCEOF "Character"
-        )''')
+        ''', page_size)
 
-    owes_allegiance_to = _load_edges_from_query(
-        graph, '''
-        SELECT inV().@rid AS in_rid, outV().@rid AS out_rid FROM Has_Allegiance WHERE (
+
+def _load_owes_allegiance_to_edges(client, page_size):
+    """Load all Owes_Allegiance_To edges."""
+    return _load_edges(
+        client, 'Has_Allegiance', '''
             (
                 inV() INSTANCEOF "Character" OR
                 inV() INSTANCEOF "Noblehouse" OR
@@ -388,23 +534,59 @@ def _load_edge_data(graph, regions):
                 outV() INSTANCEOF "Noblehouse" OR
                 outV() INSTANCEOF "Noble_house"
             )
-        )''')
-
-    return set(has_seat), set(has_parent_region), set(lives_in), set(owes_allegiance_to)
-
-
-def load_all_data(config):
-    """Given OrientDB config pointing to the GamesOfThrones database, return a dict of all data."""
-    graph = _initialize_graph_connection(config)
-    characters, houses, regions = _load_vertex_data(graph)
-    has_seat, has_parent_region, lives_in, owes_allegiance_to = _load_edge_data(graph, regions)
-
-    return {
-        'characters': characters,
-        'houses': houses,
-        'regions': regions,
-        'has_seat': has_seat,
-        'has_parent_region': has_parent_region,
-        'lives_in': lives_in,
-        'owes_allegiance_to': owes_allegiance_to,
+        ''', page_size)
+
+
+# The functions that each load part of the data, by the data key of their results.
+# They are independent of one another, so they are run concurrently.
+_DATA_LOADERS = (
+    ('characters', _load_characters),
+    ('houses', _load_houses),
+    ('regions', _load_regions),
+    ('has_seat', _load_has_seat_edges),
+    ('has_parent_region', _load_has_parent_region_edges),
+    ('lives_in', _load_lives_in_edges),
+    ('owes_allegiance_to', _load_owes_allegiance_to_edges),
+)
+
+
+def _run_data_loader(pool, page_size, loader):
+    """Run the data loading function with a pooled session, and return its result."""
+    # The session is held while the loaded data is cleaned up, which only delays other
+    # loaders if there are more of them than sessions.
+    with pool.connection() as client:
+        return loader(client, page_size)
+
+
+def load_all_data(config, parallelism=4, page_size=DEFAULT_PAGE_SIZE, pool=None):
+    """Given OrientDB config pointing to the GamesOfThrones database, return a dict of all data.
+
+    The data is loaded by running up to "parallelism" queries at the same time, each on its
+    own database session. Each query's results are read page_size records at a time, and
+    each page is cleaned up as soon as it arrives, so that the raw records of at most one
+    page per query are held in memory at once.
+
+    If a pool is given, its sessions are used instead of those of a new pool for the config,
+    and it is left open afterwards.
+    """
+    owns_pool = pool is None
+    if owns_pool:
+        pool = OrientDBConnectionPool(config, size=parallelism)
+    executor = QueryExecutor(parallelism)
+    try:
+        results = executor.map(
+            partial(_run_data_loader, pool, page_size), [loader for _, loader in _DATA_LOADERS])
+    finally:
+        executor.close()
+        if owns_pool:
+            pool.close()
+
+    data = {
+        key: result
+        for (key, _), result in zip(_DATA_LOADERS, results)
     }
+    # Each vertex type's names are indexed once, for all the edges wired up by name.
+    region_index = NameIndex(data['regions'], 'region')
+    data['has_parent_region'].update(_load_missing_region_edges(region_index))
+
+    return data
@@ -3,16 +3,47 @@ CREATE CLASS CharacterOrHouse EXTENDS V ABSTRACT
 CREATE PROPERTY CharacterOrHouse.name String
 CREATE PROPERTY CharacterOrHouse.alias EmbeddedList String
 CREATE PROPERTY CharacterOrHouse.uuid String
+CREATE PROPERTY CharacterOrHouse.degree_out_Owes_Allegiance_To Integer
+CREATE PROPERTY CharacterOrHouse.degree_in_Owes_Allegiance_To Integer
 
 CREATE CLASS Character EXTENDS CharacterOrHouse
+CREATE PROPERTY Character.degree_out_Lives_In Integer
 
 CREATE CLASS NobleHouse EXTENDS CharacterOrHouse
 CREATE PROPERTY NobleHouse.motto EmbeddedList String
+CREATE PROPERTY NobleHouse.degree_out_Has_Seat Integer
 
 CREATE CLASS Region EXTENDS V
 CREATE PROPERTY Region.name String
 CREATE PROPERTY Region.alias EmbeddedList String
 CREATE PROPERTY Region.uuid String
+CREATE PROPERTY Region.degree_out_Has_Parent_Region Integer
+CREATE PROPERTY Region.degree_in_Has_Parent_Region Integer
+CREATE PROPERTY Region.degree_out_Has_Ancestor_Region Integer
+CREATE PROPERTY Region.degree_in_Has_Ancestor_Region Integer
+CREATE PROPERTY Region.degree_in_Has_Seat Integer
+CREATE PROPERTY Region.degree_in_Lives_In Integer
+
+CREATE INDEX CharacterOrHouse.uuid UNIQUE_HASH_INDEX
+CREATE INDEX CharacterOrHouse.name NOTUNIQUE
+CREATE INDEX CharacterOrHouse.alias NOTUNIQUE
+
+CREATE INDEX Region.uuid UNIQUE_HASH_INDEX
+CREATE INDEX Region.name NOTUNIQUE
+CREATE INDEX Region.alias NOTUNIQUE
+
+# Each degree property counts the vertex's edges of one class in one direction, so that
+# filtering on the number of edges does not need to traverse them.
+CREATE INDEX CharacterOrHouse.degree_out_Owes_Allegiance_To NOTUNIQUE
+CREATE INDEX CharacterOrHouse.degree_in_Owes_Allegiance_To NOTUNIQUE
+CREATE INDEX Character.degree_out_Lives_In NOTUNIQUE
+CREATE INDEX NobleHouse.degree_out_Has_Seat NOTUNIQUE
+CREATE INDEX Region.degree_out_Has_Parent_Region NOTUNIQUE
+CREATE INDEX Region.degree_in_Has_Parent_Region NOTUNIQUE
+CREATE INDEX Region.degree_out_Has_Ancestor_Region NOTUNIQUE
+CREATE INDEX Region.degree_in_Has_Ancestor_Region NOTUNIQUE
+CREATE INDEX Region.degree_in_Has_Seat NOTUNIQUE
+CREATE INDEX Region.degree_in_Lives_In NOTUNIQUE
 
 CREATE CLASS Owes_Allegiance_To EXTENDS E
 CREATE PROPERTY Owes_Allegiance_To.out Link CharacterOrHouse
@@ -29,3 +60,13 @@ CREATE PROPERTY Lives_In.in Link Region
 CREATE CLASS Has_Parent_Region EXTENDS E
 CREATE PROPERTY Has_Parent_Region.out Link Region
 CREATE PROPERTY Has_Parent_Region.in Link Region
+
+# Connects each region to itself and to all regions reachable through Has_Parent_Region edges.
+CREATE CLASS Has_Ancestor_Region EXTENDS E
+CREATE PROPERTY Has_Ancestor_Region.out Link Region
+CREATE PROPERTY Has_Ancestor_Region.in Link Region
+
+CREATE CLASS DatasetInfo
+CREATE PROPERTY DatasetInfo.fingerprint String
+CREATE PROPERTY DatasetInfo.schema_fingerprint String
+CREATE PROPERTY DatasetInfo.region_hierarchy_depth Integer
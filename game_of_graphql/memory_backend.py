@@ -0,0 +1,476 @@
+# Copyright 2017 Kensho Technologies, Inc.
+"""Execute GraphQL queries directly against an in-memory copy of the Game of GraphQL graph."""
+from collections import namedtuple
+import time
+
+from graphql import parse
+from graphql.language.ast import InlineFragment
+import six
+
+from game_of_graphql.new_dataset import (EDGE_CLASS_BY_DATA_KEY, REGION_ANCESTRY_EDGE_CLASS,
+                                         compute_region_ancestry, get_vertex_records)
+from game_of_graphql.query_cache import LRUCache
+
+
+# The GraphQL types that the vertices of each vertex class belong to.
+VERTEX_CLASS_TYPES = {
+    'Character': frozenset({'Character', 'CharacterOrHouse'}),
+    'NobleHouse': frozenset({'NobleHouse', 'CharacterOrHouse'}),
+    'Region': frozenset({'Region'}),
+}
+
+COUNT_FIELD_NAME = '_x_count'
+TYPENAME_FIELD_NAME = '__typename'
+
+_OUTBOUND = 'out'
+_INBOUND = 'in'
+
+
+class UnsupportedQueryError(ValueError):
+    """Raised when a query uses a GraphQL feature that the in-memory engine does not support."""
+
+
+class QueryDeadlineError(RuntimeError):
+    """Raised when a query is still executing once its deadline has passed."""
+
+
+_Vertex = namedtuple('_Vertex', ('class_name', 'properties'))
+
+# Plan of the query, built once from its GraphQL AST and reused for every execution.
+_Filter = namedtuple('_Filter', ('op_name', 'arguments'))
+_PropertyField = namedtuple('_PropertyField', ('name', 'out_name', 'tag_name', 'filters'))
+_Scope = namedtuple('_Scope', ('type_name', 'filters', 'property_fields', 'traversals'))
+_Traversal = namedtuple('_Traversal', (
+    'direction', 'edge_class', 'degree_filters', 'optional', 'fold', 'recurse_depth', 'scope',
+    'out_names', 'tag_names', 'count_field',
+))
+
+# Value of a tag defined in an @optional scope whose edge did not exist.
+# Filters that refer to such a tag let all values through, just like compiled queries do.
+_MISSING = object()
+
+
+def _get_argument_values(directive):
+    """Return a dict of argument name -> Python value for the arguments of the directive."""
+    result = {}
+    for argument in directive.arguments:
+        value = argument.value
+        if hasattr(value, 'values'):
+            result[argument.name.value] = [x.value for x in value.values]
+        else:
+            result[argument.name.value] = value.value
+    return result
+
+
+def _get_directives(ast):
+    """Return a dict of directive name -> list of directive argument dicts on the AST node."""
+    result = {}
+    for directive in ast.directives or ():
+        result.setdefault(directive.name.value, []).append(_get_argument_values(directive))
+    return result
+
+
+def _get_filters(directives):
+    """Return the list of _Filter objects described by the directives."""
+    return [
+        _Filter(arguments['op_name'], tuple(arguments['value']))
+        for arguments in directives.get('filter', [])
+    ]
+
+
+def _get_single_directive_argument(directives, directive_name, argument_name):
+    """Return the argument of the directive if it is present exactly once, or None otherwise."""
+    matches = directives.get(directive_name, [])
+    return matches[0][argument_name] if matches else None
+
+
+def _split_vertex_field_name(field_name):
+    """Return the (direction, edge class) tuple for the vertex field, or None if not one."""
+    for direction in (_OUTBOUND, _INBOUND):
+        prefix = direction + '_'
+        if field_name.startswith(prefix):
+            return direction, field_name[len(prefix):]
+    return None
+
+
+def _build_scope(type_name, directives, selection_set):
+    """Return the _Scope for a vertex with the given type, directives and selections."""
+    filters = _get_filters(directives)
+    selections = list(selection_set.selections) if selection_set else []
+    if len(selections) == 1 and isinstance(selections[0], InlineFragment):
+        coercion = selections[0]
+        type_name = coercion.type_condition.name.value
+        filters.extend(_get_filters(_get_directives(coercion)))
+        selections = list(coercion.selection_set.selections)
+
+    property_fields = []
+    traversals = []
+    for selection in selections:
+        if isinstance(selection, InlineFragment):
+            raise UnsupportedQueryError(u'Type coercions must be the only selection of '
+                                        u'their scope: {}'.format(selection))
+
+        field_name = selection.name.value
+        field_directives = _get_directives(selection)
+        edge = _split_vertex_field_name(field_name)
+        if edge is None:
+            property_fields.append(_PropertyField(
+                field_name,
+                _get_single_directive_argument(field_directives, 'output', 'out_name'),
+                _get_single_directive_argument(field_directives, 'tag', 'tag_name'),
+                _get_filters(field_directives)))
+        else:
+            traversals.append(_build_traversal(edge, field_directives, selection.selection_set))
+
+    return _Scope(type_name, filters, property_fields, traversals)
+
+
+def _iterate_scopes(scope):
+    """Yield the scope and all scopes nested within it."""
+    yield scope
+    for traversal in scope.traversals:
+        for nested_scope in _iterate_scopes(traversal.scope):
+            yield nested_scope
+
+
+def _build_traversal(edge, directives, selection_set):
+    """Return the _Traversal for a vertex field with the given edge, directives and selections."""
+    direction, edge_class = edge
+
+    # Edge degree filters are checked against the vertex the edge starts at,
+    # while all other filters on the vertex field apply to the vertex the edge leads to.
+    degree_filters = []
+    vertex_directives = dict(directives)
+    vertex_directives['filter'] = []
+    for filter_arguments in directives.get('filter', []):
+        if filter_arguments['op_name'] == 'has_edge_degree':
+            degree_filters.append(_Filter('has_edge_degree', tuple(filter_arguments['value'])))
+        else:
+            vertex_directives['filter'].append(filter_arguments)
+
+    # Only the vertex field's selections determine the type of the destination vertex,
+    # so the scope is created untyped and checked only if a type coercion is present.
+    scope = _build_scope(None, vertex_directives, selection_set)
+
+    out_names = []
+    tag_names = []
+    count_field = None
+    for nested_scope in _iterate_scopes(scope):
+        for property_field in nested_scope.property_fields:
+            if property_field.out_name is not None:
+                out_names.append(property_field.out_name)
+            if property_field.tag_name is not None:
+                tag_names.append(property_field.tag_name)
+            if property_field.name == COUNT_FIELD_NAME:
+                count_field = property_field
+
+    return _Traversal(
+        direction=direction,
+        edge_class=edge_class,
+        degree_filters=degree_filters,
+        optional='optional' in directives,
+        fold='fold' in directives,
+        recurse_depth=_get_single_directive_argument(directives, 'recurse', 'depth'),
+        scope=scope,
+        out_names=out_names,
+        tag_names=tag_names,
+        count_field=count_field,
+    )
+
+
+def build_query_plan(query):
+    """Return the plan used to execute the given GraphQL query against an InMemoryGraph.
+
+    The query is expected to already have been validated against the schema,
+    for example by compiling it with the GraphQL compiler.
+    """
+    document = parse(query)
+    if len(document.definitions) != 1:
+        raise UnsupportedQueryError(u'Expected exactly one query definition: {}'.format(query))
+
+    selections = document.definitions[0].selection_set.selections
+    if len(selections) != 1:
+        raise UnsupportedQueryError(u'Expected exactly one root vertex: {}'.format(query))
+
+    root = selections[0]
+    return _build_scope(root.name.value, _get_directives(root), root.selection_set)
+
+
+def _resolve_argument(argument, args, tags):
+    """Return the value of the filter argument, looking up runtime arguments and tags."""
+    if argument.startswith('$'):
+        return args[argument[1:]]
+    elif argument.startswith('%'):
+        return tags[argument[1:]]
+    else:
+        raise UnsupportedQueryError(u'Unrecognized filter argument: {}'.format(argument))
+
+
+def _matches_property_filter(op_name, value, parameters):
+    """Return True if the property value satisfies the filter with the given parameters."""
+    if op_name == 'has_substring':
+        return value is not None and parameters[0] in value
+    elif op_name == 'contains':
+        return value is not None and parameters[0] in value
+    elif op_name == 'intersects':
+        return value is not None and bool(set(value) & set(parameters[0]))
+    elif op_name == 'in_collection':
+        return value in parameters[0]
+    elif op_name == '=':
+        return value == parameters[0]
+    elif op_name == '!=':
+        return value != parameters[0]
+
+    # Ordering comparisons with null are never true, like in the database.
+    if value is None or any(parameter is None for parameter in parameters):
+        return False
+    elif op_name == 'between':
+        return parameters[0] <= value <= parameters[1]
+    elif op_name == '>':
+        return value > parameters[0]
+    elif op_name == '>=':
+        return value >= parameters[0]
+    elif op_name == '<':
+        return value < parameters[0]
+    elif op_name == '<=':
+        return value <= parameters[0]
+    else:
+        raise UnsupportedQueryError(u'Unsupported filter operation: {}'.format(op_name))
+
+
+def _matches_property_filters(value, filters, args, tags):
+    """Return True if the property value satisfies all the given filters."""
+    for query_filter in filters:
+        parameters = [
+            _resolve_argument(argument, args, tags)
+            for argument in query_filter.arguments
+        ]
+        if any(parameter is _MISSING for parameter in parameters):
+            continue
+        if not _matches_property_filter(query_filter.op_name, value, parameters):
+            return False
+    return True
+
+
+def _matches_vertex_filter(vertex, query_filter, args, tags):
+    """Return True if the vertex satisfies the filter applied to the vertex itself."""
+    if query_filter.op_name != 'name_or_alias':
+        raise UnsupportedQueryError(u'Unsupported filter operation on a vertex field: '
+                                    u'{}'.format(query_filter.op_name))
+
+    name = _resolve_argument(query_filter.arguments[0], args, tags)
+    return name == vertex.properties['name'] or name in vertex.properties['alias']
+
+
+def _check_deadline(deadline):
+    """Raise QueryDeadlineError if the deadline, a time.time() value or None, has passed."""
+    if deadline is not None and time.time() > deadline:
+        raise QueryDeadlineError(u'The query did not finish before its deadline.')
+
+
+def _get_property(vertex, field_name):
+    """Return the value of the vertex's property field."""
+    if field_name == TYPENAME_FIELD_NAME:
+        return vertex.class_name
+    return vertex.properties.get(field_name)
+
+
+class InMemoryGraph(object):
+    """The Game of GraphQL graph, held in memory and indexed for executing queries against it."""
+
+    def __init__(self, data, query_plan_cache_size=256):
+        """Build the graph from the data returned by existing_dataset.load_all_data().
+
+        The graph contains exactly the vertices and edges that
+        new_dataset.create_game_of_graphql_graph() would create from the same data.
+        """
+        self._vertices = {}  # old rid -> _Vertex
+        self._rids_by_type = {}  # GraphQL type name -> sorted list of old rids
+        self._rids_by_name = {}  # name or alias -> list of old rids
+        for class_name, _, vertices in get_vertex_records(data):
+            for rid, properties in vertices:
+                self._vertices[rid] = _Vertex(class_name, properties)
+                for type_name in VERTEX_CLASS_TYPES[class_name]:
+                    self._rids_by_type.setdefault(type_name, []).append(rid)
+                for name in set([properties['name']] + properties['alias']):
+                    self._rids_by_name.setdefault(name, []).append(rid)
+
+        for rids in six.itervalues(self._rids_by_type):
+            rids.sort()
+
+        # Neighbors are kept sorted, so that queries produce their results in a stable order.
+        edges_by_class = {
+            edge_class: data[key]
+            for key, edge_class in six.iteritems(EDGE_CLASS_BY_DATA_KEY)
+        }
+        edges_by_class[REGION_ANCESTRY_EDGE_CLASS], _ = compute_region_ancestry(data)
+
+        self._neighbors = {}  # (direction, edge class) -> dict of old rid -> list of old rids
+        for edge_class, edges in six.iteritems(edges_by_class):
+            outbound = {}
+            inbound = {}
+            for source_rid, destination_rid in edges:
+                if source_rid in self._vertices and destination_rid in self._vertices:
+                    outbound.setdefault(source_rid, []).append(destination_rid)
+                    inbound.setdefault(destination_rid, []).append(source_rid)
+
+            for neighbors in (outbound, inbound):
+                for rids in six.itervalues(neighbors):
+                    rids.sort()
+            self._neighbors[(_OUTBOUND, edge_class)] = outbound
+            self._neighbors[(_INBOUND, edge_class)] = inbound
+
+        self._query_plans = LRUCache(query_plan_cache_size)
+
+    def execute(self, query, args, deadline=None):
+        """Yield the result rows of the GraphQL query with the given arguments.
+
+        Args:
+            query: str, GraphQL query, already validated against the schema
+            args: dict, argument name -> argument value
+            deadline: optional float, the time.time() value after which the query is aborted
+                      by raising QueryDeadlineError. The deadline is checked throughout
+                      the traversal of the graph, not just between result rows.
+
+        Yields:
+            dict, output name -> value, for each result row, in the same form as the rows
+            produced by running the compiled query against OrientDB
+        """
+        plan = self._query_plans.get(query)
+        if plan is None:
+            plan = build_query_plan(query)
+            self._query_plans.put(query, plan)
+
+        for rid in self._get_root_rids(plan, args):
+            for row, _ in self._evaluate_scope(rid, plan, args, {}, deadline):
+                yield row
+
+    def _get_root_rids(self, plan, args):
+        """Return the rids of the vertices at which the query starts."""
+        for query_filter in plan.filters:
+            if query_filter.op_name == 'name_or_alias':
+                name = _resolve_argument(query_filter.arguments[0], args, {})
+                return self._rids_by_name.get(name, [])
+        return self._rids_by_type.get(plan.type_name, [])
+
+    def _get_neighbors(self, rid, traversal, deadline):
+        """Return the rids of the vertices reached from the given one by the traversal."""
+        neighbors = self._neighbors[(traversal.direction, traversal.edge_class)]
+        if traversal.recurse_depth is None:
+            return neighbors.get(rid, [])
+
+        # Recursion includes the starting vertex, and reaches each vertex only once.
+        result = [rid]
+        visited = {rid}
+        frontier = [rid]
+        for _ in six.moves.xrange(int(traversal.recurse_depth)):
+            next_frontier = []
+            for current_rid in frontier:
+                _check_deadline(deadline)
+                for neighbor_rid in neighbors.get(current_rid, []):
+                    if neighbor_rid not in visited:
+                        visited.add(neighbor_rid)
+                        next_frontier.append(neighbor_rid)
+            result.extend(next_frontier)
+            frontier = next_frontier
+        return result
+
+    def _evaluate_scope(self, rid, scope, args, tags, deadline):
+        """Return the (row, tags) tuples produced by the scope at the given vertex.
+
+        Args:
+            rid: str, old rid of the vertex
+            scope: _Scope, the part of the query plan to evaluate at the vertex
+            args: dict, argument name -> argument value
+            tags: dict, tag name -> tagged value, for all tags defined so far
+            deadline: optional float, the time.time() value after which to give up
+
+        Returns:
+            list of (dict of output name -> value, dict of tag name -> value) tuples,
+            one for each result row produced by the scope and the scopes nested within it
+        """
+        _check_deadline(deadline)
+        vertex = self._vertices[rid]
+        if scope.type_name is not None and (
+                scope.type_name not in VERTEX_CLASS_TYPES[vertex.class_name]):
+            return []
+
+        for query_filter in scope.filters:
+            if not _matches_vertex_filter(vertex, query_filter, args, tags):
+                return []
+
+        # Tags may be used by filters within the same scope, so they are recorded first.
+        property_fields = [
+            property_field
+            for property_field in scope.property_fields
+            if property_field.name != COUNT_FIELD_NAME
+        ]
+        tags = dict(tags)
+        for property_field in property_fields:
+            if property_field.tag_name is not None:
+                tags[property_field.tag_name] = _get_property(vertex, property_field.name)
+
+        row = {}
+        for property_field in property_fields:
+            value = _get_property(vertex, property_field.name)
+            if not _matches_property_filters(value, property_field.filters, args, tags):
+                return []
+            if property_field.out_name is not None:
+                row[property_field.out_name] = value
+
+        results = [(row, tags)]
+        for traversal in scope.traversals:
+            results = [
+                expanded_result
+                for result in results
+                for expanded_result in self._evaluate_traversal(
+                    rid, traversal, result, args, deadline)
+            ]
+        return results
+
+    def _evaluate_traversal(self, rid, traversal, result, args, deadline):
+        """Return the (row, tags) tuples produced by extending the result with the traversal."""
+        row, tags = result
+        neighbor_rids = self._get_neighbors(rid, traversal, deadline)
+
+        for query_filter in traversal.degree_filters:
+            degree = _resolve_argument(query_filter.arguments[0], args, tags)
+            if len(neighbor_rids) != degree:
+                return []
+
+        if traversal.fold:
+            # Folded results are aggregated into lists, and may not be used outside the fold.
+            fold_rows = [
+                fold_row
+                for neighbor_rid in neighbor_rids
+                for fold_row, _ in self._evaluate_scope(
+                    neighbor_rid, traversal.scope, args, tags, deadline)
+            ]
+            count_field = traversal.count_field
+            if count_field is not None:
+                if not _matches_property_filters(len(fold_rows), count_field.filters, args, tags):
+                    return []
+
+            row = dict(row)
+            for out_name in traversal.out_names:
+                if count_field is not None and out_name == count_field.out_name:
+                    row[out_name] = len(fold_rows)
+                else:
+                    row[out_name] = [fold_row[out_name] for fold_row in fold_rows]
+            return [(row, tags)]
+
+        if traversal.optional and not neighbor_rids:
+            row = dict(row)
+            row.update((out_name, None) for out_name in traversal.out_names)
+            tags = dict(tags)
+            tags.update((tag_name, _MISSING) for tag_name in traversal.tag_names)
+            return [(row, tags)]
+
+        expanded_results = []
+        for neighbor_rid in neighbor_rids:
+            for child_row, child_tags in self._evaluate_scope(
+                    neighbor_rid, traversal.scope, args, tags, deadline):
+                expanded_row = dict(row)
+                expanded_row.update(child_row)
+                expanded_results.append((expanded_row, child_tags))
+        return expanded_results
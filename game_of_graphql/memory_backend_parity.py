@@ -0,0 +1,93 @@
+# Copyright 2017 Kensho Technologies, Inc.
+"""Check that the in-memory engine returns the same results as OrientDB for the Demo queries."""
+import json
+
+import click
+from pyorient.ogm import Config
+import six
+
+from game_of_graphql import tools
+from game_of_graphql.connection_pool import OrientDBConnectionPool
+from game_of_graphql.demo_queries import DEMO_QUERIES
+from game_of_graphql.memory_backend import InMemoryGraph
+from game_of_graphql.new_dataset import get_stored_dataset_fingerprint
+from game_of_graphql.query_cache import bind_arguments, compile_query
+from game_of_graphql.server import schema
+
+
+def _canonicalize_value(value):
+    """Return the value as a JSON-serializable object, with the order of list items ignored."""
+    if isinstance(value, list):
+        # Neither engine guarantees the order of folded results,
+        # so lists are compared as multisets of their items.
+        return sorted((_canonicalize_value(x) for x in value), key=json.dumps)
+    return value
+
+
+def canonicalize_rows(rows):
+    """Return the result rows in a canonical form, which is the same for equivalent results."""
+    return sorted(
+        json.dumps({
+            key: _canonicalize_value(value)
+            for key, value in six.iteritems(row)
+        }, sort_keys=True)
+        for row in rows
+    )
+
+
+def compare_demo_queries(client, memory_graph):
+    """Run each Demo query in both OrientDB and the in-memory graph, and compare their results.
+
+    Returns:
+        dict, Demo query name -> dict with the number of result rows of each engine,
+        and whether their results match
+    """
+    report = {}
+    for demo_query in DEMO_QUERIES:
+        bound_query = bind_arguments(compile_query(schema, demo_query.query), demo_query.args)
+        orientdb_rows = canonicalize_rows(
+            x.oRecordData for x in client.command(bound_query.match_query))
+        memory_rows = canonicalize_rows(memory_graph.execute(demo_query.query, demo_query.args))
+
+        report[demo_query.name] = {
+            'orientdb_rows': len(orientdb_rows),
+            'memory_rows': len(memory_rows),
+            'match': orientdb_rows == memory_rows,
+        }
+
+    return report
+
+
+@click.command()
+@click.option('--graph-location', type=str, default='127.0.0.1:2424',
+              help='OrientDB host and port')
+@click.option('--graph-user', type=str, default='root',
+              help='OrientDB username')
+@click.option('--graph-password', type=str, default='root',
+              help='OrientDB password')
+def run(graph_location, graph_user, graph_password):
+    """Print the comparison of both engines' results as JSON, failing if any differ."""
+    config = Config.from_url(
+        'plocal://{}/game_of_graphql'.format(graph_location), graph_user, graph_password)
+
+    data, fingerprint = tools.load_game_of_graphql_data(
+        graph_location, graph_user, graph_password)
+    if get_stored_dataset_fingerprint(config) != fingerprint:
+        raise click.ClickException(u'The game_of_graphql database is not up to date with the '
+                                   u'GamesOfThrones data. Start the server to rebuild it.')
+
+    memory_graph = InMemoryGraph(data)
+    pool = OrientDBConnectionPool(config, size=1)
+    with pool.connection() as client:
+        report = compare_demo_queries(client, memory_graph)
+    pool.close()
+
+    click.echo(json.dumps(report, indent=4, sort_keys=True))
+    mismatches = sorted(name for name, result in six.iteritems(report) if not result['match'])
+    if mismatches:
+        raise click.ClickException(u'The in-memory engine\'s results differ from OrientDB\'s '
+                                   u'for: {}'.format(u', '.join(mismatches)))
+
+
+if __name__ == '__main__':
+    run()
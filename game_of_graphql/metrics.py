@@ -0,0 +1,187 @@
+# Copyright 2017 Kensho Technologies, Inc.
+"""Latency measurements, and their export in the Prometheus text format."""
+from bisect import bisect_left
+from collections import OrderedDict
+from contextlib import contextmanager
+import threading
+import time
+
+import six
+
+
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class PhaseTimer(object):
+    """Accumulate the time spent in each named phase of handling a single request."""
+
+    def __init__(self):
+        """Create a timer with no recorded phases."""
+        self.durations = OrderedDict()  # phase name -> seconds, in the order first recorded
+
+    def record(self, phase_name, seconds):
+        """Add the given number of seconds to the time spent in the named phase."""
+        self.durations[phase_name] = self.durations.get(phase_name, 0.0) + seconds
+
+    @contextmanager
+    def phase(self, phase_name):
+        """Record the time spent in the "with" block as time spent in the named phase."""
+        start_time = time.time()
+        try:
+            yield
+        finally:
+            self.record(phase_name, time.time() - start_time)
+
+    def as_milliseconds(self):
+        """Return a dict of phase name -> milliseconds spent in that phase."""
+        return OrderedDict(
+            (phase_name, round(seconds * 1000.0, 3))
+            for phase_name, seconds in six.iteritems(self.durations)
+        )
+
+
+def _escape_label_value(value):
+    """Escape the label value for use in the Prometheus text format."""
+    return six.text_type(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(label_names, label_values, extra_labels=()):
+    """Return the Prometheus text format representation of the given labels."""
+    pairs = list(zip(label_names, label_values)) + list(extra_labels)
+    if not pairs:
+        return ''
+    return u'{{{}}}'.format(u','.join(
+        u'{}="{}"'.format(name, _escape_label_value(value))
+        for name, value in pairs
+    ))
+
+
+def _format_number(value):
+    """Return the Prometheus text format representation of the given number."""
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram(object):
+    """A thread-safe histogram of observed values, split up by a fixed set of labels."""
+
+    def __init__(self, name, documentation, label_names, buckets=DEFAULT_BUCKETS):
+        """Create an empty histogram.
+
+        Args:
+            name: str, the metric name
+            documentation: str, the help text describing the metric
+            label_names: tuple of str, the names of the labels that each observation has
+            buckets: sorted tuple of float, the upper bounds of the histogram's buckets.
+                     A bucket for all values is always added after them.
+        """
+        self.name = name
+        self.documentation = documentation
+        self._label_names = tuple(label_names)
+        self._bounds = tuple(buckets) + (float('inf'),)
+        self._lock = threading.Lock()
+        self._series = {}  # label values tuple -> [per-bucket counts list, sum, count]
+
+    def observe(self, value, *label_values):
+        """Record an observation of the given value, with the given label values."""
+        if len(label_values) != len(self._label_names):
+            raise AssertionError(u'Expected values for labels {}, got: '
+                                 u'{}'.format(self._label_names, label_values))
+
+        bucket_index = bisect_left(self._bounds, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = [[0] * len(self._bounds), 0.0, 0]
+                self._series[label_values] = series
+
+            series[0][bucket_index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        """Return the list of lines representing the histogram in the Prometheus text format."""
+        lines = [
+            u'# HELP {} {}'.format(self.name, self.documentation),
+            u'# TYPE {} histogram'.format(self.name),
+        ]
+        with self._lock:
+            series_items = sorted(
+                (label_values, (list(counts), total, count))
+                for label_values, (counts, total, count) in six.iteritems(self._series)
+            )
+
+        for label_values, (counts, total, count) in series_items:
+            cumulative_count = 0
+            for bound, bucket_count in zip(self._bounds, counts):
+                cumulative_count += bucket_count
+                labels = _format_labels(self._label_names, label_values,
+                                        [('le', _format_number(bound))])
+                lines.append(u'{}_bucket{} {}'.format(self.name, labels, cumulative_count))
+
+            labels = _format_labels(self._label_names, label_values)
+            lines.append(u'{}_sum{} {}'.format(self.name, labels, _format_number(total)))
+            lines.append(u'{}_count{} {}'.format(self.name, labels, count))
+
+        return lines
+
+
+def render_samples(name, metric_type, documentation, samples):
+    """Return the Prometheus text format lines for a metric with the given samples.
+
+    Args:
+        name: str, the metric name
+        metric_type: str, "counter" or "gauge"
+        documentation: str, the help text describing the metric
+        samples: list of (dict of label name -> label value, number) tuples
+
+    Returns:
+        list of str, the lines representing the metric
+    """
+    lines = [
+        u'# HELP {} {}'.format(name, documentation),
+        u'# TYPE {} {}'.format(name, metric_type),
+    ]
+    for labels, value in samples:
+        label_names = sorted(labels)
+        lines.append(u'{}{} {}'.format(
+            name, _format_labels(label_names, [labels[x] for x in label_names]),
+            _format_number(value)))
+    return lines
+
+
+class MetricsRegistry(object):
+    """A collection of metrics that can be rendered together in the Prometheus text format."""
+
+    def __init__(self):
+        """Create an empty registry."""
+        self._histograms = []
+        self._collectors = []
+
+    def histogram(self, name, documentation, label_names, buckets=DEFAULT_BUCKETS):
+        """Create a histogram, register it, and return it."""
+        result = Histogram(name, documentation, label_names, buckets=buckets)
+        self._histograms.append(result)
+        return result
+
+    def add_collector(self, collector):
+        """Register a function that takes no arguments and returns a list of metric lines.
+
+        Collectors are called every time the metrics are rendered, and are meant for values
+        that are more easily read out of other objects than tracked separately.
+        """
+        self._collectors.append(collector)
+
+    def render(self):
+        """Return all registered metrics in the Prometheus text format."""
+        lines = []
+        for histogram in self._histograms:
+            lines.extend(histogram.render())
+        for collector in self._collectors:
+            lines.extend(collector())
+        return u'\n'.join(lines) + u'\n'
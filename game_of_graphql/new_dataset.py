@@ -1,11 +1,88 @@
 # Copyright 2017 Kensho Technologies, Inc.
 """Create the GraphQL-compatible dataset from the existing dataset."""
+from collections import namedtuple
 from copy import deepcopy
+import hashlib
+import json
+import logging
 from os import path
-from uuid import uuid4
+import re
+import time
+from uuid import UUID, uuid5
 
+from pyorient import OrientDB, PyOrientException
 from pyorient.ogm import Graph
 from pyorient.ogm.declarative import declarative_node, declarative_relationship
+import six
+
+from game_of_graphql.existing_dataset import DEFAULT_PAGE_SIZE, iterate_query_records
+
+
+# Bump this whenever the way the graph is built from the data changes, so that graphs built
+# by older versions of this code are not mistaken for up-to-date ones.
+DATASET_FORMAT_VERSION = 4
+
+SCHEMA_FILE = path.join(path.dirname(__file__), 'game_of_graphql.sql')
+
+# Fingerprints are SHA-256 hex digests, see compute_dataset_fingerprint().
+_FINGERPRINT_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+# The keys of the loaded data that hold edges, and the edge classes they are created as.
+EDGE_CLASS_BY_DATA_KEY = {
+    'has_seat': 'Has_Seat',
+    'has_parent_region': 'Has_Parent_Region',
+    'lives_in': 'Lives_In',
+    'owes_allegiance_to': 'Owes_Allegiance_To',
+}
+
+# The edge class connecting each region to itself and all of its ancestor regions.
+REGION_ANCESTRY_EDGE_CLASS = 'Has_Ancestor_Region'
+
+# The (direction, edge class) pairs whose edges are counted on each vertex of each vertex class.
+DEGREES_BY_CLASS = {
+    'Character': (
+        ('out', 'Owes_Allegiance_To'),
+        ('in', 'Owes_Allegiance_To'),
+        ('out', 'Lives_In'),
+    ),
+    'NobleHouse': (
+        ('out', 'Owes_Allegiance_To'),
+        ('in', 'Owes_Allegiance_To'),
+        ('out', 'Has_Seat'),
+    ),
+    'Region': (
+        ('out', 'Has_Parent_Region'),
+        ('in', 'Has_Parent_Region'),
+        ('out', REGION_ANCESTRY_EDGE_CLASS),
+        ('in', REGION_ANCESTRY_EDGE_CLASS),
+        ('in', 'Has_Seat'),
+        ('in', 'Lives_In'),
+    ),
+}
+
+
+def get_degree_property_name(direction, edge_class):
+    """Return the name of the vertex property holding the number of the vertex's edges."""
+    return u'degree_{}_{}'.format(direction, edge_class)
+
+
+# The vertex properties of each vertex class, other than "uuid".
+VERTEX_PROPERTIES_BY_CLASS = {
+    class_name: property_names + tuple(
+        get_degree_property_name(direction, edge_class)
+        for direction, edge_class in DEGREES_BY_CLASS[class_name]
+    )
+    for class_name, property_names in (
+        ('Character', ('name', 'alias')),
+        ('NobleHouse', ('name', 'alias', 'motto')),
+        ('Region', ('name', 'alias')),
+    )
+}
+
+# The namespace of the uuids derived from the vertices' rids in the existing dataset.
+VERTEX_UUID_NAMESPACE = UUID('5d0b3a4e-8a0c-4a3f-9d4e-3b1f0c6e2a71')
+
+logger = logging.getLogger(__name__)
 
 
 def _initialize_graph_connection(config, initial_drop=False):
@@ -20,65 +97,578 @@ def _initialize_graph_connection(config, initial_drop=False):
     return graph
 
 
-def _apply_game_of_graphql_schema(client):
-    """Apply the SQL commands necessary to create the Game of GraphQL schema."""
-    schema_file = path.join(path.dirname(__file__), 'game_of_graphql.sql')
-
-    with open(schema_file) as f:
+def read_schema_commands():
+    """Return the list of SQL commands necessary to create the Game of GraphQL schema."""
+    commands = []
+    with open(SCHEMA_FILE) as f:
         for line in f:
             line = line.strip()
             if line and not line.startswith('#'):
-                client.command(line)
+                commands.append(line)
+    return commands
 
 
-def _make_edges(graph_cls_broker, old_to_new_rid, rid_to_vertex, data):
-    """Create all edges specified in the data on the given graph class broker."""
-    for source_rid, destination_rid in data:
-        if source_rid not in old_to_new_rid or destination_rid not in old_to_new_rid:
-            continue
+def _apply_game_of_graphql_schema(client):
+    """Apply the SQL commands necessary to create the Game of GraphQL schema."""
+    for command in read_schema_commands():
+        client.command(command)
+
+
+def compute_schema_fingerprint():
+    """Return a string that changes whenever the graph's schema or the way it is built change."""
+    fingerprint = hashlib.sha256()
+    fingerprint.update(u'{}\n'.format(DATASET_FORMAT_VERSION).encode('utf-8'))
+    with open(SCHEMA_FILE, 'rb') as f:
+        fingerprint.update(f.read())
+    return fingerprint.hexdigest()
+
+
+def compute_dataset_fingerprint(data):
+    """Return a string that changes whenever the data or the schema of the graph change."""
+    canonical_data = {
+        key: sorted(value) if isinstance(value, set) else value
+        for key, value in six.iteritems(data)
+    }
+
+    fingerprint = hashlib.sha256()
+    fingerprint.update(u'{}\n'.format(compute_schema_fingerprint()).encode('utf-8'))
+    fingerprint.update(json.dumps(canonical_data, sort_keys=True).encode('utf-8'))
+    return fingerprint.hexdigest()
+
+
+def read_dataset_info(client):
+    """Return the dict of dataset info recorded in the open database, or None if missing.
+
+    The dict has the "fingerprint" of the data and the "schema_fingerprint" of the schema that
+    the graph was built from, and the "region_hierarchy_depth" of the data, as returned by
+    compute_region_ancestry(). Any of them may be None if not recorded.
+    """
+    try:
+        records = client.query(
+            'SELECT fingerprint, schema_fingerprint, region_hierarchy_depth FROM DatasetInfo', 1)
+    except PyOrientException:
+        # The database was not built by this code.
+        return None
+
+    if not records:
+        # The graph's build or sync was never completed.
+        return None
+
+    record_data = records[0].oRecordData
+    return {
+        'fingerprint': record_data.get('fingerprint'),
+        'schema_fingerprint': record_data.get('schema_fingerprint'),
+        'region_hierarchy_depth': record_data.get('region_hierarchy_depth'),
+    }
+
+
+def get_stored_dataset_info(config):
+    """Return the dict of dataset info recorded in the specified database, or None if missing.
+
+    See read_dataset_info() for the contents of the dict.
+    """
+    client = OrientDB(config.host, config.port, config.serialization_type)
+    try:
+        client.connect(config.user, config.cred)
+        if not client.db_exists(config.db_name, config.storage):
+            return None
+
+        client.db_open(config.db_name, config.user, config.cred)
+        return read_dataset_info(client)
+    finally:
+        client.close()
+
+
+def get_stored_dataset_fingerprint(config):
+    """Return the fingerprint recorded in the specified database, or None if there isn't one."""
+    dataset_info = get_stored_dataset_info(config)
+    return dataset_info['fingerprint'] if dataset_info is not None else None
+
+
+def _check_fingerprint(fingerprint):
+    """Return the fingerprint, raising ValueError if it is not a hex digest."""
+    if not _FINGERPRINT_PATTERN.match(fingerprint):
+        raise ValueError(u'Expected a SHA-256 hex digest fingerprint, got: {}'.format(fingerprint))
+    return fingerprint
+
+
+def _record_dataset_info(client, data):
+    """Record the fingerprint and hierarchy depth of the data, marking the graph as fully built."""
+    _, region_hierarchy_depth = compute_region_ancestry(data)
+    client.command(
+        'INSERT INTO DatasetInfo SET fingerprint = "{}", schema_fingerprint = "{}", '
+        'region_hierarchy_depth = {:d}'.format(
+            _check_fingerprint(compute_dataset_fingerprint(data)),
+            _check_fingerprint(compute_schema_fingerprint()), region_hierarchy_depth))
+
+
+def _to_batch_literal(value):
+    """Return the value as a JSON literal that can be safely embedded in an SQL batch script."""
+    # Batch scripts are split into statements on semicolons, even ones inside string literals.
+    # JSON escapes newlines already, and the equivalent escape for semicolons is valid JSON.
+    return json.dumps(value).replace(u';', u'\\u003b')
+
+
+def _split_into_batches(items, batch_size):
+    """Yield successive lists of at most batch_size items each."""
+    items = list(items)
+    for index in six.moves.xrange(0, len(items), batch_size):
+        yield items[index:index + batch_size]
+
+
+def _run_batch_script(client, statements, return_expression=None):
+    """Execute the statements in a single transaction, returning the result of the expression."""
+    script_lines = ['begin']
+    script_lines.extend(statements)
+    script_lines.append('commit')
+    if return_expression is not None:
+        script_lines.append('return ' + return_expression)
+
+    return client.batch(u';\n'.join(script_lines))
+
+
+def _log_creation_rate(description, row_count, start_time):
+    """Log how quickly the given number of rows were created."""
+    elapsed = max(time.time() - start_time, 1e-6)
+    logger.info(u'Created %d %s in %.2fs (%.0f rows/s).',
+                row_count, description, elapsed, row_count / elapsed)
+
+
+def _create_vertices(client, class_name, vertices, batch_size):
+    """Create the vertices of the given class in batches, returning a dict old rid -> new rid.
+
+    Args:
+        client: OrientDB client, connected to the database in which to create the vertices
+        class_name: str, the name of the vertex class to create
+        vertices: iterable of (old rid, dict of vertex properties) tuples. The properties
+                  must include a unique "uuid" value, which is used to identify each
+                  newly-created vertex.
+        batch_size: int, maximum number of vertices created in each transaction
+
+    Returns:
+        dict, old rid -> rid of the newly-created vertex
+    """
+    old_to_new_rid = {}
+    for batch in _split_into_batches(vertices, batch_size):
+        uuid_to_old_rid = {}
+        statements = []
+        for index, (old_rid, properties) in enumerate(batch):
+            uuid_to_old_rid[properties['uuid']] = old_rid
+            statements.append(u'let v{} = CREATE VERTEX {} CONTENT {}'.format(
+                index, class_name, _to_batch_literal(properties)))
+
+        return_expression = u'[{}]'.format(
+            u', '.join(u'$v{}'.format(index) for index in six.moves.xrange(len(batch))))
+        for record in _run_batch_script(client, statements, return_expression):
+            old_rid = uuid_to_old_rid[record.oRecordData['uuid']]
+            old_to_new_rid[old_rid] = record._rid
+
+        if len(uuid_to_old_rid) != len(batch):
+            raise AssertionError(u'Vertex uuids were not unique in batch: {}'.format(batch))
+
+    missing_rids = set(old_rid for old_rid, _ in vertices) - set(six.iterkeys(old_to_new_rid))
+    if missing_rids:
+        raise AssertionError(u'Failed to create {} vertices with old rids: '
+                             u'{}'.format(class_name, missing_rids))
+
+    return old_to_new_rid
+
+
+def _create_edges(client, class_name, old_to_new_rid, edges, batch_size):
+    """Create the edges of the given class in batches, returning the number of edges created."""
+    new_edges = [
+        (old_to_new_rid[source_rid], old_to_new_rid[destination_rid])
+        for source_rid, destination_rid in edges
+        if source_rid in old_to_new_rid and destination_rid in old_to_new_rid
+    ]
+
+    for batch in _split_into_batches(new_edges, batch_size):
+        _run_batch_script(client, [
+            u'CREATE EDGE {} FROM {} TO {}'.format(class_name, source_rid, destination_rid)
+            for source_rid, destination_rid in batch
+        ])
+
+    return len(new_edges)
 
-        source_rid = old_to_new_rid[source_rid]
-        destination_rid = old_to_new_rid[destination_rid]
 
-        graph_cls_broker.create(rid_to_vertex[source_rid], rid_to_vertex[destination_rid])
+def compute_region_ancestry(data):
+    """Return the transitive closure of the region hierarchy, and the depth of the hierarchy.
 
+    Returns:
+        tuple (set of (region rid, ancestor region rid) tuples, including (rid, rid) for each
+        region; int, the largest number of Has_Parent_Region edges on the shortest path from
+        any region to any of its ancestors)
+    """
+    regions = data['regions']
+    parent_rids = {}
+    for child_rid, parent_rid in data['has_parent_region']:
+        if child_rid in regions and parent_rid in regions:
+            parent_rids.setdefault(child_rid, []).append(parent_rid)
 
-def create_game_of_graphql_graph(config, data):
-    """Wipe out any data in the specified database and replace it with the Game of GraphQL graph."""
+    ancestry = set()
+    hierarchy_depth = 0
+    for rid in regions:
+        visited = {rid}
+        frontier = [rid]
+        distance = 0
+        while frontier:
+            ancestry.update((rid, ancestor_rid) for ancestor_rid in frontier)
+            hierarchy_depth = max(hierarchy_depth, distance)
+
+            next_frontier = []
+            for current_rid in frontier:
+                for parent_rid in parent_rids.get(current_rid, []):
+                    if parent_rid not in visited:
+                        visited.add(parent_rid)
+                        next_frontier.append(parent_rid)
+            frontier = next_frontier
+            distance += 1
+
+    return ancestry, hierarchy_depth
+
+
+def get_vertex_uuid(rid):
+    """Return the uuid of the vertex created from the vertex with the given existing rid."""
+    # Deriving uuids from the existing rids keeps them the same across rebuilds and syncs.
+    return str(uuid5(VERTEX_UUID_NAMESPACE, rid))
+
+
+def _get_edge_records(data):
+    """Return the list of (edge class name, set of (old rid, old rid) tuples) of the data."""
+    region_ancestry, _ = compute_region_ancestry(data)
+    edge_records = [
+        (class_name, data[key])
+        for key, class_name in six.iteritems(EDGE_CLASS_BY_DATA_KEY)
+    ]
+    edge_records.append((REGION_ANCESTRY_EDGE_CLASS, region_ancestry))
+    return edge_records
+
+
+def _compute_vertex_degrees(data):
+    """Return a dict old rid -> dict of degree property name -> number of the vertex's edges."""
+    vertex_rids = set()
+    for key in ('characters', 'houses', 'regions'):
+        vertex_rids.update(data[key])
+
+    degrees = {}
+    for edge_class, edges in _get_edge_records(data):
+        out_property_name = get_degree_property_name('out', edge_class)
+        in_property_name = get_degree_property_name('in', edge_class)
+        for out_rid, in_rid in edges:
+            # Only edges between two vertices are created, see _create_edges().
+            if out_rid in vertex_rids and in_rid in vertex_rids:
+                out_degrees = degrees.setdefault(out_rid, {})
+                out_degrees[out_property_name] = out_degrees.get(out_property_name, 0) + 1
+                in_degrees = degrees.setdefault(in_rid, {})
+                in_degrees[in_property_name] = in_degrees.get(in_property_name, 0) + 1
+    return degrees
+
+
+def get_vertex_records(data):
+    """Return the vertices to create for the given data, grouped by their vertex class.
+
+    Each vertex has a degree property counting its edges of each (direction, edge class) pair
+    in DEGREES_BY_CLASS, so that queries that only count edges need not traverse them.
+
+    Returns:
+        list of (vertex class name, plural description, vertices) tuples, where vertices is
+        a list of (old rid, dict of vertex properties) tuples
+    """
+    vertex_records = [
+        ('Character', 'characters', [
+            (character['rid'], {
+                'name': character['name'],
+                'alias': character['alias'],
+                'uuid': get_vertex_uuid(character['rid']),
+            })
+            for character in data['characters'].values()
+        ]),
+        ('NobleHouse', 'houses', [
+            (house['rid'], {
+                'name': house['name'],
+                'alias': house['alias'],
+                'motto': house['motto'],
+                'uuid': get_vertex_uuid(house['rid']),
+            })
+            for house in data['houses'].values()
+        ]),
+        ('Region', 'regions', [
+            (region['rid'], {
+                'name': region['name'],
+                'alias': region['alias'],
+                'uuid': get_vertex_uuid(region['rid']),
+            })
+            for region in data['regions'].values()
+        ]),
+    ]
+
+    degrees = _compute_vertex_degrees(data)
+    for class_name, _, vertices in vertex_records:
+        property_names = [
+            get_degree_property_name(direction, edge_class)
+            for direction, edge_class in DEGREES_BY_CLASS[class_name]
+        ]
+        for rid, properties in vertices:
+            vertex_degrees = degrees.get(rid, {})
+            for property_name in property_names:
+                properties[property_name] = vertex_degrees.get(property_name, 0)
+
+    return vertex_records
+
+
+def populate_game_of_graphql_graph(client, data, batch_size=500):
+    """Create the vertices and edges of the Game of GraphQL graph, and record its fingerprint.
+
+    Vertices and edges are created with SQL batch scripts, batch_size at a time, to avoid
+    paying for one network round trip and one transaction per created vertex or edge.
+
+    Args:
+        client: OrientDB client, connected to a database with the Game of GraphQL schema
+                and no data
+        data: dict, the data returned by existing_dataset.load_all_data()
+        batch_size: int, maximum number of vertices or edges created in each transaction
+    """
+    old_to_new_rid = {}
+    for class_name, description, vertices in get_vertex_records(data):
+        start_time = time.time()
+        old_to_new_rid.update(_create_vertices(client, class_name, vertices, batch_size))
+        _log_creation_rate(description, len(vertices), start_time)
+
+    for class_name, edges in _get_edge_records(data):
+        start_time = time.time()
+        edge_count = _create_edges(client, class_name, old_to_new_rid, edges, batch_size)
+        _log_creation_rate(u'{} edges'.format(class_name), edge_count, start_time)
+
+    _record_dataset_info(client, data)
+
+
+def create_game_of_graphql_graph(config, data, batch_size=500):
+    """Wipe out any data in the specified database and replace it with the Game of GraphQL graph.
+
+    The graph is created by populate_game_of_graphql_graph(). The fingerprint of the data is
+    recorded in the database once the graph is complete, and may be retrieved with
+    get_stored_dataset_fingerprint().
+    """
     graph = _initialize_graph_connection(config, initial_drop=True)
     _apply_game_of_graphql_schema(graph.client)
 
     # Creating the schema has invalidated the graph's object model, so we'll reload it.
     graph = _initialize_graph_connection(config, initial_drop=False)
+    populate_game_of_graphql_graph(graph.client, data, batch_size)
 
-    rid_to_vertex = {}
-    old_to_new_rid = {}
+    return graph
 
-    for character in data['characters'].values():
-        vertex = graph.Character.create(
-            name=character['name'], alias=character['alias'], uuid=str(uuid4()))
-        old_to_new_rid[character['rid']] = vertex._id
-        rid_to_vertex[vertex._id] = vertex
-
-    for house in data['houses'].values():
-        vertex = graph.NobleHouse.create(
-            name=house['name'], alias=house['alias'], motto=house['motto'], uuid=str(uuid4()))
-        old_to_new_rid[house['rid']] = vertex._id
-        rid_to_vertex[vertex._id] = vertex
-
-    for region in data['regions'].values():
-        vertex = graph.Region.create(name=region['name'], alias=region['alias'], uuid=str(uuid4()))
-        old_to_new_rid[region['rid']] = vertex._id
-        rid_to_vertex[vertex._id] = vertex
-
-    data_key_to_broker = {
-        'has_seat': graph.Has_Seat,
-        'has_parent_region': graph.Has_Parent_Region,
-        'lives_in': graph.Lives_In,
-        'owes_allegiance_to': graph.Owes_Allegiance_To,
-    }
 
-    for key, broker in data_key_to_broker.items():
-        _make_edges(broker, old_to_new_rid, rid_to_vertex, data[key])
+GraphDelta = namedtuple('GraphDelta', (
+    'vertex_inserts',  # list of (vertex class name, list of (uuid, dict of vertex properties))
+    'vertex_updates',  # list of (rid, dict of changed vertex properties) tuples
+    'vertex_deletes',  # list of rids of vertices to delete, along with all of their edges
+    'edge_inserts',    # list of (edge class name, list of (out uuid, in uuid) tuples) tuples
+    'edge_deletes',    # list of rids of edges to delete
+    'vertex_rids',     # dict, uuid -> rid of each vertex that is not deleted
+))
+
+
+def _read_graph_vertices(client, page_size):
+    """Return a dict uuid -> (rid, vertex class name, dict of vertex properties) of the graph."""
+    property_names = sorted(set(
+        property_name
+        for property_names in six.itervalues(VERTEX_PROPERTIES_BY_CLASS)
+        for property_name in property_names
+    ))
+    projection = u'@class AS class_name, uuid, {}'.format(u', '.join(property_names))
+
+    vertices = {}
+    records = iterate_query_records(client, projection, 'V', None, page_size)
+    for record in records:
+        class_name = record['class_name']
+        vertices[record.get('uuid')] = (record['rid'].get_hash(), class_name, {
+            property_name: record.get(property_name)
+            for property_name in VERTEX_PROPERTIES_BY_CLASS.get(class_name, ())
+        })
+    return vertices
+
+
+def _read_graph_edges(client, page_size):
+    """Return a dict (edge class name, out uuid, in uuid) -> list of rids of the graph's edges."""
+    edges = {}
+    records = iterate_query_records(
+        client, u'@class AS class_name, out.uuid AS out_uuid, in.uuid AS in_uuid', 'E', None,
+        page_size)
+    for record in records:
+        key = (record['class_name'], record.get('out_uuid'), record.get('in_uuid'))
+        edges.setdefault(key, []).append(record['rid'].get_hash())
+    return edges
+
+
+def compute_graph_delta(data, graph_vertices, graph_edges):
+    """Return the GraphDelta that turns the graph into the Game of GraphQL graph of the data.
+
+    Args:
+        data: dict, the data returned by existing_dataset.load_all_data()
+        graph_vertices: dict, uuid -> (rid, vertex class name, dict of vertex properties)
+                        of each vertex in the graph
+        graph_edges: dict, (edge class name, out uuid, in uuid) -> list of rids of the edges
+                     between those vertices in the graph
+
+    Returns:
+        GraphDelta, the vertex and edge inserts, updates and deletes to apply to the graph
+    """
+    desired_vertices = {}
+    rid_to_uuid = {}
+    for class_name, _, vertices in get_vertex_records(data):
+        for rid, properties in vertices:
+            desired_vertices[properties['uuid']] = (class_name, properties)
+            rid_to_uuid[rid] = properties['uuid']
+
+    desired_edges = set()
+    for class_name, edges in _get_edge_records(data):
+        desired_edges.update(
+            (class_name, rid_to_uuid[out_rid], rid_to_uuid[in_rid])
+            for out_rid, in_rid in edges
+            if out_rid in rid_to_uuid and in_rid in rid_to_uuid
+        )
+
+    vertex_updates = []
+    vertex_deletes = []
+    vertex_rids = {}
+    for uuid, (rid, class_name, properties) in six.iteritems(graph_vertices):
+        desired_class_name, desired_properties = desired_vertices.get(uuid, (None, None))
+        if desired_class_name != class_name:
+            # Vertices cannot change class, so a vertex whose class changed is recreated.
+            vertex_deletes.append(rid)
+            continue
+
+        vertex_rids[uuid] = rid
+        changed_properties = {
+            property_name: value
+            for property_name, value in six.iteritems(desired_properties)
+            if property_name != 'uuid' and properties.get(property_name) != value
+        }
+        if changed_properties:
+            vertex_updates.append((rid, changed_properties))
+
+    vertex_inserts = {}
+    for uuid, (class_name, properties) in six.iteritems(desired_vertices):
+        if uuid not in vertex_rids:
+            vertex_inserts.setdefault(class_name, []).append((uuid, properties))
+
+    edge_deletes = []
+    remaining_edges = set()
+    for key, rids in six.iteritems(graph_edges):
+        _, out_uuid, in_uuid = key
+        if out_uuid not in vertex_rids or in_uuid not in vertex_rids:
+            # Deleting a vertex deletes its edges too. Edges that are still desired are
+            # recreated along with the vertex.
+            continue
+
+        if key in desired_edges:
+            remaining_edges.add(key)
+            edge_deletes.extend(rids[1:])
+        else:
+            edge_deletes.extend(rids)
+
+    edge_inserts = {}
+    for class_name, out_uuid, in_uuid in desired_edges - remaining_edges:
+        edge_inserts.setdefault(class_name, []).append((out_uuid, in_uuid))
+
+    return GraphDelta(
+        vertex_inserts=sorted(six.iteritems(vertex_inserts)),
+        vertex_updates=vertex_updates,
+        vertex_deletes=vertex_deletes,
+        edge_inserts=sorted(six.iteritems(edge_inserts)),
+        edge_deletes=edge_deletes,
+        vertex_rids=vertex_rids,
+    )
+
+
+def _run_batched_statements(client, statements, batch_size):
+    """Execute the statements in transactions of at most batch_size statements each."""
+    for batch in _split_into_batches(statements, batch_size):
+        _run_batch_script(client, batch)
+
+
+def apply_graph_delta(client, delta, batch_size=500):
+    """Apply the GraphDelta's inserts, updates and deletes to the graph, in batches.
+
+    Each batch of at most batch_size changes is applied in its own transaction, so the graph
+    may be queried while the delta is applied. Queries see a mix of the old and new graph
+    until the delta is fully applied, and servers should not cache their results meanwhile:
+    the graph has no recorded fingerprint until sync_game_of_graphql_graph() completes.
+
+    Args:
+        client: OrientDB client, connected to the database the delta was computed for
+        delta: GraphDelta, the changes returned by compute_graph_delta()
+        batch_size: int, maximum number of changes applied in each transaction
+    """
+    start_time = time.time()
+    _run_batched_statements(client, [
+        u'DELETE EDGE {}'.format(rid) for rid in delta.edge_deletes
+    ], batch_size)
+    _run_batched_statements(client, [
+        u'DELETE VERTEX {}'.format(rid) for rid in delta.vertex_deletes
+    ], batch_size)
+    _run_batched_statements(client, [
+        u'UPDATE {} MERGE {}'.format(rid, _to_batch_literal(properties))
+        for rid, properties in delta.vertex_updates
+    ], batch_size)
+    logger.info(u'Deleted %d edges and %d vertices, and updated %d vertices in %.2fs.',
+                len(delta.edge_deletes), len(delta.vertex_deletes), len(delta.vertex_updates),
+                time.time() - start_time)
+
+    vertex_rids = dict(delta.vertex_rids)
+    for class_name, vertices in delta.vertex_inserts:
+        start_time = time.time()
+        vertex_rids.update(_create_vertices(client, class_name, vertices, batch_size))
+        _log_creation_rate(u'{} vertices'.format(class_name), len(vertices), start_time)
+
+    for class_name, edges in delta.edge_inserts:
+        start_time = time.time()
+        edge_count = _create_edges(client, class_name, vertex_rids, edges, batch_size)
+        _log_creation_rate(u'{} edges'.format(class_name), edge_count, start_time)
+
+
+def sync_game_of_graphql_graph(config, data, batch_size=500, page_size=DEFAULT_PAGE_SIZE):
+    """Bring the Game of GraphQL graph in the specified database up to date with the data.
+
+    Only the vertices and edges that differ between the graph and the data are inserted,
+    updated or deleted, so the time taken is proportional to the size of the change, and the
+    uuids of unchanged vertices stay the same. If the database holds no graph, or a graph
+    built with a different schema, the graph is recreated with create_game_of_graphql_graph().
+
+    Args:
+        config: pyorient Config, pointing to the Game of GraphQL database
+        data: dict, the data returned by existing_dataset.load_all_data()
+        batch_size: int, maximum number of changes applied in each transaction
+        page_size: int, number of records read per query when reading the graph
+    """
+    dataset_info = get_stored_dataset_info(config)
+    if dataset_info is None or dataset_info['schema_fingerprint'] != compute_schema_fingerprint():
+        logger.info(u'The graph was built with a different schema, recreating it.')
+        return create_game_of_graphql_graph(config, data, batch_size=batch_size)
+
+    graph = _initialize_graph_connection(config, initial_drop=False)
+    client = graph.client
+
+    start_time = time.time()
+    delta = compute_graph_delta(
+        data, _read_graph_vertices(client, page_size), _read_graph_edges(client, page_size))
+    logger.info(u'Computed the graph delta in %.2fs: %d vertex inserts, %d vertex updates, '
+                u'%d vertex deletes, %d edge inserts and %d edge deletes.',
+                time.time() - start_time,
+                sum(len(vertices) for _, vertices in delta.vertex_inserts),
+                len(delta.vertex_updates), len(delta.vertex_deletes),
+                sum(len(edges) for _, edges in delta.edge_inserts), len(delta.edge_deletes))
+
+    # Clearing the fingerprint marks the graph as out of date until the delta is fully applied.
+    # An interrupted sync is completed by the next one, which computes the remaining delta.
+    client.command('UPDATE DatasetInfo SET fingerprint = NULL')
+    apply_graph_delta(client, delta, batch_size=batch_size)
+    fingerprint = _check_fingerprint(compute_dataset_fingerprint(data))
+    _, region_hierarchy_depth = compute_region_ancestry(data)
+    # The fingerprint is checked to be a hex digest, so it cannot end the string literal early.
+    client.command(
+        'UPDATE DatasetInfo SET fingerprint = "{}", region_hierarchy_depth = {:d}'.format(  # nosec
+            fingerprint, region_hierarchy_depth))
 
     return graph
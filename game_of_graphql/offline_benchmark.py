@@ -0,0 +1,783 @@
+# Copyright 2017 Kensho Technologies, Inc.
+"""Benchmark the ETL and query-serving paths offline, without an OrientDB server.
+
+OrientDB is replaced by ReplayClient, which hands out the source records of the GamesOfThrones
+database page by page, and the results of the Demo queries' MATCH queries. These are either
+recorded from a running database with the "record" command, or synthetic: generated to be
+shaped like the GamesOfThrones data, and optionally scaled up to many times its size.
+
+Graph creation is benchmarked by generating the SQL batch scripts that create the graph,
+which ReplayClient reads just closely enough to hand back the created vertices' records.
+Query execution is benchmarked as the time spent fetching the MATCH query's result rows
+from ReplayClient, alongside the time the in-memory engine takes to execute the query.
+"""
+from bisect import bisect_left, bisect_right
+from contextlib import contextmanager
+import json
+import platform
+import random
+import re
+import time
+
+import click
+from pyorient.ogm import Config
+from pyorient.otypes import OrientRecordLink
+import six
+
+from game_of_graphql.benchmark import summarize_timings
+from game_of_graphql.connection_pool import OrientDBConnectionPool
+from game_of_graphql.demo_queries import DEMO_QUERIES
+from game_of_graphql.existing_dataset import (DEFAULT_PAGE_SIZE, MISSING_PARENT_REGION_CHILD_NAMES,
+                                              MISSING_REGION_LINKS, SCHEMA_CLASSES_QUERY,
+                                              get_polymorphic_cluster_ids, load_all_data)
+from game_of_graphql.memory_backend import InMemoryGraph
+from game_of_graphql.metrics import PhaseTimer
+from game_of_graphql.new_dataset import (compute_dataset_fingerprint, compute_region_ancestry,
+                                         get_stored_dataset_fingerprint,
+                                         populate_game_of_graphql_graph)
+from game_of_graphql.query_cache import bind_arguments, compile_query
+from game_of_graphql.server import get_orientdb_query_rewrite, schema
+
+
+# Bump these whenever the format of recordings or of benchmark reports changes.
+RECORDING_FORMAT_VERSION = 1
+REPORT_FORMAT_VERSION = 1
+
+# Record links are stored in recordings as dicts with this single key, mapped to their rid.
+_LINK_KEY = '@rid'
+
+# The source queries run by existing_dataset.load_all_data(), as (target class, a string that
+# only that query's condition contains among the queries of the same clusters or None,
+# data key of the query's results) tuples.
+_SOURCE_QUERIES = (
+    ('Character', None, 'characters'),
+    ('V', 'Noble_house', 'houses'),
+    ('V', 'Settlement', 'regions'),
+    ('Has_Seat', None, 'has_seat'),
+    ('E', 'Has_Castles', 'has_parent_region'),
+    ('Has_Place', None, 'lives_in'),
+    ('Has_Allegiance', None, 'owes_allegiance_to'),
+)
+
+_PAGE_QUERY_PATTERN = re.compile(
+    r'^SELECT @rid AS rid, .*? FROM cluster:(?P<cluster_id>\d+)'
+    r'(?: WHERE (?P<condition>.*?))? LIMIT (?P<limit>\d+)$', re.DOTALL)
+_KEYSET_CONDITION_PATTERN = re.compile(r'(?:^| AND )@rid > (?P<rid>#\d+:\d+)$')
+_CREATE_VERTEX_PATTERN = re.compile(
+    r'^let (?P<variable>\w+) = CREATE VERTEX (?P<class_name>\w+) CONTENT '
+    r'.*"uuid": "(?P<uuid>[^"]*)"')
+
+# The vertices created by ReplayClient are placed in clusters numbered from this one onwards.
+_FIRST_CREATED_CLUSTER_ID = 100
+
+# The number of records of each kind in a synthetic dataset before it is scaled up,
+# roughly the number in the GamesOfThrones database.
+_SYNTHETIC_CHARACTER_COUNT = 2000
+_SYNTHETIC_HOUSE_COUNT = 450
+_SYNTHETIC_REGION_COUNT = 700
+_SYNTHETIC_LIVES_IN_COUNT = 1500
+_SYNTHETIC_OWES_ALLEGIANCE_TO_COUNT = 3000
+
+# The character and region names that the Demo queries look up.
+_SYNTHETIC_CHARACTER_NAMES = ['Sansa Stark']
+_SYNTHETIC_REGION_PARENT_NAMES = {
+    'Great Sept of Baelor': "King's Landing",
+    "King's Landing": 'The Crownlands',
+}
+
+
+class ReplayError(ValueError):
+    """Raised when ReplayClient is sent a query that it has no recorded results for."""
+
+
+def _get_rid_sort_key(rid):
+    """Return a key that sorts rids in the same order as OrientDB does."""
+    cluster_id, position = rid.lstrip('#').split(':')
+    return int(cluster_id), int(position)
+
+
+def _get_targets_by_cluster(schema_classes):
+    """Return a dict of cluster id -> set of the source queries' target classes that include it."""
+    result = {}
+    for target in set(target for target, _, _ in _SOURCE_QUERIES):
+        for cluster_id in get_polymorphic_cluster_ids(schema_classes, target):
+            result.setdefault(cluster_id, set()).add(target)
+    return result
+
+
+def _parse_page_query(query, targets_by_cluster):
+    """Return the (data key, cluster id, rid the page starts after or None, page size) of a query.
+
+    Args:
+        query: str, a page query of existing_dataset.iterate_query_records()
+        targets_by_cluster: dict, cluster id -> set of the source queries' target classes
+                            whose records that cluster holds, including those of subclasses
+    """
+    match = _PAGE_QUERY_PATTERN.match(query.strip())
+    if match is None:
+        raise ReplayError(u'Not a page query of the GamesOfThrones source data: {}'.format(query))
+
+    cluster_id = int(match.group('cluster_id'))
+    condition = match.group('condition') or u''
+    after_rid = None
+    keyset_match = _KEYSET_CONDITION_PATTERN.search(condition)
+    if keyset_match is not None:
+        after_rid = keyset_match.group('rid')
+        condition = condition[:keyset_match.start()]
+
+    # The clusters of a subclass are paged through by the queries of its superclasses too,
+    # so queries whose condition singles them out take precedence over those without one.
+    targets = targets_by_cluster.get(cluster_id, set())
+    matching_data_keys = [
+        (condition_part is None, data_key)
+        for target, condition_part, data_key in _SOURCE_QUERIES
+        if target in targets and (condition_part is None or condition_part in condition)
+    ]
+    if not matching_data_keys:
+        raise ReplayError(u'Unexpected GamesOfThrones source query: {}'.format(query))
+
+    _, data_key = min(matching_data_keys, key=lambda x: x[0])
+    return data_key, cluster_id, after_rid, int(match.group('limit'))
+
+
+def _to_recorded_value(value):
+    """Return the JSON form of a record's field value, raising TypeError if it has none."""
+    if isinstance(value, OrientRecordLink):
+        return {_LINK_KEY: value.get_hash()}
+    elif isinstance(value, list):
+        return [_to_recorded_value(x) for x in value]
+    elif value is None or isinstance(value, six.string_types + six.integer_types + (float,)):
+        return value
+    raise TypeError(u'Cannot record this value: {}'.format(value))
+
+
+def _to_recorded_record(record_data):
+    """Return the JSON form of the record's data, leaving out fields that have none."""
+    result = {}
+    for key, value in six.iteritems(record_data):
+        try:
+            result[key] = _to_recorded_value(value)
+        except TypeError:
+            # Link bags and other binary fields are never used by the data loaders.
+            pass
+    return result
+
+
+def _from_recorded_value(value):
+    """Return the field value represented by its JSON form."""
+    if isinstance(value, dict) and set(value) == {_LINK_KEY}:
+        return OrientRecordLink(value[_LINK_KEY].lstrip('#'))
+    elif isinstance(value, list):
+        return [_from_recorded_value(x) for x in value]
+    return value
+
+
+class _ReplayRecord(object):
+    """A stand-in for a pyorient record."""
+
+    def __init__(self, record_data, rid=None):
+        """Create a record with the given data and rid."""
+        self.oRecordData = record_data
+        self._rid = rid
+
+
+class ReplayClient(object):
+    """A stand-in for a pyorient client, replaying recorded source records and query results.
+
+    The client answers the page queries run by existing_dataset.load_all_data(), the MATCH
+    queries it has results for, and the batch scripts run by
+    new_dataset.populate_game_of_graphql_graph(). It is not thread-safe.
+
+    The client's database schema has a class for the target of each source query, without
+    any subclasses, whose clusters are those of the records recorded for its queries.
+    """
+
+    def __init__(self, source_records, match_results=None):
+        """Create a client that replays the given source records and MATCH query results.
+
+        Args:
+            source_records: dict, data key of the source query -> list of the records it
+                            selects, in their JSON form
+            match_results: optional dict, MATCH query -> list of its result rows
+        """
+        self._records = {}
+        self._record_keys = {}
+        for data_key, records in six.iteritems(source_records):
+            records = sorted(
+                ({key: _from_recorded_value(value) for key, value in six.iteritems(source_record)}
+                 for source_record in records),
+                key=lambda source_record: _get_rid_sort_key(source_record['rid'].get_hash()))
+            self._records[data_key] = records
+            self._record_keys[data_key] = [
+                _get_rid_sort_key(source_record['rid'].get_hash())
+                for source_record in records
+            ]
+
+        self._schema_classes = [
+            {
+                'name': target,
+                'superClasses': [],
+                'clusterIds': sorted(set(
+                    record_key[0]
+                    for source_target, _, data_key in _SOURCE_QUERIES
+                    if source_target == target
+                    for record_key in self._record_keys.get(data_key, [])
+                )),
+            }
+            for target in sorted(set(target for target, _, _ in _SOURCE_QUERIES))
+        ]
+        self._targets_by_cluster = _get_targets_by_cluster(self._schema_classes)
+
+        self._match_results = dict(match_results or {})
+        self._cluster_ids = {}  # class name -> id of the cluster its vertices are created in
+        self._created_record_counts = {}  # cluster id -> number of vertices created in it
+
+        # The time spent handing out source records, and the number of edges created.
+        self.query_seconds = 0.0
+        self.created_edge_count = 0
+
+    def set_match_results(self, match_query, rows):
+        """Replay the given result rows for the MATCH query from now on."""
+        self._match_results[match_query] = rows
+
+    def query(self, query, limit=-1):
+        """Return the schema's classes, or the page of source records selected by a page query."""
+        if query == SCHEMA_CLASSES_QUERY:
+            return [_ReplayRecord(dict(schema_class)) for schema_class in self._schema_classes]
+
+        start_time = time.time()
+        data_key, cluster_id, after_rid, page_size = _parse_page_query(
+            query, self._targets_by_cluster)
+        if data_key not in self._records:
+            raise ReplayError(u'No source records were recorded for: {}'.format(data_key))
+
+        record_keys = self._record_keys[data_key]
+        if after_rid is not None:
+            start = bisect_right(record_keys, _get_rid_sort_key(after_rid))
+        else:
+            start = bisect_left(record_keys, (cluster_id, 0))
+        end = min(start + page_size, bisect_left(record_keys, (cluster_id + 1, 0)))
+        # The data loaders modify the records they are given, so each gets its own copy.
+        page = [
+            _ReplayRecord(dict(source_record))
+            for source_record in self._records[data_key][start:end]
+        ]
+        self.query_seconds += time.time() - start_time
+        return page
+
+    def command(self, command, limit=-1):
+        """Return the recorded results of a MATCH query, ignoring all other commands."""
+        if command in self._match_results:
+            return [_ReplayRecord(dict(row)) for row in self._match_results[command]]
+        elif command.lstrip().upper().startswith('SELECT'):
+            raise ReplayError(u'No results were recorded for the query: {}'.format(command))
+        return []
+
+    def _create_vertex(self, class_name, uuid):
+        """Return the record of a new vertex of the given class, with the given uuid."""
+        cluster_id = self._cluster_ids.setdefault(
+            class_name, _FIRST_CREATED_CLUSTER_ID + len(self._cluster_ids))
+        position = self._created_record_counts.get(cluster_id, 0)
+        self._created_record_counts[cluster_id] = position + 1
+        return _ReplayRecord({'uuid': uuid}, u'#{}:{}'.format(cluster_id, position))
+
+    def batch(self, script):
+        """Run a batch script creating vertices or edges, returning its returned vertices."""
+        variables = {}
+        result = []
+        for statement in script.split(u';\n'):
+            vertex_match = _CREATE_VERTEX_PATTERN.match(statement)
+            if vertex_match is not None:
+                variables[u'$' + vertex_match.group('variable')] = self._create_vertex(
+                    vertex_match.group('class_name'), vertex_match.group('uuid'))
+            elif statement.startswith(u'CREATE EDGE '):
+                self.created_edge_count += 1
+            elif statement.startswith(u'return '):
+                result = [
+                    variables[name.strip()]
+                    for name in statement[len(u'return '):].strip(u'[]').split(u',')
+                ]
+        return result
+
+
+class ReplayConnectionPool(object):
+    """A stand-in for an OrientDBConnectionPool, whose only session is a ReplayClient."""
+
+    def __init__(self, client):
+        """Create a pool that hands out the given ReplayClient."""
+        self._client = client
+
+    @contextmanager
+    def connection(self):
+        """Check out the pool's ReplayClient for the duration of the "with" block."""
+        yield self._client
+
+
+class _RecordingClient(object):
+    """Wrap a pyorient client, recording the source records it returns to load_all_data()."""
+
+    def __init__(self, client, source_records):
+        """Record the records returned by the client into the dict of data key -> records."""
+        self._client = client
+        self._source_records = source_records
+        self._targets_by_cluster = {}
+
+    def query(self, query, limit=-1):
+        """Run the schema query or a page query, and record the records a page query returns."""
+        records = self._client.query(query, limit)
+        if query == SCHEMA_CLASSES_QUERY:
+            # Page queries select the records of a cluster, and the schema tells which
+            # source query that cluster is paged through for.
+            self._targets_by_cluster = _get_targets_by_cluster(
+                [schema_class.oRecordData for schema_class in records])
+            return records
+
+        data_key, _, _, _ = _parse_page_query(query, self._targets_by_cluster)
+        # The data loaders modify the records they are given, so they are recorded beforehand.
+        self._source_records.setdefault(data_key, []).extend(
+            _to_recorded_record(source_record.oRecordData) for source_record in records)
+        return records
+
+
+class _RecordingConnectionPool(object):
+    """Wrap an OrientDBConnectionPool, recording the source records its sessions return."""
+
+    def __init__(self, pool, source_records):
+        """Record the records returned by the pool's sessions into the given dict."""
+        self._pool = pool
+        self._source_records = source_records
+
+    @contextmanager
+    def connection(self):
+        """Check out a recording session for the duration of the "with" block."""
+        with self._pool.connection() as client:
+            yield _RecordingClient(client, self._source_records)
+
+
+def record_benchmark_data(source_config, graph_config, page_size=DEFAULT_PAGE_SIZE):
+    """Return a recording of the GamesOfThrones source records, and the Demo queries' results.
+
+    Args:
+        source_config: pyorient.ogm.Config object, describing the GamesOfThrones database
+        graph_config: pyorient.ogm.Config object, describing the game_of_graphql database.
+                      It must have been built from the current GamesOfThrones data.
+        page_size: int, number of source records read per query
+
+    Returns:
+        dict, the recording in its JSON form
+    """
+    source_records = {}
+    pool = OrientDBConnectionPool(source_config, size=1)
+    try:
+        data = load_all_data(source_config, parallelism=1, page_size=page_size,
+                             pool=_RecordingConnectionPool(pool, source_records))
+    finally:
+        pool.close()
+
+    if get_stored_dataset_fingerprint(graph_config) != compute_dataset_fingerprint(data):
+        raise click.ClickException(u'The game_of_graphql database is not up to date with the '
+                                   u'GamesOfThrones data. Start the server to rebuild it.')
+
+    _, region_hierarchy_depth = compute_region_ancestry(data)
+    rewrite_query = get_orientdb_query_rewrite(region_hierarchy_depth)
+    match_results = {}
+    pool = OrientDBConnectionPool(graph_config, size=1)
+    try:
+        with pool.connection() as client:
+            for demo_query in DEMO_QUERIES:
+                bound_query = bind_arguments(
+                    compile_query(schema, demo_query.query, rewrite_query=rewrite_query),
+                    demo_query.args)
+                match_results[demo_query.name] = [
+                    _to_recorded_record(result_record.oRecordData)
+                    for result_record in client.command(bound_query.match_query, -1)
+                ]
+    finally:
+        pool.close()
+
+    return {
+        'format_version': RECORDING_FORMAT_VERSION,
+        'source_records': source_records,
+        'match_results': match_results,
+    }
+
+
+def _link(cluster_id, position):
+    """Return the JSON form of a link to the record at the given position of the cluster."""
+    return {_LINK_KEY: u'#{}:{}'.format(cluster_id, position)}
+
+
+def _make_edge_records(cluster_id, edges):
+    """Return the JSON form of the edge records selected by a source query of edges."""
+    return [
+        {
+            'rid': _link(cluster_id, position),
+            'out_rid': out_link,
+            'in_rid': in_link,
+        }
+        for position, (out_link, in_link) in enumerate(edges)
+    ]
+
+
+def generate_source_records(seed=0):
+    """Return synthetic source records, shaped like those of the GamesOfThrones database.
+
+    The records include every region that the data loaders link up by name, as well as the
+    characters and regions that the Demo queries look up, so that all Demo queries have results.
+    The same seed always produces the same records.
+
+    Returns:
+        dict, data key of the source query -> list of the records it selects, in their JSON form
+    """
+    # The synthetic records only need to be reproducible, not unpredictable.
+    rng = random.Random(seed)  # nosec
+
+    named_regions = set(_SYNTHETIC_REGION_PARENT_NAMES)
+    named_regions.update(_SYNTHETIC_REGION_PARENT_NAMES.values())
+    named_regions.update(MISSING_REGION_LINKS)
+    for children_names in (list(MISSING_PARENT_REGION_CHILD_NAMES.values()) +
+                           list(MISSING_REGION_LINKS.values())):
+        named_regions.update(children_names)
+
+    house_names = [u'Family{:04d}'.format(index) for index in range(_SYNTHETIC_HOUSE_COUNT)]
+    # Every tenth house has a seat named after it.
+    seat_names = {
+        house_name: u'{}hold'.format(house_name)
+        for house_name in house_names[::10]
+    }
+    region_names = sorted(named_regions) + sorted(six.itervalues(seat_names))
+    region_names.extend(
+        u'Region{:04d}{}'.format(index, rng.choice([u'', u'', u' (castle)', u' (region)']))
+        for index in range(max(0, _SYNTHETIC_REGION_COUNT - len(region_names))))
+    region_links = [_link(13, position) for position in range(len(region_names))]
+    region_links_by_name = dict(zip(region_names, region_links))
+
+    parent_regions = [
+        (region_links_by_name[child_name], region_links_by_name[parent_name])
+        for child_name, parent_name in sorted(six.iteritems(_SYNTHETIC_REGION_PARENT_NAMES))
+    ]
+    # The remaining regions form a random forest, with each region's parent listed before it.
+    # Regions that the data loaders link up by name get their parents from the data loaders.
+    for index in range(len(named_regions), len(region_names)):
+        parent_regions.append((region_links[index], region_links[rng.randrange(index)]))
+
+    character_names = _SYNTHETIC_CHARACTER_NAMES + [
+        u'Person{:05d}{}'.format(index, rng.choice([u'', u'', u' (character)']))
+        for index in range(_SYNTHETIC_CHARACTER_COUNT - len(_SYNTHETIC_CHARACTER_NAMES))
+    ]
+    characters = []
+    for position, name in enumerate(character_names):
+        character = {'rid': _link(11, position), 'name': name}
+        if rng.random() < 0.3:
+            character['Aka'] = u'"Alias{0:05d}"<br>Old Alias{0:05d} (formerly)'.format(position)
+        characters.append(character)
+    character_links = [character['rid'] for character in characters]
+
+    houses = []
+    for position, house_name in enumerate(house_names):
+        house = {'rid': _link(12, position), 'name': u'House {}'.format(house_name)}
+        if rng.random() < 0.5:
+            house['Words'] = u'"Words of {0}" (official)<br>"{0} Stands" (common saying)'.format(
+                house_name)
+        houses.append(house)
+    house_links = [house['rid'] for house in houses]
+
+    seats = []
+    for house_name, house_link in zip(house_names, house_links):
+        if house_name in seat_names:
+            seats.append((house_link, region_links_by_name[seat_names[house_name]]))
+        elif rng.random() < 0.8:
+            seats.append((house_link, rng.choice(region_links)))
+
+    lives_in = [
+        (rng.choice(character_links), rng.choice(region_links))
+        for _ in range(_SYNTHETIC_LIVES_IN_COUNT)
+    ]
+    # The characters the Demo queries look up owe allegiance to several houses.
+    allegiances = [
+        (character_link, house_link)
+        for character_link in character_links[:len(_SYNTHETIC_CHARACTER_NAMES)]
+        for house_link in rng.sample(house_links, 4)
+    ]
+    for _ in range(_SYNTHETIC_OWES_ALLEGIANCE_TO_COUNT - len(allegiances)):
+        targets = house_links if rng.random() < 0.9 else character_links
+        allegiances.append((rng.choice(character_links), rng.choice(targets)))
+
+    return {
+        'characters': characters,
+        'houses': houses,
+        'regions': [
+            {'rid': link, 'name': name}
+            for link, name in zip(region_links, region_names)
+        ],
+        'has_seat': _make_edge_records(21, seats),
+        'has_parent_region': _make_edge_records(22, parent_regions),
+        'lives_in': _make_edge_records(23, lives_in),
+        'owes_allegiance_to': _make_edge_records(24, allegiances),
+    }
+
+
+def _iterate_links(value):
+    """Yield the rid of each record link in the JSON form of a field value."""
+    if isinstance(value, dict) and set(value) == {_LINK_KEY}:
+        yield value[_LINK_KEY]
+    elif isinstance(value, list):
+        for item in value:
+            for rid in _iterate_links(item):
+                yield rid
+
+
+def _shift_links(value, position_offset):
+    """Return the JSON form of a field value, with the positions of its links offset."""
+    if isinstance(value, dict) and set(value) == {_LINK_KEY}:
+        cluster_id, position = _get_rid_sort_key(value[_LINK_KEY])
+        return _link(cluster_id, position + position_offset)
+    elif isinstance(value, list):
+        return [_shift_links(item, position_offset) for item in value]
+    return value
+
+
+def scale_source_records(source_records, factor):
+    """Return the source records repeated the given number of times, as disjoint copies.
+
+    Each copy's links point past those of the previous copy, and every copy but the first
+    has its records' names suffixed with its number, so that the copies make up identically
+    shaped, disconnected graphs, and names the data loaders look up remain unique.
+    """
+    if factor == 1:
+        return source_records
+
+    position_stride = 1 + max(
+        _get_rid_sort_key(rid)[1]
+        for records in six.itervalues(source_records)
+        for source_record in records
+        for value in six.itervalues(source_record)
+        for rid in _iterate_links(value)
+    )
+
+    result = {}
+    for data_key, records in six.iteritems(source_records):
+        scaled_records = []
+        for copy_index in range(factor):
+            for source_record in records:
+                scaled_record = {
+                    key: _shift_links(value, copy_index * position_stride)
+                    for key, value in six.iteritems(source_record)
+                }
+                if copy_index and isinstance(source_record.get('name'), six.string_types):
+                    scaled_record['name'] = u'{} {}'.format(source_record['name'], copy_index + 1)
+                scaled_records.append(scaled_record)
+        result[data_key] = scaled_records
+    return result
+
+
+def _get_response(bound_query, rows):
+    """Return the response the /graphql endpoint sends for the query and its result rows."""
+    compiled_query = bound_query.compiled_query
+    return {
+        'supplied_graphql': compiled_query.supplied_graphql,
+        'supplied_args': bound_query.args,
+        'input_metadata': compiled_query.input_metadata,
+        'output_metadata': compiled_query.output_metadata,
+        'executed_match_query': bound_query.pretty_match_query,
+        'output_data': rows,
+    }
+
+
+def _benchmark_demo_query(client, memory_graph, demo_query, repetitions, rewrite_query):
+    """Time each phase of serving the Demo query the given number of times.
+
+    The query is rewritten with rewrite_query before it is compiled, as the server does for
+    queries executed in OrientDB.
+
+    Returns:
+        dict with the number of result rows, and the timing statistics of each phase
+    """
+    phase_timings = {}
+    rows = None
+    for _ in six.moves.xrange(repetitions):
+        timer = PhaseTimer()
+        compiled_query = compile_query(
+            schema, demo_query.query, timer, rewrite_query=rewrite_query)
+        with timer.phase('bind'):
+            bound_query = bind_arguments(compiled_query, demo_query.args)
+        with timer.phase('execute'):
+            rows = [
+                result_record.oRecordData
+                for result_record in client.command(bound_query.match_query, -1)
+            ]
+        with timer.phase('serialize'):
+            json.dumps(_get_response(bound_query, rows), separators=(',', ':'))
+        with timer.phase('memory_execute'):
+            list(memory_graph.execute(demo_query.query, demo_query.args))
+
+        for phase_name, seconds in six.iteritems(timer.durations):
+            phase_timings.setdefault(phase_name, []).append(seconds)
+
+    result = {
+        phase_name: summarize_timings(timings)
+        for phase_name, timings in six.iteritems(phase_timings)
+    }
+    result['rows'] = len(rows)
+    return result
+
+
+def benchmark_source_records(source_records, recorded_results, repetitions,
+                             page_size=DEFAULT_PAGE_SIZE, batch_size=500):
+    """Benchmark loading, cleaning and serving the data of the given source records.
+
+    Args:
+        source_records: dict, data key of the source query -> list of the records it
+                        selects, in their JSON form
+        recorded_results: dict, Demo query name -> list of its recorded result rows.
+                          The in-memory engine's results stand in for those of other queries.
+        repetitions: int, number of times to serve each Demo query
+        page_size: int, number of source records read per query
+        batch_size: int, maximum number of vertices or edges created per batch script
+
+    Returns:
+        dict with the size of the loaded data, the time taken by each ETL phase,
+        and the timing statistics of serving each Demo query
+    """
+    client = ReplayClient(source_records)
+    pool = ReplayConnectionPool(client)
+    etl_seconds = {}
+
+    # The data is loaded by a single thread, so that the time spent in the client
+    # can be told apart from the time spent cleaning up what it returned.
+    start_time = time.time()
+    data = load_all_data(None, parallelism=1, page_size=page_size, pool=pool)
+    etl_seconds['extraction'] = client.query_seconds
+    etl_seconds['cleaning'] = time.time() - start_time - client.query_seconds
+
+    start_time = time.time()
+    populate_game_of_graphql_graph(client, data, batch_size)
+    etl_seconds['graph_creation'] = time.time() - start_time
+
+    start_time = time.time()
+    memory_graph = InMemoryGraph(data)
+    etl_seconds['memory_graph_creation'] = time.time() - start_time
+
+    # The Demo queries are compiled to the MATCH queries that the server executes in OrientDB.
+    _, region_hierarchy_depth = compute_region_ancestry(data)
+    rewrite_query = get_orientdb_query_rewrite(region_hierarchy_depth)
+    queries = {}
+    for demo_query in DEMO_QUERIES:
+        bound_query = bind_arguments(
+            compile_query(schema, demo_query.query, rewrite_query=rewrite_query),
+            demo_query.args)
+        rows = recorded_results.get(demo_query.name)
+        if rows is None:
+            rows = list(memory_graph.execute(demo_query.query, demo_query.args))
+        client.set_match_results(bound_query.match_query, rows)
+        queries[demo_query.name] = _benchmark_demo_query(
+            client, memory_graph, demo_query, repetitions, rewrite_query)
+
+    dataset = {key: len(value) for key, value in six.iteritems(data)}
+    dataset['created_edges'] = client.created_edge_count
+    return {
+        'dataset': dataset,
+        'etl': {
+            u'{}_ms'.format(phase_name): seconds * 1000.0
+            for phase_name, seconds in six.iteritems(etl_seconds)
+        },
+        'queries': queries,
+    }
+
+
+def _parse_scales(ctx, param, value):
+    """Return the list of scale factors in the comma-separated string."""
+    try:
+        scales = [int(x) for x in value.split(',')]
+    except ValueError:
+        scales = []
+    if not scales or any(scale < 1 for scale in scales):
+        raise click.BadParameter(u'Expected comma-separated positive integers, got: '
+                                 u'{}'.format(value))
+    return scales
+
+
+@click.group()
+def cli():
+    """Benchmark the ETL and query-serving paths without an OrientDB server."""
+
+
+@cli.command()
+@click.option('--graph-location', type=str, default='127.0.0.1:2424',
+              help='OrientDB host and port')
+@click.option('--graph-user', type=str, default='root',
+              help='OrientDB username')
+@click.option('--graph-password', type=str, default='root',
+              help='OrientDB password')
+@click.option('--page-size', type=int, default=DEFAULT_PAGE_SIZE,
+              help='Number of records read per query from the GamesOfThrones graph')
+@click.option('--output', type=click.Path(dir_okay=False), required=True,
+              help='File to write the recording to')
+def record(graph_location, graph_user, graph_password, page_size, output):
+    """Record the GamesOfThrones source records and the Demo queries' results to a file."""
+    source_config = Config.from_url(
+        'plocal://{}/GamesOfThrones'.format(graph_location), graph_user, graph_password)
+    graph_config = Config.from_url(
+        'plocal://{}/game_of_graphql'.format(graph_location), graph_user, graph_password)
+
+    recording = record_benchmark_data(source_config, graph_config, page_size)
+    with open(output, 'w') as f:
+        json.dump(recording, f, sort_keys=True)
+
+
+@cli.command()
+@click.option('--recording', type=click.Path(exists=True, dir_okay=False), default=None,
+              help='Replay this recording instead of synthetic source records')
+@click.option('--seed', type=int, default=0,
+              help='Seed for generating the synthetic source records')
+@click.option('--scales', type=str, default='1,10', callback=_parse_scales,
+              help='Comma-separated factors to scale the source records up by, e.g. 1,10,100')
+@click.option('--repetitions', type=int, default=20,
+              help='Number of times to serve each query')
+@click.option('--page-size', type=int, default=DEFAULT_PAGE_SIZE,
+              help='Number of source records read per query')
+@click.option('--batch-size', type=int, default=500,
+              help='Maximum number of vertices or edges created per batch script')
+@click.option('--output', type=click.Path(dir_okay=False), default=None,
+              help='File to write the results to, instead of printing them')
+def run(recording, seed, scales, repetitions, page_size, batch_size, output):
+    """Benchmark each phase of loading and serving the data, and report the timings as JSON."""
+    if recording is None:
+        source_records = generate_source_records(seed)
+        match_results = {}
+    else:
+        with open(recording) as f:
+            recorded_data = json.load(f)
+        if recorded_data.get('format_version') != RECORDING_FORMAT_VERSION:
+            raise click.ClickException(u'Recording format version {} is not supported, expected '
+                                       u'version {}.'.format(recorded_data.get('format_version'),
+                                                             RECORDING_FORMAT_VERSION))
+        source_records = recorded_data['source_records']
+        match_results = recorded_data['match_results']
+
+    report = {
+        'format_version': REPORT_FORMAT_VERSION,
+        'source': 'synthetic' if recording is None else 'recording',
+        'seed': seed if recording is None else None,
+        'python_version': platform.python_version(),
+        'repetitions': repetitions,
+        'page_size': page_size,
+        'batch_size': batch_size,
+        'scales': {},
+    }
+    for scale in scales:
+        # Recorded results only describe the recorded graph, and not scaled-up copies of it.
+        report['scales'][str(scale)] = benchmark_source_records(
+            scale_source_records(source_records, scale), match_results if scale == 1 else {},
+            repetitions, page_size, batch_size)
+
+    report_text = json.dumps(report, indent=4, sort_keys=True)
+    if output is None:
+        click.echo(report_text)
+    else:
+        with open(output, 'w') as f:
+            f.write(report_text)
+
+
+if __name__ == '__main__':
+    cli()
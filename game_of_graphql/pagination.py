@@ -0,0 +1,64 @@
+# Copyright 2017 Kensho Technologies, Inc.
+"""Page through the results of compiled queries using opaque cursors."""
+import base64
+import hashlib
+import json
+
+import six
+
+from game_of_graphql.query_cache import get_query_key
+
+
+class InvalidCursorError(ValueError):
+    """Raised when a cursor is malformed, or belongs to a different query, arguments or graph."""
+
+
+def _get_cursor_query_id(bound_query, generation):
+    """Return the identifier tying a cursor to the BoundQuery and graph it was produced for."""
+    id_text = u'{}:{}'.format(generation, get_query_key(bound_query))
+    return hashlib.sha256(id_text.encode('utf-8')).hexdigest()[:16]
+
+
+def encode_cursor(bound_query, offset, generation):
+    """Return an opaque cursor pointing at the given offset in the results of the BoundQuery.
+
+    The cursor is only valid as long as the graph generation, e.g. a ResultCache's generation,
+    stays the same, since the results of the BoundQuery may change along with the graph.
+    """
+    payload = json.dumps({'query': _get_cursor_query_id(bound_query, generation),
+                          'offset': offset})
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(bound_query, cursor, generation):
+    """Return the results offset the cursor points to, checking it belongs to the BoundQuery.
+
+    Cursors produced in a different graph generation are rejected as well.
+    """
+    # Decoding errors are all ValueErrors, except for bad padding on Python 2, a TypeError.
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+        query_id = payload['query']
+        offset = payload['offset']
+    except (KeyError, TypeError, ValueError):
+        raise InvalidCursorError(u'Malformed cursor: {}'.format(cursor))
+
+    if query_id != _get_cursor_query_id(bound_query, generation):
+        raise InvalidCursorError(u'Cursor {} does not belong to this query and arguments, or the '
+                                 u'graph changed since it was produced. Cursors may only be used '
+                                 u'with the query and arguments that produced them.'.format(cursor))
+    if not isinstance(offset, six.integer_types) or offset < 0:
+        raise InvalidCursorError(u'Malformed cursor: {}'.format(cursor))
+
+    return offset
+
+
+def get_page_query(bound_query, offset, limit):
+    """Return a BoundQuery that only produces the given range of the BoundQuery's results."""
+    # Every compiled MATCH query is an outer SELECT over the MATCH results, which accepts SKIP
+    # and LIMIT clauses. The queries have no ORDER BY, but cursors are tied to the graph
+    # generation, and within a generation the same query produces its results in the same order.
+    page_clause = u' SKIP {} LIMIT {}'.format(offset, limit)
+    return bound_query._replace(
+        match_query=bound_query.match_query + page_clause,
+        pretty_match_query=bound_query.pretty_match_query + page_clause)
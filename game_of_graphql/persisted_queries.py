@@ -0,0 +1,98 @@
+# Copyright 2017 Kensho Technologies, Inc.
+"""Queries registered ahead of time, that clients execute by id instead of sending their text."""
+import json
+
+import six
+
+from game_of_graphql.query_cache import normalize_query_text
+
+
+class QueryRegistryError(ValueError):
+    """Raised when a query registry file is malformed, or one of its queries does not compile."""
+
+
+class UnknownQueryIdError(ValueError):
+    """Raised when a request names a query id that is not registered."""
+
+
+class UnregisteredQueryError(ValueError):
+    """Raised when a request sends the text of an unregistered query, and those are rejected."""
+
+
+def read_query_registry_file(file_path):
+    """Return the dict of query id -> GraphQL query text in the given JSON registry file."""
+    with open(file_path) as f:
+        try:
+            queries = json.load(f)
+        except ValueError as e:
+            raise QueryRegistryError(u'Query registry {} is not valid JSON: {}'.format(
+                file_path, e))
+
+    if not isinstance(queries, dict):
+        raise QueryRegistryError(u'Expected query registry {} to hold a JSON object of query id '
+                                 u'-> query text, got: {}'.format(file_path, type(queries)))
+    for query_id, query in six.iteritems(queries):
+        if not query or not isinstance(query, six.string_types):
+            raise QueryRegistryError(u'Registered query {} in {} is not a valid query '
+                                     u'string: {}'.format(query_id, file_path, query))
+    return queries
+
+
+class QueryRegistry(object):
+    """The compiled forms of a fixed set of GraphQL queries, by their registered ids."""
+
+    def __init__(self, queries, compile_query, reject_unregistered=False):
+        """Compile each of the queries, so that requests for them need not compile them again.
+
+        Args:
+            queries: dict, query id -> GraphQL query text
+            compile_query: function, GraphQL query text -> its CompiledQuery
+            reject_unregistered: bool, if True, check_query_text() rejects queries that are
+                                 not registered
+        """
+        self._queries = dict(queries)
+        self._compiled_queries = {}
+        self._registered_queries = set(
+            normalize_query_text(query) for query in six.itervalues(queries))
+        self._reject_unregistered = reject_unregistered
+        self.recompile(compile_query)
+
+    def recompile(self, compile_query):
+        """Compile each of the queries anew, e.g. after the way queries are compiled changed."""
+        compiled_queries = {}
+        for query_id, query in sorted(six.iteritems(self._queries)):
+            # pylint: disable=broad-except
+            try:
+                compiled_queries[query_id] = compile_query(query)
+            except Exception as e:
+                raise QueryRegistryError(u'Registered query {} failed to compile: {}'.format(
+                    query_id, e))
+            # pylint: enable=broad-except
+
+        # Requests keep getting the previously compiled queries until all are compiled anew.
+        self._compiled_queries = compiled_queries
+
+    def __len__(self):
+        """Return the number of registered queries."""
+        return len(self._compiled_queries)
+
+    def items(self):
+        """Return a list of (query id, CompiledQuery) tuples of the registered queries."""
+        return sorted(six.iteritems(self._compiled_queries))
+
+    def get(self, query_id):
+        """Return the CompiledQuery registered under the given id."""
+        compiled_query = self._compiled_queries.get(query_id)
+        if compiled_query is None:
+            raise UnknownQueryIdError(u'No query is registered with id: {}'.format(query_id))
+        return compiled_query
+
+    def check_query_text(self, query):
+        """Raise UnregisteredQueryError if the query is not registered, and must be."""
+        if not self._reject_unregistered:
+            return
+
+        if normalize_query_text(query) not in self._registered_queries:
+            raise UnregisteredQueryError(
+                u'Only registered queries may be executed. Send the "query_id" of one of the '
+                u'{} registered queries instead of the query text.'.format(len(self)))
@@ -0,0 +1,316 @@
+# Copyright 2017 Kensho Technologies, Inc.
+"""Caches that let repeated GraphQL queries skip work the server has already done."""
+from collections import OrderedDict, namedtuple
+import hashlib
+import json
+import re
+import threading
+from uuid import uuid4
+
+from graphql_compiler import (compile_graphql_to_match, insert_arguments_into_query,
+                              pretty_print_graphql)
+from graphql_compiler.debugging_utils import pretty_print_match
+import six
+
+from game_of_graphql.metrics import PhaseTimer
+from game_of_graphql.single_flight import SingleFlight
+
+
+class LRUCache(object):
+    """A thread-safe dict-like cache that evicts the least-recently-used entries when full."""
+
+    def __init__(self, max_weight, weigher=None):
+        """Create a cache whose entries' total weight never exceeds "max_weight".
+
+        Args:
+            max_weight: int, maximum total weight of all cached entries
+            weigher: optional function, value -> int weight of that value. If not provided,
+                     every entry weighs 1, i.e. max_weight is the maximum number of entries.
+        """
+        if max_weight < 1:
+            raise ValueError(u'Cache size must be at least 1, got: {}'.format(max_weight))
+
+        self._max_weight = max_weight
+        self._weigher = weigher if weigher is not None else (lambda value: 1)
+        self._entries = OrderedDict()  # key -> (value, weight)
+        self._weight = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def get(self, key, default=None):
+        """Return the value cached under the given key, or the default if there is none."""
+        with self._lock:
+            if key not in self._entries:
+                self._misses += 1
+                return default
+
+            self._hits += 1
+            entry = self._entries.pop(key)
+            self._entries[key] = entry
+            return entry[0]
+
+    def put(self, key, value):
+        """Cache the value under the given key, evicting old entries if necessary.
+
+        Values that alone weigh more than the whole cache may hold are not cached.
+        """
+        weight = self._weigher(value)
+        if weight > self._max_weight:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                _, old_weight = self._entries.pop(key)
+                self._weight -= old_weight
+
+            self._entries[key] = (value, weight)
+            self._weight += weight
+
+            while self._weight > self._max_weight:
+                _, (_, evicted_weight) = self._entries.popitem(last=False)
+                self._weight -= evicted_weight
+                self._evictions += 1
+
+    def clear(self):
+        """Remove all entries from the cache."""
+        with self._lock:
+            self._entries.clear()
+            self._weight = 0
+
+    def stats(self):
+        """Return a dict of cache counters and current occupancy."""
+        with self._lock:
+            return {
+                'hits': self._hits,
+                'misses': self._misses,
+                'evictions': self._evictions,
+                'entries': len(self._entries),
+                'weight': self._weight,
+                'max_weight': self._max_weight,
+            }
+
+
+CompiledQuery = namedtuple('CompiledQuery', (
+    'compilation_result',     # CompilationResult whose query still has argument placeholders
+    'supplied_graphql',       # str, the pretty-printed GraphQL query
+    'pretty_match_template',  # str, the pretty-printed MATCH query with argument placeholders
+    'input_metadata',         # dict, argument name -> name of its GraphQL type
+    'output_metadata',        # dict, output name -> dict with "type" and "optional" keys
+    'fingerprint',            # str, short identifier of the normalized GraphQL query text
+    'estimated_cost',         # float, estimated cost of executing the query, or None
+))
+
+
+# A GraphQL string literal, or a run of whitespace and comments. Comments end at the end of
+# their line, and so do string literals, which may contain escaped quotes.
+_STRING_OR_IGNORED_TEXT_PATTERN = re.compile(
+    r'"(?:[^"\\\n\r]|\\.)*"|(?:\s|#[^\n\r]*)+', re.UNICODE)
+
+
+def _normalize_query_token(match):
+    """Return the string literal matched unchanged, or a single space for ignored text."""
+    text = match.group(0)
+    return text if text.startswith(u'"') else u' '
+
+
+def normalize_query_text(query):
+    """Drop comments and collapse whitespace in the GraphQL query, leaving string literals intact.
+
+    Comments are dropped before whitespace is collapsed, since a comment ends at the end of
+    its line, and would otherwise swallow the query text on the lines that follow it.
+    """
+    return _STRING_OR_IGNORED_TEXT_PATTERN.sub(_normalize_query_token, query).strip()
+
+
+def get_query_fingerprint(query):
+    """Return a short identifier of the GraphQL query, the same for all equivalent formattings."""
+    normalized_query = normalize_query_text(query)
+    return hashlib.sha256(normalized_query.encode('utf-8')).hexdigest()[:12]
+
+
+def compile_query(schema, query, timer=None, rewrite_query=None, estimate_cost=None):
+    """Parse, validate and compile the GraphQL query, without inserting any arguments.
+
+    If a PhaseTimer is provided, the time spent compiling and pretty-printing is recorded in it.
+    If a rewrite_query function is provided, the GraphQL query it returns for the query is
+    compiled instead, while the supplied GraphQL and the fingerprint remain the original ones.
+    If an estimate_cost function is provided, the cost it returns for the compiled GraphQL query
+    is recorded as the estimated cost.
+    """
+    timer = timer if timer is not None else PhaseTimer()
+
+    executed_query = query
+    if rewrite_query is not None:
+        with timer.phase('rewrite'):
+            executed_query = rewrite_query(query)
+
+    with timer.phase('compile'):
+        compilation_result = compile_graphql_to_match(schema, executed_query)
+
+    with timer.phase('pretty_print'):
+        supplied_graphql = pretty_print_graphql(query)
+        pretty_match_template = pretty_print_match(compilation_result.query)
+
+    estimated_cost = None
+    if estimate_cost is not None:
+        with timer.phase('estimate_cost'):
+            estimated_cost = estimate_cost(executed_query)
+
+    return CompiledQuery(
+        compilation_result=compilation_result,
+        supplied_graphql=supplied_graphql,
+        pretty_match_template=pretty_match_template,
+        # GraphQL types are stored by name, so that responses are JSON-encoded without
+        # falling back to Python code for any of their values.
+        input_metadata={
+            key: six.text_type(value)
+            for key, value in compilation_result.input_metadata.items()
+        },
+        output_metadata={
+            # Named tuples JSON-encode to lists. Make them a proper dict.
+            key: {'type': six.text_type(value.type), 'optional': value.optional}
+            for key, value in compilation_result.output_metadata.items()
+        },
+        fingerprint=get_query_fingerprint(query),
+        estimated_cost=estimated_cost,
+    )
+
+
+BoundQuery = namedtuple('BoundQuery', (
+    'compiled_query',      # CompiledQuery that the arguments were inserted into
+    'args',                # dict, argument name -> argument value
+    'match_query',         # str, the executable MATCH query
+    'pretty_match_query',  # str, the pretty-printed MATCH query
+))
+
+
+def bind_arguments(compiled_query, args):
+    """Return a BoundQuery with the arguments inserted into the compiled query."""
+    compilation_result = compiled_query.compilation_result
+    match_query = insert_arguments_into_query(compilation_result, args)
+    pretty_match_query = insert_arguments_into_query(
+        compilation_result._replace(query=compiled_query.pretty_match_template), args)
+    return BoundQuery(compiled_query, args, match_query, pretty_match_query)
+
+
+def get_query_key(bound_query):
+    """Return a string uniquely identifying the given BoundQuery's MATCH query and arguments."""
+    canonical_args = json.dumps(
+        bound_query.args, sort_keys=True, separators=(',', ':'), default=repr)
+    key_text = u'{}\n{}'.format(bound_query.match_query, canonical_args)
+    return hashlib.sha256(key_text.encode('utf-8')).hexdigest()
+
+
+class CompiledQueryCache(object):
+    """Cache compiled MATCH query templates, keyed on the normalized GraphQL query text."""
+
+    def __init__(self, schema, max_size=256, rewrite_query=None, estimate_cost=None):
+        """Create a cache of at most "max_size" queries compiled against the given schema.
+
+        If a rewrite_query function is provided, it is applied to each query before compiling
+        it. If an estimate_cost function is provided, it estimates the cost of each compiled
+        query. See compile_query().
+        """
+        self._schema = schema
+        self._rewrite_query = rewrite_query
+        self._estimate_cost = estimate_cost
+        self._cache = LRUCache(max_size)
+        self._single_flight = SingleFlight()
+        self._lock = threading.Lock()
+
+    def _compile_and_cache(self, key, query, timer):
+        """Compile the GraphQL query, cache it under the given key, and return it."""
+        rewrite_query = self._rewrite_query
+        compiled_query = compile_query(
+            self._schema, query, timer=timer, rewrite_query=rewrite_query,
+            estimate_cost=self._estimate_cost)
+        with self._lock:
+            # A query compiled with a rewrite that was replaced meanwhile is not cached.
+            if rewrite_query is self._rewrite_query:
+                self._cache.put(key, compiled_query)
+        return compiled_query
+
+    def get(self, query, timer=None):
+        """Return the CompiledQuery for the given GraphQL query, compiling it if necessary."""
+        key = normalize_query_text(query)
+        compiled_query = self._cache.get(key)
+        if compiled_query is None:
+            # Threads that need the same query compiled at the same time share one compilation.
+            compiled_query, _ = self._single_flight.run(
+                key, self._compile_and_cache, key, query, timer)
+        return compiled_query
+
+    def clear(self):
+        """Remove all compiled queries from the cache."""
+        self._cache.clear()
+
+    def reset(self, rewrite_query=None):
+        """Remove all compiled queries from the cache, and apply the given rewrite from now on."""
+        with self._lock:
+            self._rewrite_query = rewrite_query
+            self._cache.clear()
+
+    def stats(self):
+        """Return a dict of cache counters and current occupancy.
+
+        The "coalesced" counter is the number of compilations saved by sharing them among
+        threads that needed the same query compiled at the same time.
+        """
+        result = self._cache.stats()
+        result['coalesced'] = self._single_flight.stats()['coalesced']
+        return result
+
+
+def _estimate_size(rows):
+    """Return the approximate size in bytes of the given result rows."""
+    return len(json.dumps(rows, default=repr))
+
+
+class ResultCache(object):
+    """Cache query results, for use while the queried graph does not change.
+
+    Entries are tagged with the current graph generation, and invalidating the cache
+    whenever the graph changes starts a new generation.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        """Create a cache whose results add up to roughly "max_bytes" of JSON at most."""
+        self._cache = LRUCache(max_bytes, weigher=_estimate_size)
+        self._generation = uuid4().hex
+
+    @property
+    def generation(self):
+        """Return the identifier of the current graph generation."""
+        return self._generation
+
+    def etag(self, bound_query):
+        """Return the entity tag identifying the result of the given BoundQuery."""
+        # The graph does not change within a generation, so this tag identifies the result
+        # even when the result itself is not (or no longer) in the cache.
+        tag_text = u'{}:{}'.format(self._generation, get_query_key(bound_query))
+        return hashlib.sha256(tag_text.encode('utf-8')).hexdigest()[:40]
+
+    def get(self, bound_query):
+        """Return the cached result rows of the given BoundQuery, or None if not cached."""
+        return self._cache.get((self._generation, get_query_key(bound_query)))
+
+    def put(self, bound_query, rows, generation=None):
+        """Cache the result rows of the given BoundQuery, read in the given graph generation.
+
+        If no generation is given, the rows are cached for the current generation. Rows cached
+        for an older generation are never returned, so results read from the graph before
+        it changed do not outlive their generation.
+        """
+        generation = generation if generation is not None else self._generation
+        self._cache.put((generation, get_query_key(bound_query)), rows)
+
+    def invalidate(self, generation=None):
+        """Drop all cached results and start a new graph generation, e.g. after a rebuild."""
+        self._generation = generation if generation is not None else uuid4().hex
+        self._cache.clear()
+
+    def stats(self):
+        """Return a dict of cache counters and current occupancy."""
+        return self._cache.stats()
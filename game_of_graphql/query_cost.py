@@ -0,0 +1,150 @@
+# Copyright 2017 Kensho Technologies, Inc.
+"""Estimate how expensive a GraphQL query is to execute, before executing it."""
+from graphql import parse
+from graphql.language.ast import InlineFragment
+import six
+
+from game_of_graphql.new_dataset import EDGE_CLASS_BY_DATA_KEY, REGION_ANCESTRY_EDGE_CLASS
+from game_of_graphql.query_rewriting import get_named_type_name, get_recurse_depth
+
+
+# The vertex properties that are indexed, and the filters that can look vertices up by them.
+_INDEXED_PROPERTIES = frozenset({'name', 'alias', 'uuid'})
+_INDEXED_FILTER_OPS = frozenset({'=', 'in_collection'})
+
+# Vertex-level filters that look vertices up by their indexed properties.
+_INDEXED_VERTEX_FILTER_OPS = frozenset({'name_or_alias'})
+
+
+class QueryCostError(ValueError):
+    """Raised when a query's estimated cost exceeds the server's budget."""
+
+
+def compute_graph_statistics(data, region_ancestry):
+    """Return the vertex and edge counts that query costs are estimated from.
+
+    Args:
+        data: dict, the data returned by existing_dataset.load_all_data()
+        region_ancestry: set, the region ancestry returned by new_dataset.compute_region_ancestry()
+
+    Returns:
+        tuple (dict, GraphQL type name -> number of vertices of that type;
+               dict, edge class name -> number of edges of that class)
+    """
+    vertex_counts = {
+        'Character': len(data['characters']),
+        'NobleHouse': len(data['houses']),
+        'Region': len(data['regions']),
+    }
+    vertex_counts['CharacterOrHouse'] = vertex_counts['Character'] + vertex_counts['NobleHouse']
+
+    edge_counts = {
+        edge_class: len(data[key])
+        for key, edge_class in six.iteritems(EDGE_CLASS_BY_DATA_KEY)
+    }
+    edge_counts[REGION_ANCESTRY_EDGE_CLASS] = len(region_ancestry)
+    return vertex_counts, edge_counts
+
+
+def _get_filter_ops(field):
+    """Return the set of filter operations applied by the field's @filter directives."""
+    ops = set()
+    for directive in field.directives or ():
+        if directive.name.value == 'filter':
+            for argument in directive.arguments:
+                if argument.name.value == 'op_name':
+                    ops.add(argument.value.value)
+    return ops
+
+
+class QueryCostEstimator(object):
+    """Estimate the number of vertices a query visits, from the size of the graph.
+
+    The estimate assumes every vertex has the average number of edges of each class, and that
+    only filters on indexed properties of the root vertex narrow down the vertices visited.
+    It is meant for telling cheap queries from expensive ones, and not for predicting timings.
+    """
+
+    def __init__(self, schema, vertex_counts, edge_counts):
+        """Create an estimator for queries against the given schema and graph statistics.
+
+        Args:
+            schema: GraphQL schema object, the schema queries are compiled against
+            vertex_counts: dict, GraphQL type name -> number of vertices of that type
+            edge_counts: dict, edge class name -> number of edges of that class
+        """
+        self._schema = schema
+        self._vertex_counts = vertex_counts
+        self._edge_counts = edge_counts
+
+    def _get_fanout(self, type_name, edge_class):
+        """Return the average number of edges of the class per vertex of the type."""
+        return float(self._edge_counts.get(edge_class, 0)) / max(
+            1, self._vertex_counts.get(type_name, 0))
+
+    def _estimate_traversal_visits(self, type_name, field, target_type_name):
+        """Return the number of vertices a traversal visits, per vertex it starts from."""
+        _, edge_class = field.name.value.split('_', 1)
+        fanout = self._get_fanout(type_name, edge_class)
+        depth = get_recurse_depth(field)
+        if depth is None:
+            return fanout
+
+        # A recursion visits the vertex it starts from, and the vertices at each depth.
+        visits = sum(fanout ** distance for distance in six.moves.xrange(depth + 1))
+        return min(visits, max(1, self._vertex_counts.get(target_type_name, 1)))
+
+    def _estimate_scope_visits(self, type_name, selection_set, vertex_count):
+        """Return the number of vertices visited by the traversals within a vertex scope.
+
+        Args:
+            type_name: str, the GraphQL type of the vertices in the scope
+            selection_set: the scope's SelectionSet AST node, or None
+            vertex_count: float, the estimated number of vertices in the scope
+
+        Returns:
+            float, the estimated number of vertices visited within the scope
+        """
+        if selection_set is None:
+            return 0.0
+
+        visits = 0.0
+        graphql_type = self._schema.get_type(type_name)
+        for selection in selection_set.selections:
+            if isinstance(selection, InlineFragment):
+                coerced_type_name = selection.type_condition.name.value
+                coerced_fraction = min(1.0, float(self._vertex_counts.get(coerced_type_name, 0)) /
+                                       max(1, self._vertex_counts.get(type_name, 0)))
+                visits += self._estimate_scope_visits(
+                    coerced_type_name, selection.selection_set, vertex_count * coerced_fraction)
+            elif selection.name.value.startswith(('in_', 'out_')):
+                target_type_name = get_named_type_name(
+                    graphql_type.fields[selection.name.value].type)
+                target_count = vertex_count * self._estimate_traversal_visits(
+                    type_name, selection, target_type_name)
+                visits += target_count + self._estimate_scope_visits(
+                    target_type_name, selection.selection_set, target_count)
+        return visits
+
+    def _estimate_root_vertex_count(self, root_field):
+        """Return the estimated number of vertices the query starts from."""
+        if _get_filter_ops(root_field) & _INDEXED_VERTEX_FILTER_OPS:
+            return 1.0
+
+        for selection in root_field.selection_set.selections:
+            if (not isinstance(selection, InlineFragment) and
+                    selection.name.value in _INDEXED_PROPERTIES and
+                    _get_filter_ops(selection) & _INDEXED_FILTER_OPS):
+                return 1.0
+
+        return float(self._vertex_counts.get(root_field.name.value, 0))
+
+    def estimate(self, query):
+        """Return the estimated number of vertices visited by the GraphQL query."""
+        cost = 0.0
+        for definition in parse(query).definitions:
+            for root_field in definition.selection_set.selections:
+                vertex_count = self._estimate_root_vertex_count(root_field)
+                cost += vertex_count + self._estimate_scope_visits(
+                    root_field.name.value, root_field.selection_set, vertex_count)
+        return cost
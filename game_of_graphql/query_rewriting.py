@@ -0,0 +1,199 @@
+# Copyright 2017 Kensho Technologies, Inc.
+"""Rewrite GraphQL queries into equivalent ones that are cheaper to execute."""
+from graphql import parse
+from graphql.language.ast import Field, InlineFragment, Name
+from graphql.language.printer import print_ast
+
+
+COUNT_FIELD_NAME = '_x_count'
+
+# Directives that change the meaning of filters within the scope of the field they are on.
+_SCOPE_CHANGING_DIRECTIVES = frozenset({'fold', 'optional', 'recurse'})
+
+
+def _iterate_fields(selection_set):
+    """Yield every field in the selection set, including fields nested at any depth within it."""
+    if selection_set is None:
+        return
+
+    for selection in selection_set.selections:
+        if getattr(selection, 'name', None) is not None:
+            yield selection
+        for field in _iterate_fields(selection.selection_set):
+            yield field
+
+
+def get_named_type_name(graphql_type):
+    """Return the name of the type, unwrapping any list or non-null wrappers around it."""
+    while hasattr(graphql_type, 'of_type'):
+        graphql_type = graphql_type.of_type
+    return graphql_type.name
+
+
+def _get_directive_names(field):
+    """Return the list of names of the field's directives."""
+    return [directive.name.value for directive in field.directives or ()]
+
+
+def compose_rewrites(rewrites):
+    """Return a function that rewrites a GraphQL query with each of the rewrites, in order."""
+    def rewrite_query(query):
+        """Return the query, rewritten by each of the rewrites in turn."""
+        for rewrite in rewrites:
+            query = rewrite(query)
+        return query
+    return rewrite_query
+
+
+def get_recurse_depth(field):
+    """Return the depth of the field's @recurse directive, or None if it does not have one."""
+    for directive in field.directives or ():
+        if directive.name.value == 'recurse':
+            for argument in directive.arguments:
+                if argument.name.value == 'depth':
+                    return int(argument.value.value)
+    return None
+
+
+def rewrite_recursion_as_closure(query, edge_class, closure_edge_class, max_depth):
+    """Replace deep enough recursions over the edge class with a single hop over its closure.
+
+    Args:
+        query: str, GraphQL query
+        edge_class: str, name of the edge class whose recursions may be rewritten
+        closure_edge_class: str, name of the edge class connecting each vertex to itself and
+                            to all vertices reachable from it through edge_class edges
+        max_depth: int, the largest number of edge_class edges on the shortest path between
+                   any vertex and any vertex reachable from it. Recursions of at least this
+                   depth reach all reachable vertices, and are rewritten.
+
+    Returns:
+        str, the rewritten GraphQL query, or the original query if nothing was rewritten
+    """
+    document = parse(query)
+    rewritten = False
+    vertex_field_names = {
+        direction + '_' + edge_class: direction + '_' + closure_edge_class
+        for direction in ('out', 'in')
+    }
+    for definition in document.definitions:
+        for field in _iterate_fields(definition.selection_set):
+            closure_field_name = vertex_field_names.get(field.name.value)
+            depth = get_recurse_depth(field)
+            if closure_field_name is not None and depth is not None and depth >= max_depth:
+                field.name.value = closure_field_name
+                field.directives = [
+                    directive
+                    for directive in field.directives
+                    if directive.name.value != 'recurse'
+                ]
+                rewritten = True
+
+    return print_ast(document) if rewritten else query
+
+
+def _get_count_directives(field):
+    """Return the directives of the folded _x_count field, if that is all the fold selects.
+
+    Returns:
+        list of the directives on the _x_count field, if the field is folded, has no other
+        directives, and selects nothing but a filtered or output _x_count field. None otherwise.
+    """
+    if _get_directive_names(field) != ['fold'] or field.selection_set is None:
+        return None
+
+    selections = field.selection_set.selections
+    if (len(selections) != 1 or isinstance(selections[0], InlineFragment) or
+            selections[0].name.value != COUNT_FIELD_NAME or not selections[0].directives):
+        return None
+    return selections[0].directives
+
+
+def _is_vertex_selection(selection):
+    """Return True if the selection is a vertex field or a type coercion, and False otherwise."""
+    return (isinstance(selection, InlineFragment) or
+            selection.name.value.startswith(('out_', 'in_')))
+
+
+def _rewrite_fold_counts_in_scope(schema, type_name, selection_set, get_degree_field_name):
+    """Rewrite the scope's count-only folds in place, returning True if any were rewritten."""
+    graphql_type = schema.get_type(type_name)
+    selections = []
+    degree_fields = []
+    rewritten = False
+    for selection in selection_set.selections:
+        if isinstance(selection, InlineFragment):
+            rewritten |= _rewrite_fold_counts_in_scope(
+                schema, selection.type_condition.name.value, selection.selection_set,
+                get_degree_field_name)
+            selections.append(selection)
+            continue
+
+        field_name = selection.name.value
+        if not _is_vertex_selection(selection):
+            selections.append(selection)
+            continue
+
+        count_directives = _get_count_directives(selection)
+        if count_directives is not None:
+            direction, edge_class = field_name.split('_', 1)
+            degree_field_name = get_degree_field_name(direction, edge_class)
+            if degree_field_name in graphql_type.fields:
+                degree_fields.append(
+                    Field(name=Name(value=degree_field_name), directives=count_directives))
+                rewritten = True
+                continue
+
+        if not _SCOPE_CHANGING_DIRECTIVES.intersection(_get_directive_names(selection)):
+            rewritten |= _rewrite_fold_counts_in_scope(
+                schema, get_named_type_name(graphql_type.fields[field_name].type),
+                selection.selection_set, get_degree_field_name)
+        selections.append(selection)
+
+    if degree_fields:
+        # Property fields must come before all vertex fields and type coercions in a scope.
+        index = next((
+            index
+            for index, selection in enumerate(selections)
+            if _is_vertex_selection(selection)
+        ), len(selections))
+        selections[index:index] = degree_fields
+        selection_set.selections = selections
+
+    return rewritten
+
+
+def rewrite_fold_counts_as_degrees(query, schema, get_degree_field_name):
+    """Replace folds that only count their vertices with filters on precomputed degree fields.
+
+    A fold that selects nothing but its _x_count field, such as
+        out_Owes_Allegiance_To @fold {
+            _x_count @filter(op_name: ">=", value: ["$min_allegiances"])
+        }
+    is replaced by the degree property field holding the same count, with the same directives:
+        degree_out_Owes_Allegiance_To @filter(op_name: ">=", value: ["$min_allegiances"])
+    Folds within @fold, @optional or @recurse scopes are left as they are, since filters
+    within those scopes do not filter the results the same way. Only untyped folds that select
+    nothing else are rewritten: a degree counts all of the vertex's edges of the class, whatever
+    the type of the vertex at their other end, so folds with a type coercion are left as they
+    are, and so are folds that output any fields, since they traverse the edges regardless.
+
+    Args:
+        query: str, GraphQL query
+        schema: GraphQL schema object, the schema the query is compiled against
+        get_degree_field_name: function, (direction, edge class name) -> name of the property
+                               field holding the number of the vertex's edges of that class in
+                               that direction. Folds are only rewritten if the type of the
+                               vertex they start from has that field.
+
+    Returns:
+        str, the rewritten GraphQL query, or the original query if nothing was rewritten
+    """
+    document = parse(query)
+    rewritten = False
+    for definition in document.definitions:
+        for root_field in definition.selection_set.selections:
+            rewritten |= _rewrite_fold_counts_in_scope(
+                schema, root_field.name.value, root_field.selection_set, get_degree_field_name)
+
+    return print_ast(document) if rewritten else query
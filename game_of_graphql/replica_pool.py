@@ -0,0 +1,173 @@
+# Copyright 2017 Kensho Technologies, Inc.
+"""Spread OrientDB sessions across several replicas of the same database."""
+from contextlib import contextmanager
+import logging
+import socket
+import threading
+
+from pyorient import OrientDB, PyOrientConnectionException, PyOrientException
+
+from game_of_graphql.connection_pool import OrientDBConnectionPool
+
+
+logger = logging.getLogger(__name__)
+
+# The errors raised when a replica cannot be reached, or its connection breaks mid-query.
+CONNECTION_ERRORS = (PyOrientConnectionException, socket.error)
+
+
+def get_replica_name(config):
+    """Return the "host:port" name of the OrientDB replica described by the config."""
+    return u'{}:{}'.format(config.host, config.port)
+
+
+def check_replica_health(config):
+    """Return True if the replica accepts connections and has the database, and False otherwise."""
+    client = OrientDB(config.host, config.port, config.serialization_type)
+    try:
+        client.connect(config.user, config.cred)
+        return bool(client.db_exists(config.db_name, config.storage))
+    except CONNECTION_ERRORS + (PyOrientException,):
+        return False
+    finally:
+        try:
+            client.close()
+        except CONNECTION_ERRORS + (PyOrientException,) as e:
+            logger.debug(u'Ignoring an error while closing an OrientDB client: %s', e)
+
+
+class _Replica(object):
+    """The session pool of one replica, and the state used to route queries to it."""
+
+    def __init__(self, config, pool):
+        """Create the routing state of a replica that is assumed healthy until checked."""
+        self.config = config
+        self.name = get_replica_name(config)
+        self.pool = pool
+        self.outstanding = 0
+        self.healthy = True
+        self.ejections = 0
+
+
+class ReplicatedConnectionPool(object):
+    """Hand out sessions to the least-busy healthy replica, with the OrientDBConnectionPool API.
+
+    Each session is checked out from the healthy replica with the fewest sessions in use.
+    A replica is ejected when one of its connections fails, or when it fails a health check,
+    and is only used again once it passes a health check. If no replica is healthy, sessions
+    are still handed out, so that queries fail fast instead of waiting.
+    """
+
+    def __init__(self, configs, size=8, checkout_timeout=10.0, health_check_interval=30.0):
+        """Create a pool of at most "size" sessions to each of the replicas described by configs.
+
+        Args:
+            configs: list of pyorient.ogm.Config objects, each describing the same database
+                     on a different replica
+            size: int, maximum number of sessions kept open to each replica
+            checkout_timeout: float, seconds to wait for a free session before giving up
+            health_check_interval: float, seconds between health checks of every replica.
+                                   Idle sessions are also checked for liveness after this long,
+                                   as in OrientDBConnectionPool.
+        """
+        if not configs:
+            raise ValueError(u'At least one replica is required.')
+
+        self._replicas = [
+            _Replica(config, OrientDBConnectionPool(
+                config, size=size, checkout_timeout=checkout_timeout,
+                health_check_interval=health_check_interval))
+            for config in configs
+        ]
+        self._lock = threading.Lock()
+        self._next_index = 0
+
+        self._health_check_interval = health_check_interval
+        self._stopped = threading.Event()
+        self._health_check_thread = threading.Thread(
+            target=self._run_health_checks, name='replica_health_checks')
+        self._health_check_thread.daemon = True
+        self._health_check_thread.start()
+
+    def _run_health_checks(self):
+        """Check the health of every replica periodically, until the pool is closed."""
+        while not self._stopped.wait(self._health_check_interval):
+            for replica in self._replicas:
+                healthy = check_replica_health(replica.config)
+                if not healthy:
+                    self._eject(replica)
+                else:
+                    with self._lock:
+                        replica.healthy = True
+
+    def _eject(self, replica):
+        """Stop routing sessions to the replica, until it passes a health check."""
+        with self._lock:
+            if replica.healthy:
+                replica.healthy = False
+                replica.ejections += 1
+
+    def _acquire_replica(self):
+        """Return the replica to check out the next session from, counting it as in use."""
+        with self._lock:
+            # Starting the search at a different replica each time spreads the sessions evenly
+            # across equally busy replicas.
+            start = self._next_index
+            self._next_index = (self._next_index + 1) % len(self._replicas)
+            candidates = self._replicas[start:] + self._replicas[:start]
+
+            healthy_candidates = [replica for replica in candidates if replica.healthy]
+            replica = min(healthy_candidates or candidates, key=lambda x: x.outstanding)
+            replica.outstanding += 1
+        return replica
+
+    def _release_replica(self, replica):
+        """Count a session checked out by _acquire_replica() as no longer in use."""
+        with self._lock:
+            replica.outstanding -= 1
+
+    @contextmanager
+    def connection(self):
+        """Check out a client for the duration of the "with" block, then return it to the pool.
+
+        If connecting to the replica fails, or the connection breaks during the "with" block,
+        the replica is ejected, and later checkouts use the other replicas.
+        """
+        replica = self._acquire_replica()
+        try:
+            with replica.pool.connection() as client:
+                yield client
+        except CONNECTION_ERRORS:
+            self._eject(replica)
+            raise
+        finally:
+            self._release_replica(replica)
+
+    def stats(self):
+        """Return a dict of pool counters and current occupancy, summed over all replicas.
+
+        The dict also has a "replicas" list, of a dict of the name, health, number of sessions
+        in use and number of ejections of each replica.
+        """
+        result = {}
+        for replica in self._replicas:
+            for key, value in replica.pool.stats().items():
+                result[key] = result.get(key, 0) + value
+
+        with self._lock:
+            result['replicas'] = [
+                {
+                    'name': replica.name,
+                    'healthy': replica.healthy,
+                    'outstanding': replica.outstanding,
+                    'ejections': replica.ejections,
+                }
+                for replica in self._replicas
+            ]
+        return result
+
+    def close(self):
+        """Stop the health checks, and close all idle sessions of every replica."""
+        self._stopped.set()
+        for replica in self._replicas:
+            replica.pool.close()
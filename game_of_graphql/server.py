@@ -1,26 +1,88 @@
 # Copyright 2017 Kensho Technologies, Inc.
 """Server that can compile and execute GraphQL queries."""
+from collections import namedtuple
+from functools import partial
+from itertools import islice
 import json
-from os import path
+import multiprocessing
+from os import getpid, path
+import socket
+import threading
+import time
+import zlib
 
 import click
-from flask import Flask, abort, request
+from flask import Flask, Response, abort, make_response, request
 from flask_cors import CORS, cross_origin
 from graphql import parse
-from graphql.type.definition import GraphQLType
 from graphql.utils.build_ast_schema import build_ast_schema
-from graphql_compiler import graphql_to_match, pretty_print_graphql
-from graphql_compiler.debugging_utils import pretty_print_match
-from pyorient import OrientDB
+from pyorient import PyOrientException
 from pyorient.ogm import Config
 import six
 
-from game_of_graphql import tools
+from game_of_graphql import new_dataset, serving, tools
+from game_of_graphql.admission import AdmissionController, AdmissionRejectedError
+from game_of_graphql.connection_pool import ConnectionPoolTimeout, OrientDBConnectionPool
+from game_of_graphql.execution import QueryExecutor
+from game_of_graphql.memory_backend import InMemoryGraph, QueryDeadlineError
+from game_of_graphql.metrics import (PROMETHEUS_CONTENT_TYPE, MetricsRegistry, PhaseTimer,
+                                     render_samples)
+from game_of_graphql.pagination import (InvalidCursorError, decode_cursor, encode_cursor,
+                                        get_page_query)
+from game_of_graphql.persisted_queries import (QueryRegistry, UnknownQueryIdError,
+                                               UnregisteredQueryError, read_query_registry_file)
+from game_of_graphql.query_cache import (CompiledQueryCache, ResultCache, bind_arguments,
+                                         get_query_key)
+from game_of_graphql.query_cost import QueryCostError, QueryCostEstimator, compute_graph_statistics
+from game_of_graphql.query_rewriting import (compose_rewrites, rewrite_fold_counts_as_degrees,
+                                             rewrite_recursion_as_closure)
+from game_of_graphql.replica_pool import CONNECTION_ERRORS, ReplicatedConnectionPool
+from game_of_graphql.single_flight import SingleFlight
+from game_of_graphql.slow_queries import SlowQueryLog
+from game_of_graphql.streaming import stream_query_rows
 
 
 app = Flask('game_of_graphql')
 CORS(app, send_wildcard=True)
 graph_config = None
+memory_graph = None
+connection_pool = None
+query_executor = None
+batch_executor = None
+compiled_query_cache = None
+result_cache = None
+max_page_size = 1000
+max_batch_size = 100
+max_query_cost = None
+query_timeout = None
+admission_controller = None
+query_single_flight = None
+query_registry = None
+slow_query_log = None
+slow_query_executor = None
+dataset_check_interval = None
+serve_metrics = True
+
+metrics_registry = MetricsRegistry()
+phase_histogram = metrics_registry.histogram(
+    'game_of_graphql_query_phase_seconds',
+    'Time spent in each phase of handling a GraphQL query.',
+    ('query_fingerprint', 'phase'))
+
+# Label values that are never reused bloat the metrics, so only this many distinct
+# query fingerprints get their own label value, and all others share one.
+MAX_FINGERPRINT_LABELS = 200
+_seen_fingerprints = set()
+_seen_fingerprints_lock = threading.Lock()
+
+# The graph is checked for changes made by others, e.g. by a sync, at most once per
+# dataset_check_interval seconds, by whichever request first finds the check due.
+_next_dataset_check_time = 0.0
+_dataset_check_lock = threading.Lock()
+
+# Without a query timeout, a request waits at most this many seconds for another request's
+# execution of the same query, before executing the query itself.
+MAX_UNTIMED_COALESCED_WAIT = 300.0
 
 
 def _load_schema():
@@ -39,7 +101,21 @@ WELCOME_TEXT = '''Hello world!
 
 Try sending a POST to the /graphql endpoint, with a JSON dict payload:
     query: a GraphQL query string to compile and execute
+    query_id: the id of a query registered with the server, to execute instead of sending
+              the query string
     args: a dict, argument name -> argument value, to insert into the query
+    page_size: optional int, the maximum number of result rows to return
+    cursor: optional string, the "next_cursor" of a previous response, to get the next page
+    stream: optional bool, if true, send result rows as they are read from the database
+    timings: optional bool, if true, include the time spent in each phase of the query
+    format: optional string, "rows" (the default) to send result rows as a list of dicts,
+            or "columnar" to send a dict of output name -> list of that output's values
+    echo_query: optional bool, if false, leave the supplied GraphQL and executed MATCH query
+                out of the response
+
+Responses are compressed if the request's Accept-Encoding header allows gzip or deflate.
+
+To execute many queries at once, POST a JSON list of such dicts to the /graphql/batch endpoint.
 
 Enjoy!
 '''
@@ -51,80 +127,872 @@ def root():
     return WELCOME_TEXT
 
 
+class InvalidRequestError(ValueError):
+    """Raised when the data describing a query to execute is missing or malformed."""
+
+
+class QueryTimeoutError(RuntimeError):
+    """Raised when a query is still executing once the query timeout has passed."""
+
+
+QueryRequest = namedtuple('QueryRequest', (
+    'query', 'query_id', 'args', 'page_size', 'cursor', 'stream', 'timings', 'output_format',
+    'echo_query'
+))
+
+ROWS_FORMAT = 'rows'
+COLUMNAR_FORMAT = 'columnar'
+
+# The response fields that echo the query back, for debugging.
+QUERY_ECHO_FIELDS = ('supplied_graphql', 'executed_match_query')
+
+# Responses smaller than this are not worth the time it takes to compress them.
+MIN_COMPRESSED_RESPONSE_BYTES = 1024
+COMPRESSION_LEVEL = 6
+_COMPRESSION_WINDOW_BITS = {
+    'gzip': 16 + zlib.MAX_WBITS,
+    'deflate': zlib.MAX_WBITS,
+}
+
+# Every response is made of JSON-native values only, so a single reusable encoder
+# serializes them without any per-call setup, and without whitespace between tokens.
+_json_encoder = json.JSONEncoder(separators=(',', ':'))
+
+
+def _parse_query_request(data):
+    """Sanitize the data describing a query to execute, and return it as a QueryRequest."""
+    if not data or not isinstance(data, dict):
+        raise InvalidRequestError(u'No data received: {}'.format(data))
+
+    query = data.get('query', None)
+    query_id = data.get('query_id', None)
+    if query_id is not None:
+        if query is not None:
+            raise InvalidRequestError(u'Received both a query and a query_id, expected one.')
+        if not query_id or not isinstance(query_id, six.string_types):
+            raise InvalidRequestError(u'No valid query_id received: {}'.format(query_id))
+    elif not query or not isinstance(query, six.string_types):
+        raise InvalidRequestError(u'No valid query data received: {}'.format(query))
+
+    args = data.get('args', None)
+    if args is None or not isinstance(args, dict):  # empty dict args is valid
+        raise InvalidRequestError(u'No valid args data received: {}'.format(args))
+
+    stream = data.get('stream', False)
+    if not isinstance(stream, bool):
+        raise InvalidRequestError(u'No valid stream flag received: {}'.format(stream))
+
+    # Streamed results are not held in memory, so they need not be paginated by default.
+    page_size = data.get('page_size', None if stream else max_page_size)
+    if page_size is None and not stream:
+        raise InvalidRequestError(u'A page_size is required unless the results are streamed.')
+    if page_size is not None and (
+            not isinstance(page_size, six.integer_types) or isinstance(page_size, bool) or
+            not 0 < page_size <= max_page_size):
+        raise InvalidRequestError(u'No valid page_size received: {}'.format(page_size))
+
+    cursor = data.get('cursor', None)
+    if cursor is not None and not isinstance(cursor, six.string_types):
+        raise InvalidRequestError(u'No valid cursor received: {}'.format(cursor))
+
+    timings = data.get('timings', False)
+    if not isinstance(timings, bool):
+        raise InvalidRequestError(u'No valid timings flag received: {}'.format(timings))
+
+    output_format = data.get('format', ROWS_FORMAT)
+    if output_format not in (ROWS_FORMAT, COLUMNAR_FORMAT):
+        raise InvalidRequestError(u'No valid format received: {}'.format(output_format))
+    if stream and output_format == COLUMNAR_FORMAT:
+        raise InvalidRequestError(u'Streamed results cannot be sent in the columnar format.')
+
+    echo_query = data.get('echo_query', True)
+    if not isinstance(echo_query, bool):
+        raise InvalidRequestError(u'No valid echo_query flag received: {}'.format(echo_query))
+
+    return QueryRequest(
+        query, query_id, args, page_size, cursor, stream, timings, output_format, echo_query)
+
+
+def _bind_query_request(query_request, timer):
+    """Return the (BoundQuery, results offset) tuple for the given QueryRequest."""
+    _check_dataset_generation()
+
+    if query_request.query_id is not None:
+        if query_registry is None:
+            raise UnknownQueryIdError(u'No queries are registered with the server.')
+        compiled_query = query_registry.get(query_request.query_id)
+    else:
+        if query_registry is not None:
+            query_registry.check_query_text(query_request.query)
+        compiled_query = compiled_query_cache.get(query_request.query, timer=timer)
+
+    if max_query_cost is not None and compiled_query.estimated_cost > max_query_cost:
+        raise QueryCostError(u'The query is estimated to visit {:.0f} vertices, more than the '
+                             u'limit of {:.0f}. Narrow it down with filters, or make its '
+                             u'recursions shallower.'.format(compiled_query.estimated_cost,
+                                                             max_query_cost))
+
+    with timer.phase('bind'):
+        bound_query = bind_arguments(compiled_query, query_request.args)
+
+    offset = 0
+    if query_request.cursor is not None:
+        offset = decode_cursor(bound_query, query_request.cursor, result_cache.generation)
+    return bound_query, offset
+
+
 @app.route('/graphql', methods=['POST'])
 @cross_origin()
 def graphql():
     """Sanitize the input, then execute the provided GraphQL query and return the result."""
-    data = request.get_json(force=True)
-    if not data:
-        app.logger.error(u'No data received: %s', data)
+    try:
+        query_request = _parse_query_request(request.get_json(force=True))
+    except InvalidRequestError as e:
+        app.logger.error(u'%s', e)
         return abort(400)
 
-    query = data.get('query', None)
-    if not query or not isinstance(query, six.string_types):
-        app.logger.error(u'No valid query data received: %s', query)
-        return abort(400)
+    page_size = query_request.page_size
+    encoding = _get_response_encoding()
+    start_time = time.time()
+    timer = PhaseTimer()
 
-    args = data.get('args', None)
-    if args is None or not isinstance(args, dict):  # empty dict args is valid
-        app.logger.error(u'No valid args data received: %s', args)
+    # pylint: disable=broad-except
+    try:
+        bound_query, offset = _bind_query_request(query_request, timer)
+
+        if query_request.stream:
+            with timer.phase('admission'):
+                admission_controller.acquire()
+            try:
+                response = _stream_graphql_query(
+                    bound_query, offset, page_size, timer, start_time, query_request.echo_query)
+            except Exception:
+                admission_controller.release()
+                raise
+            # The query keeps executing while its results are streamed to the client.
+            response.call_on_close(admission_controller.release)
+            return _compress_response(response, encoding)
+
+        # Results do not change within a graph generation, so a client that already has
+        # the result for this query can be told so without running the query again.
+        page_query = _get_page_query(bound_query, offset, page_size)
+        etag = _get_representation_etag(result_cache.etag(page_query), query_request, encoding)
+        if request.if_none_match.contains(etag):
+            response = make_response('', 304)
+        else:
+            result = _run_coalesced_query(
+                page_query, _run_admitted_query, bound_query, offset, page_size, timer)
+            if query_request.timings:
+                # Serialization is still ahead, so it only shows up in the /metrics data.
+                result['timings'] = timer.as_milliseconds()
+
+            with timer.phase('serialize'):
+                response_text = _json_encoder.encode(
+                    _apply_response_options(result, query_request))
+            response = make_response(response_text)
+            with timer.phase('compress'):
+                _compress_response(response, encoding)
+
+        response.set_etag(etag)
+        _observe_query_timings(page_query, timer, start_time)
+        return response
+    except InvalidCursorError as e:
+        app.logger.error(u'Invalid cursor received: %s', e)
+        return str(e), 400, []
+    except UnregisteredQueryError as e:
+        app.logger.error(u'Rejected an unregistered query: %s', e)
+        return str(e), 403, []
+    except UnknownQueryIdError as e:
+        app.logger.error(u'Unknown query id received: %s', e)
+        return str(e), 404, []
+    except QueryCostError as e:
+        app.logger.error(u'Rejected an expensive query: %s', e)
+        return str(e), 413, []
+    except AdmissionRejectedError as e:
+        app.logger.error(u'Rejected a query: %s', e)
+        return str(e), 429, []
+    except ConnectionPoolTimeout as e:
+        app.logger.error(u'Could not get a database session: %s', e)
+        return str(e), 503, []
+    except QueryTimeoutError as e:
+        app.logger.error(u'Query timed out: %s', e)
+        return str(e), 504, []
+    except Exception as e:
+        app.logger.error(u'Encountered an error: %s', e)
+        return str(e), 500, []
+    # pylint: enable=broad-except
+
+
+@app.route('/graphql/batch', methods=['POST'])
+@cross_origin()
+def graphql_batch():
+    """Execute a list of GraphQL queries, returning a list of their results in the same order.
+
+    Each entry of the list is a dict in the same format as the /graphql endpoint accepts,
+    except that results cannot be streamed. Entries are executed in parallel, and any
+    entry that fails produces a dict with an "error" key in place of its results.
+    Each entry is admitted for execution on its own, just like a query sent to /graphql,
+    so an entry turned away by the admission controller fails with its own error.
+    """
+    data = request.get_json(force=True)
+    if not isinstance(data, list):
+        app.logger.error(u'No valid batch data received: %s', data)
         return abort(400)
 
+    if len(data) > max_batch_size:
+        app.logger.error(u'Received a batch of %d queries, the limit is %d',
+                         len(data), max_batch_size)
+        return abort(413)
+
     # pylint: disable=broad-except
     try:
-        return json.dumps(_run_graphql_query(query, args), default=_graphql_type_json_encoder)
+        results = batch_executor.map(_run_batch_entry, data)
+        return _compress_response(
+            make_response(_json_encoder.encode(results)), _get_response_encoding())
     except Exception as e:
         app.logger.error(u'Encountered an error: %s', e)
         return str(e), 500, []
     # pylint: enable=broad-except
 
 
-def _graphql_type_json_encoder(obj):
-    """Encode GraphQL type objects as strings for JSON encoding."""
-    if isinstance(obj, GraphQLType):
-        return six.text_type(obj)
-    else:
-        raise TypeError(u'Cannot encode this object: %s', obj)
+def _run_batch_entry(data):
+    """Execute the query described by one entry of a batch, returning its result or error."""
+    # pylint: disable=broad-except
+    try:
+        query_request = _parse_query_request(data)
+        if query_request.stream:
+            raise InvalidRequestError(u'Queries in a batch cannot be streamed.')
 
+        start_time = time.time()
+        timer = PhaseTimer()
+        bound_query, offset = _bind_query_request(query_request, timer)
+        page_query = _get_page_query(bound_query, offset, query_request.page_size)
+        result = _run_coalesced_query(
+            page_query, _run_admitted_query, bound_query, offset, query_request.page_size, timer)
+        if query_request.timings:
+            result['timings'] = timer.as_milliseconds()
 
-def _get_orientdb_client():
-    """Return a connection to the graph."""
-    client = OrientDB(graph_config.host, graph_config.port, graph_config.serialization_type)
-    client.connect(graph_config.user, graph_config.cred)
-    client.db_open(graph_config.db_name, graph_config.user, graph_config.cred)
-    return client
+        _observe_query_timings(page_query, timer, start_time)
+        return _apply_response_options(result, query_request)
+    except Exception as e:
+        app.logger.error(u'Encountered an error in a batch entry: %s', e)
+        return {'error': six.text_type(e)}
+    # pylint: enable=broad-except
 
 
-def _run_graphql_query(query, args):
-    """Execute the provided GraphQL query and return the result."""
-    client = None
+def _run_admitted_query(bound_query, offset, page_size, timer):
+    """Execute one page of the query on the query executor, once it is admitted for execution."""
+    with timer.phase('admission'):
+        admission_controller.acquire()
     try:
-        client = _get_orientdb_client()
-
-        compilation_result = graphql_to_match(schema, query, args)
-        pretty_printed = pretty_print_graphql(query)
-
-        limit = 1000
-        outputs = [
-            x.oRecordData
-            for x in client.command(compilation_result.query, limit)
-        ]
-
-        return {
-            'supplied_graphql': pretty_printed,
-            'supplied_args': args,
-            'input_metadata': compilation_result.input_metadata,
-            'output_metadata': {
-                # Named tuples JSON-encode to lists. Make them a proper dict.
-                key: {'type': value.type, 'optional': value.optional}
-                for key, value in compilation_result.output_metadata.items()
-            },
-            'executed_match_query': pretty_print_match(compilation_result.query),
-            'output_data': outputs,
+        return query_executor.run(_run_graphql_query, bound_query, offset, page_size, timer)
+    finally:
+        admission_controller.release()
+
+
+def _run_coalesced_query(page_query, run_query, bound_query, offset, page_size, timer):
+    """Return the result of run_query(bound_query, offset, page_size, timer) for the page.
+
+    Concurrent requests for the same page of the same query and arguments share a single
+    execution. The time a request spends waiting for another request's execution to finish
+    is recorded as the "coalesced" phase.
+
+    Requests may wait for one another here, so this must not be called on the query executor's
+    threads: the threads of waiting requests would keep the execution they wait for from
+    getting a thread of its own.
+    """
+    start_time = time.time()
+    result, coalesced = query_single_flight.run(
+        get_query_key(page_query), run_query, bound_query, offset, page_size, timer)
+    if coalesced:
+        timer.record('coalesced', time.time() - start_time)
+    # Each request modifies its response data, so it gets its own copy of the shared result.
+    return dict(result)
+
+
+def _apply_response_options(result, query_request):
+    """Reshape the response data into the format the QueryRequest asked for, and return it."""
+    if not query_request.echo_query:
+        for key in QUERY_ECHO_FIELDS:
+            result.pop(key, None)
+
+    if query_request.output_format == COLUMNAR_FORMAT:
+        # Output names are only sent once, rather than once per row. The rows may be shared
+        # with the result cache, so they are left as they are.
+        rows = result['output_data']
+        result['output_data'] = {
+            output_name: [row.get(output_name) for row in rows]
+            for output_name in result['output_metadata']
         }
+    return result
+
+
+def _get_response_encoding():
+    """Return the content encoding the request allows compressing its response with, or None."""
+    return request.accept_encodings.best_match(sorted(_COMPRESSION_WINDOW_BITS, reverse=True))
+
+
+def _get_representation_etag(etag, query_request, encoding):
+    """Return the ETag of the query results, in the format and encoding they are sent in."""
+    parts = [etag]
+    if query_request.output_format != ROWS_FORMAT:
+        parts.append(query_request.output_format)
+    if not query_request.echo_query:
+        parts.append('noecho')
+    if encoding is not None:
+        parts.append(encoding)
+    return '-'.join(parts)
+
+
+def _compress_chunks(chunks, encoding):
+    """Yield the compressed form of the concatenated chunks, in the given content encoding."""
+    compressor = zlib.compressobj(
+        COMPRESSION_LEVEL, zlib.DEFLATED, _COMPRESSION_WINDOW_BITS[encoding])
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, six.text_type):
+                chunk = chunk.encode('utf-8')
+            compressed_chunk = compressor.compress(chunk)
+            if compressed_chunk:
+                yield compressed_chunk
     finally:
-        if client:
-            client.close()
+        if hasattr(chunks, 'close'):
+            chunks.close()
+    yield compressor.flush()
+
+
+def _compress_response(response, encoding):
+    """Compress the body of the successful response in the content encoding, and return it.
+
+    Responses are left uncompressed if the encoding is None, or if they are too small
+    to be worth compressing. Streamed responses are compressed as they are sent.
+    """
+    response.vary.add('Accept-Encoding')
+    if encoding is None or response.status_code != 200:
+        return response
+
+    if response.is_streamed:
+        response.response = _compress_chunks(response.response, encoding)
+    else:
+        body = response.get_data()
+        if len(body) < MIN_COMPRESSED_RESPONSE_BYTES:
+            return response
+        response.set_data(b''.join(_compress_chunks([body], encoding)))
+
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def _get_page_query(bound_query, offset, page_size):
+    """Return the BoundQuery for the requested page, plus one row to tell if more pages follow."""
+    limit = _get_page_limit(page_size)
+    if limit is None:
+        return get_page_query(bound_query, offset, -1) if offset else bound_query
+    return get_page_query(bound_query, offset, limit)
+
+
+def _get_response_metadata(page_query):
+    """Return the response fields describing the executed query."""
+    compiled_query = page_query.compiled_query
+    return {
+        'supplied_graphql': compiled_query.supplied_graphql,
+        'supplied_args': page_query.args,
+        'input_metadata': compiled_query.input_metadata,
+        'output_metadata': compiled_query.output_metadata,
+        'executed_match_query': page_query.pretty_match_query,
+    }
+
+
+def _get_page_limit(page_size):
+    """Return the number of rows to read for a page, or None if all remaining rows are read."""
+    return None if page_size is None else page_size + 1
+
+
+def _iterate_memory_graph_rows(bound_query):
+    """Yield the result rows of the query on the in-memory graph, aborting it past the timeout.
+
+    QueryTimeoutError is raised once the timeout has passed. The timeout is enforced while
+    the graph is being traversed, so it also aborts queries that traverse much of the graph
+    between two result rows.
+    """
+    deadline = None if query_timeout is None else time.time() + query_timeout
+    try:
+        for row in memory_graph.execute(
+                bound_query.compiled_query.supplied_graphql, bound_query.args, deadline=deadline):
+            yield row
+    except QueryDeadlineError:
+        raise QueryTimeoutError(
+            u'The query did not finish within {} seconds.'.format(query_timeout))
+
+
+def _execute_memory_query(bound_query, offset, page_size, timer):
+    """Execute the query against the in-memory graph, and return the page's result rows."""
+    with timer.phase('execute'):
+        rows = _iterate_memory_graph_rows(bound_query)
+        limit = _get_page_limit(page_size)
+        return list(islice(rows, offset, None if limit is None else offset + limit))
+
+
+def _iterate_memory_query(bound_query, offset):
+    """Yield the result rows of the query against the in-memory graph, starting at the offset."""
+    rows = _iterate_memory_graph_rows(bound_query)
+    for row in islice(rows, offset, None):
+        yield row
+
+
+def _get_timeout_clause():
+    """Return the clause that makes OrientDB abort a query still executing past the timeout."""
+    if query_timeout is None:
+        return u''
+    # The clause applies to the outer SELECT of a compiled MATCH query, and must follow
+    # any SKIP and LIMIT clauses.
+    return u' TIMEOUT {} EXCEPTION'.format(int(query_timeout * 1000))
+
+
+def _is_timeout_error(error):
+    """Return True if the OrientDB error was raised since a query ran past its timeout."""
+    # The message of an OrientDB error is the name of the Java exception class that it mirrors.
+    return bool(error.args) and (
+        six.text_type(error.args[0]).split('.')[-1] == 'OTimeoutException')
+
+
+def _execute_match_query(match_query, timer):
+    """Execute the MATCH query on a pooled session, and return its result rows.
+
+    If the session's connection fails, the query is retried once on another session. With
+    several replicas, the failed replica is ejected, so the retry runs on another replica.
+    Queries that timed out are not retried, since they would most likely time out again.
+    """
+    try:
+        return _execute_match_query_once(match_query, timer)
+    except CONNECTION_ERRORS as e:
+        if isinstance(e, socket.timeout) or _is_timeout_error(e):
+            raise
+        app.logger.warning(u'Retrying a query after a connection error: %s', e)
+        return _execute_match_query_once(match_query, timer)
+
+
+def _execute_match_query_once(match_query, timer):
+    """Execute the MATCH query on a single pooled session, and return its result rows."""
+    checkout_start_time = time.time()
+    with connection_pool.connection() as client:
+        timer.record('checkout', time.time() - checkout_start_time)
+        with timer.phase('execute'):
+            try:
+                records = client.command(match_query + _get_timeout_clause())
+            except PyOrientException as e:
+                if _is_timeout_error(e):
+                    raise QueryTimeoutError(
+                        u'The query did not finish within {} seconds.'.format(query_timeout))
+                raise
+            return [x.oRecordData for x in records]
+
+
+def _run_graphql_query(bound_query, offset, page_size, timer):
+    """Execute one page of the provided query, with its arguments already bound.
+
+    Returns:
+        dict, the response data, with the page's result rows under "output_data" and
+        the cursor of the next page (or None if this was the last page) under "next_cursor"
+    """
+    page_query = _get_page_query(bound_query, offset, page_size)
+    # Results read from the graph belong to the generation current when reading began.
+    generation = result_cache.generation
+
+    outputs = result_cache.get(page_query)
+    if outputs is None:
+        if memory_graph is not None:
+            outputs = _execute_memory_query(bound_query, offset, page_size, timer)
+        else:
+            outputs = _execute_match_query(page_query.match_query, timer)
+        result_cache.put(page_query, outputs, generation=generation)
+
+    next_cursor = None
+    if len(outputs) > page_size:
+        outputs = outputs[:page_size]
+        next_cursor = encode_cursor(bound_query, offset + page_size, generation)
+
+    result = _get_response_metadata(page_query)
+    result['output_data'] = outputs
+    result['next_cursor'] = next_cursor
+    return result
+
+
+def _stream_graphql_query(bound_query, offset, page_size, timer, start_time, echo_query=True):
+    """Return a response that sends result rows to the client as they are read from the graph.
+
+    The response body has the same JSON structure as a non-streamed response,
+    but the rows are serialized and sent one at a time instead of all at once.
+    If page_size is None, all rows starting at the offset are sent.
+
+    Reading and serializing rows are interleaved, so all the time spent streaming them
+    is recorded as the "stream" phase, once the last row has been sent.
+    """
+    page_query = _get_page_query(bound_query, offset, page_size)
+    metadata = _get_response_metadata(page_query)
+    if not echo_query:
+        for key in QUERY_ECHO_FIELDS:
+            del metadata[key]
+    metadata_json = _json_encoder.encode(metadata)
+
+    def _generate_response_chunks():
+        """Yield the response body in chunks: metadata, then one chunk per row, then cursor."""
+        yield metadata_json[:-1] + ',"output_data":['
+
+        next_cursor = None
+        row_count = 0
+        generation = result_cache.generation
+        stream_start_time = time.time()
+        if memory_graph is not None:
+            rows = _iterate_memory_query(bound_query, offset)
+        else:
+            rows = stream_query_rows(
+                connection_pool, page_query.match_query + _get_timeout_clause())
+        # pylint: disable=broad-except
+        try:
+            for row in rows:
+                if row_count == page_size:
+                    next_cursor = encode_cursor(bound_query, offset + page_size, generation)
+                    break
+
+                separator = ',' if row_count else ''
+                yield separator + _json_encoder.encode(row)
+                row_count += 1
+        except Exception as e:
+            # The response status has already been sent, so report the error in the body.
+            app.logger.error(u'Encountered an error while streaming results: %s', e)
+            yield '],"error":{}}}'.format(_json_encoder.encode(six.text_type(e)))
+            return
+        finally:
+            rows.close()
+        # pylint: enable=broad-except
+
+        timer.record('stream', time.time() - stream_start_time)
+        _observe_query_timings(page_query, timer, start_time)
+        yield '],"next_cursor":{}}}'.format(_json_encoder.encode(next_cursor))
+
+    return Response(_generate_response_chunks(), mimetype='application/json')
+
+
+def _get_fingerprint_label(fingerprint):
+    """Return the metrics label value for the query fingerprint, bounding the label's values."""
+    with _seen_fingerprints_lock:
+        if fingerprint in _seen_fingerprints:
+            return fingerprint
+        if len(_seen_fingerprints) < MAX_FINGERPRINT_LABELS:
+            _seen_fingerprints.add(fingerprint)
+            return fingerprint
+    return 'other'
+
+
+def _observe_query_timings(page_query, timer, start_time):
+    """Export the request's phase timings and total duration, and log the query if it was slow.
+
+    Args:
+        page_query: BoundQuery, the page of the query that the request executed
+        timer: PhaseTimer, the time spent in each phase of handling the request
+        start_time: float, the time at which handling the request started
+    """
+    total_seconds = time.time() - start_time
+    label = _get_fingerprint_label(page_query.compiled_query.fingerprint)
+    for phase_name, seconds in six.iteritems(timer.durations):
+        phase_histogram.observe(seconds, label, phase_name)
+    phase_histogram.observe(total_seconds, label, 'total')
+
+    if slow_query_log is not None and total_seconds >= slow_query_log.threshold:
+        _log_slow_query(page_query, timer, total_seconds)
+
+
+def _log_slow_query(page_query, timer, total_seconds):
+    """Record the slow query in the slow query log, explaining it if it was executed in OrientDB."""
+    compiled_query = page_query.compiled_query
+    entry = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'fingerprint': compiled_query.fingerprint,
+        'total_ms': round(total_seconds * 1000.0, 3),
+        'phases_ms': timer.as_milliseconds(),
+        'args': page_query.args,
+        'estimated_cost': compiled_query.estimated_cost,
+        'match_query': page_query.match_query,
+    }
+
+    # Queries answered from the result cache, or by another request's execution, were slow
+    # for reasons that their execution plan does not explain.
+    was_executed = 'execute' in timer.durations or 'stream' in timer.durations
+    if (memory_graph is None and was_executed and
+            slow_query_log.should_explain(compiled_query.fingerprint)):
+        # Explaining the query executes it once more, so it is done off the request's thread.
+        slow_query_executor.submit(_explain_slow_query, entry)
+    else:
+        slow_query_log.record(entry)
+
+
+def _explain_slow_query(entry):
+    """Add OrientDB's explanation of the slow query's execution to the entry, and record it."""
+    # pylint: disable=broad-except
+    try:
+        with connection_pool.connection() as client:
+            records = client.command(u'EXPLAIN ' + entry['match_query'] + _get_timeout_clause())
+        entry['explain'] = [record.oRecordData for record in records]
+    except Exception as e:
+        entry['explain_error'] = six.text_type(e)
+    # pylint: enable=broad-except
+    slow_query_log.record(entry)
+
+
+def _collect_component_metrics():
+    """Return the metrics lines for the counters kept by the pool and the caches."""
+    lines = []
+    if connection_pool is not None:
+        pool_stats = connection_pool.stats()
+        for key in ('checkouts', 'waits', 'reconnects'):
+            lines.extend(render_samples(
+                'game_of_graphql_pool_{}_total'.format(key), 'counter',
+                'Number of OrientDB session pool {}.'.format(key), [({}, pool_stats[key])]))
+        for key in ('size', 'open', 'idle'):
+            lines.extend(render_samples(
+                'game_of_graphql_pool_{}_sessions'.format(key), 'gauge',
+                'Number of {} sessions in the OrientDB session pool.'.format(key),
+                [({}, pool_stats[key])]))
+
+        # Only a pool of several replicas reports on each of them.
+        replica_stats = pool_stats.get('replicas')
+        if replica_stats is not None:
+            lines.extend(render_samples(
+                'game_of_graphql_replica_healthy', 'gauge',
+                'Whether each OrientDB replica is receiving queries (1) or ejected (0).',
+                [({'replica': x['name']}, int(x['healthy'])) for x in replica_stats]))
+            lines.extend(render_samples(
+                'game_of_graphql_replica_outstanding_sessions', 'gauge',
+                'Number of sessions in use on each OrientDB replica.',
+                [({'replica': x['name']}, x['outstanding']) for x in replica_stats]))
+            lines.extend(render_samples(
+                'game_of_graphql_replica_ejections_total', 'counter',
+                'Number of times each OrientDB replica was ejected for being unhealthy.',
+                [({'replica': x['name']}, x['ejections']) for x in replica_stats]))
+
+    caches = (
+        ('compiled_query', compiled_query_cache),
+        ('result', result_cache),
+    )
+    if admission_controller is not None:
+        admission_stats = admission_controller.stats()
+        for key in ('admitted', 'rejected'):
+            lines.extend(render_samples(
+                'game_of_graphql_admission_{}_total'.format(key), 'counter',
+                'Number of queries {} for execution.'.format(key), [({}, admission_stats[key])]))
+        for key in ('active', 'queued'):
+            lines.extend(render_samples(
+                'game_of_graphql_admission_{}_queries'.format(key), 'gauge',
+                'Number of {} queries.'.format(key), [({}, admission_stats[key])]))
+
+    coalesced_samples = []
+    if compiled_query_cache is not None:
+        coalesced_samples.append(({'stage': 'compile'}, compiled_query_cache.stats()['coalesced']))
+    if query_single_flight is not None:
+        coalesced_samples.append(({'stage': 'execute'}, query_single_flight.stats()['coalesced']))
+    lines.extend(render_samples(
+        'game_of_graphql_coalesced_requests_total', 'counter',
+        'Number of requests that shared the compilation or execution of a concurrent '
+        'identical request.', coalesced_samples))
+
+    if slow_query_log is not None:
+        lines.extend(render_samples(
+            'game_of_graphql_slow_queries_total', 'counter',
+            'Number of queries recorded in the slow query log.',
+            [({}, slow_query_log.stats()['recorded'])]))
+
+    cache_stats = [(name, cache.stats()) for name, cache in caches if cache is not None]
+    for key in ('hits', 'misses', 'evictions'):
+        lines.extend(render_samples(
+            'game_of_graphql_cache_{}_total'.format(key), 'counter',
+            'Number of cache {}.'.format(key),
+            [({'cache': name}, stats[key]) for name, stats in cache_stats]))
+    for key in ('entries', 'weight'):
+        lines.extend(render_samples(
+            'game_of_graphql_cache_{}'.format(key), 'gauge',
+            'Current cache {}.'.format(key),
+            [({'cache': name}, stats[key]) for name, stats in cache_stats]))
+
+    return lines
+
+
+metrics_registry.add_collector(_collect_component_metrics)
+
+
+@app.route('/debug/slow-queries', methods=['GET'])
+def slow_queries():
+    """Return the most recent slow queries, as a JSON dict with a list of them under "entries".
+
+    Each server process keeps its own slow query log, so in production mode the returned
+    entries are only those of the worker process that handled the request.
+    """
+    if slow_query_log is None:
+        return abort(404)
+
+    response_data = {
+        'threshold_seconds': slow_query_log.threshold,
+        'entries': slow_query_log.entries(),
+    }
+    return make_response(_json_encoder.encode(response_data))
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Return the server's metrics in the Prometheus text format.
+
+    Each server process keeps its own metrics, so the metrics are not served when several
+    worker processes handle requests: each scrape would describe whichever worker handled it,
+    and counters would appear to jump back and forth between scrapes.
+    """
+    if not serve_metrics:
+        return abort(404)
+
+    return metrics_registry.render(), 200, {'Content-Type': PROMETHEUS_CONTENT_TYPE}
+
+
+def get_orientdb_query_rewrite(region_hierarchy_depth):
+    """Return the function rewriting GraphQL queries into faster equivalents to run on OrientDB.
+
+    Args:
+        region_hierarchy_depth: int, the depth of the region hierarchy, as returned by
+                                new_dataset.compute_region_ancestry()
+    """
+    # OrientDB walks the region hierarchy anew for every recursion over it, while a single
+    # hop over the hierarchy's precomputed closure returns the same regions. Likewise,
+    # it expands every edge of a fold just to count them, while the counts are precomputed.
+    return compose_rewrites([
+        partial(rewrite_recursion_as_closure, edge_class='Has_Parent_Region',
+                closure_edge_class=new_dataset.REGION_ANCESTRY_EDGE_CLASS,
+                max_depth=region_hierarchy_depth),
+        partial(rewrite_fold_counts_as_degrees, schema=schema,
+                get_degree_field_name=new_dataset.get_degree_property_name),
+    ])
+
+
+def _use_dataset_generation(fingerprint, region_hierarchy_depth):
+    """Compile queries for, and cache the results of, the graph built from the given data.
+
+    Args:
+        fingerprint: str, the fingerprint of the data, used as the result cache's generation
+        region_hierarchy_depth: int, the depth of the data's region hierarchy, as returned by
+                                new_dataset.compute_region_ancestry()
+    """
+    compiled_query_cache.reset(rewrite_query=get_orientdb_query_rewrite(region_hierarchy_depth))
+    if query_registry is not None:
+        query_registry.recompile(compiled_query_cache.get)
+    # The generation changes last, so that if compiling fails, the next check tries again.
+    result_cache.invalidate(generation=fingerprint)
+
+
+def _check_dataset_generation():
+    """Catch up with changes made to the graph since it was last checked, e.g. by a sync.
+
+    If the fingerprint recorded in the graph differs from the result cache's generation,
+    the graph's new fingerprint becomes the generation, which drops the cached results and
+    makes the cursors of the old generation invalid. Queries are also compiled anew, with
+    the closure rewrite for the new depth of the region hierarchy. While the graph is being
+    synced, it has no fingerprint, and each check starts a new generation of its own.
+    """
+    # pylint: disable=global-statement
+    global _next_dataset_check_time
+    # pylint: enable=global-statement
+    if dataset_check_interval is None or time.time() < _next_dataset_check_time:
+        return
+    # Requests arriving while another request checks the graph keep using the current generation.
+    if not _dataset_check_lock.acquire(False):
+        return
+
+    try:
+        if time.time() < _next_dataset_check_time:
+            return
+        _next_dataset_check_time = time.time() + dataset_check_interval
+
+        with connection_pool.connection() as client:
+            dataset_info = new_dataset.read_dataset_info(client)
+        fingerprint = dataset_info['fingerprint'] if dataset_info is not None else None
+
+        if fingerprint is None:
+            app.logger.info(u'The graph is being built or synced, dropping cached results.')
+            result_cache.invalidate()
+        elif fingerprint != result_cache.generation:
+            app.logger.info(u'The graph changed to data fingerprint %s, dropping cached results '
+                            u'and compiled queries.', fingerprint)
+            _use_dataset_generation(fingerprint, dataset_info['region_hierarchy_depth'])
+    except (ConnectionPoolTimeout,) + CONNECTION_ERRORS as e:
+        app.logger.warning(u'Could not check the graph for changes: %s', e)
+    finally:
+        _dataset_check_lock.release()
+
+
+def _start_worker(configs, pool_size, pool_timeout, pool_health_check_interval,
+                  max_concurrent_queries, max_queued_queries, admission_timeout,
+                  slow_query_threshold, slow_query_log_path, slow_query_explain_interval,
+                  log_per_process):
+    """Create the database sessions pool, query executor and admission controller of this process.
+
+    Up to pool_size sessions are opened to each of the OrientDB replicas described by configs.
+    If max_concurrent_queries is None, as many queries are admitted at once as there are
+    database sessions. If slow_query_threshold is None, slow queries are not logged.
+    If log_per_process is True, the process id is appended to the slow query log's path,
+    so that the log files of different processes are rotated independently.
+    """
+    # pylint: disable=global-statement
+    global connection_pool, query_executor, batch_executor, admission_controller
+    global query_single_flight
+    global slow_query_log, slow_query_executor
+    # pylint: enable=global-statement
+    session_count = pool_size
+    if memory_graph is None:
+        if len(configs) == 1:
+            connection_pool = OrientDBConnectionPool(
+                configs[0], size=pool_size, checkout_timeout=pool_timeout,
+                health_check_interval=pool_health_check_interval)
+        else:
+            connection_pool = ReplicatedConnectionPool(
+                configs, size=pool_size, checkout_timeout=pool_timeout,
+                health_check_interval=pool_health_check_interval)
+            session_count = pool_size * len(configs)
+
+    # Each executor thread uses at most one session, so more threads than sessions would
+    # only wait for one another.
+    query_executor = QueryExecutor(session_count)
+    # Batch entries wait for coalesced executions and for the query executor, so they run on
+    # threads of their own, and never take the query executor's threads away from the queries.
+    batch_executor = QueryExecutor(session_count)
+    admission_controller = AdmissionController(
+        session_count if max_concurrent_queries is None else max_concurrent_queries,
+        max_queued_queries, admission_timeout)
+    # A request stops waiting for a coalesced execution once it has waited as long as
+    # an execution of its own could take, and executes the query itself instead.
+    follower_timeout = admission_timeout + pool_timeout
+    follower_timeout += MAX_UNTIMED_COALESCED_WAIT if query_timeout is None else query_timeout
+    # A request that was turned away by the admission controller fails alone, and the requests
+    # waiting for its execution are each admitted or turned away in their own right.
+    query_single_flight = SingleFlight(
+        follower_timeout=follower_timeout, unshared_errors=(AdmissionRejectedError,))
+
+    if slow_query_threshold is not None:
+        if slow_query_log_path is not None and log_per_process:
+            slow_query_log_path = u'{}.{}'.format(slow_query_log_path, getpid())
+        slow_query_log = SlowQueryLog(
+            slow_query_threshold, log_path=slow_query_log_path,
+            explain_interval=slow_query_explain_interval)
+        # Slow queries are explained one at a time, so that explaining them cannot take
+        # more than one database session away from other queries.
+        slow_query_executor = QueryExecutor(1)
+
+
+def _stop_worker():
+    """Let in-flight queries finish, then close this server process's database sessions."""
+    batch_executor.close()
+    query_executor.close()
+    if slow_query_executor is not None:
+        slow_query_executor.close()
+    if slow_query_log is not None:
+        slow_query_log.close()
+    if connection_pool is not None:
+        connection_pool.close()
 
 
 @click.command()
@@ -133,27 +1001,190 @@ def _run_graphql_query(query, args):
 @click.option('--port', type=int, default=5000,
               help='Port where to run the service')
 @click.option('--graph-location', type=str, default='127.0.0.1:2424',
-              help='OrientDB host and port')
+              help='OrientDB host and port, or a comma-separated list of the hosts and ports of '
+                   'replicas to spread queries across. The graph is built on the first one')
 @click.option('--graph-user', type=str, default='root',
               help='OrientDB username')
 @click.option('--graph-password', type=str, default='root',
               help='OrientDB password')
-def run(host, port, graph_location, graph_user, graph_password):
+@click.option('--pool-size', type=int, default=8,
+              help='Maximum number of open OrientDB sessions per replica')
+@click.option('--pool-timeout', type=float, default=10.0,
+              help='Seconds to wait for a free OrientDB session before failing a request')
+@click.option('--pool-health-check-interval', type=float, default=30.0,
+              help='Check sessions idle for longer than this many seconds before reusing them, '
+                   'and check the health of replicas this often')
+@click.option('--compiled-query-cache-size', type=int, default=256,
+              help='Number of distinct GraphQL queries whose compiled form is cached')
+@click.option('--result-cache-megabytes', type=int, default=64,
+              help='Approximate memory budget of the query result cache')
+@click.option('--force-rebuild', is_flag=True, default=False,
+              help='Rebuild the Game of GraphQL graph even if it is already up to date')
+@click.option('--snapshot-path', type=str, default=None,
+              help='Load the graph data from this snapshot file, creating it if missing')
+@click.option('--load-page-size', type=int, default=1000,
+              help='Number of records read per query when loading the source data')
+@click.option('--build-batch-size', type=int, default=500,
+              help='Number of vertices or edges created per round trip when building the graph')
+@click.option('--graph-update', type=click.Choice(['incremental', 'rebuild']),
+              default='incremental',
+              help='Apply only the changed vertices and edges to an outdated graph, or rebuild it')
+@click.option('--query-registry', 'query_registry_path', type=str, default=None,
+              help='JSON file of query id -> GraphQL query, to compile on startup and run by id')
+@click.option('--reject-unregistered-queries', is_flag=True, default=False,
+              help='Only execute the queries in the query registry')
+@click.option('--max-page-size', 'max_page_size_option', type=int, default=1000,
+              help='Maximum number of result rows returned per page')
+@click.option('--max-batch-size', 'max_batch_size_option', type=int, default=100,
+              help='Maximum number of queries in a single /graphql/batch request')
+@click.option('--max-query-cost', 'max_query_cost_option', type=float, default=100000.0,
+              help='Reject queries estimated to visit more vertices than this, or 0 for no limit')
+@click.option('--query-timeout', 'query_timeout_option', type=float, default=30.0,
+              help='Abort queries still executing after this many seconds, or 0 for no limit')
+@click.option('--max-concurrent-queries', type=int, default=None,
+              help='Maximum number of queries executing at once, by default the pool size')
+@click.option('--max-queued-queries', type=int, default=32,
+              help='Maximum number of queries waiting to execute, before new ones are rejected')
+@click.option('--admission-timeout', type=float, default=5.0,
+              help='Reject queries that waited to execute for longer than this many seconds')
+@click.option('--slow-query-threshold', type=float, default=1.0,
+              help='Log queries that take longer than this many seconds, or 0 to log none')
+@click.option('--slow-query-log', 'slow_query_log_path', type=str, default=None,
+              help='Also append slow queries to this rotating file of JSON lines. In production '
+                   'mode, each worker process appends its process id to the file name')
+@click.option('--slow-query-explain-interval', type=float, default=300.0,
+              help='Capture OrientDB\'s EXPLAIN output of each slow query at most once per this '
+                   'many seconds, or 0 to never capture it')
+@click.option('--backend', type=click.Choice(['orientdb', 'memory']), default='orientdb',
+              help='Execute queries in OrientDB, or in-process against an in-memory graph')
+@click.option('--dataset-check-interval', 'dataset_check_interval_option', type=float,
+              default=5.0,
+              help='Check the OrientDB graph for changes made by others, e.g. by a sync, at most '
+                   'once per this many seconds, or 0 to never check')
+@click.option('--server-mode', type=click.Choice(['development', 'production']),
+              default='development',
+              help='Serve with Flask\'s development server, or a multi-process production one')
+@click.option('--workers', type=int, default=multiprocessing.cpu_count(),
+              help='Number of worker processes in production mode')
+@click.option('--threads', type=int, default=8,
+              help='Number of request-handling threads per worker process in production mode')
+@click.option('--graceful-timeout', type=int, default=30,
+              help='Seconds to let in-flight requests finish on shutdown in production mode')
+def run(host, port, graph_location, graph_user, graph_password,
+        pool_size, pool_timeout, pool_health_check_interval, compiled_query_cache_size,
+        result_cache_megabytes, force_rebuild, snapshot_path, load_page_size, build_batch_size,
+        graph_update, query_registry_path, reject_unregistered_queries,
+        max_page_size_option, max_batch_size_option, max_query_cost_option, query_timeout_option,
+        max_concurrent_queries, max_queued_queries, admission_timeout, slow_query_threshold,
+        slow_query_log_path, slow_query_explain_interval, backend, dataset_check_interval_option,
+        server_mode, workers, threads, graceful_timeout):
     """Run the app."""
     # pylint: disable=global-statement
-    global graph_config
+    global graph_config, memory_graph, compiled_query_cache, result_cache, query_registry
+    global max_page_size, max_batch_size, max_query_cost, query_timeout, dataset_check_interval
+    global serve_metrics
     # pylint: enable=global-statement
-    graph_config = Config.from_url(
-        'plocal://{}/game_of_graphql'.format(graph_location), graph_user, graph_password)
+    if reject_unregistered_queries and query_registry_path is None:
+        raise click.UsageError(u'Rejecting unregistered queries requires a --query-registry.')
 
-    app.logger.info(u'Waiting for OrientDB to come alive...')
-    tools.wait_for_orientdb_to_come_alive(graph_location, graph_user, graph_password)
+    # Replicas of the graph are only read from. The graph is built on, and the source data
+    # read from, the first replica, and the others receive it through OrientDB's replication.
+    graph_locations = [
+        location.strip()
+        for location in graph_location.split(',')
+        if location.strip()
+    ]
+    if not graph_locations:
+        raise click.BadParameter(u'No OrientDB location given.', param_hint='--graph-location')
+    primary_graph_location = graph_locations[0]
+    graph_configs = [
+        Config.from_url(
+            'plocal://{}/game_of_graphql'.format(location), graph_user, graph_password)
+        for location in graph_locations
+    ]
+    graph_config = graph_configs[0]
 
-    app.logger.info(u'Recreating the Game of GraphQL graph...')
-    tools.recreate_game_of_graphql_graph(graph_location, graph_user, graph_password)
+    # The in-memory backend only needs OrientDB to read the source data, unless a snapshot of
+    # the data can be read instead.
+    if not (backend == 'memory' and snapshot_path is not None and path.exists(snapshot_path)
+            and not force_rebuild):
+        app.logger.info(u'Waiting for OrientDB to come alive...')
+        tools.wait_for_orientdb_to_come_alive(primary_graph_location, graph_user, graph_password)
+
+    result_cache = ResultCache(max_bytes=result_cache_megabytes * 1024 * 1024)
+    max_page_size = max_page_size_option
+    max_batch_size = max_batch_size_option
+    max_query_cost = max_query_cost_option or None
+    query_timeout = query_timeout_option or None
+
+    app.logger.info(u'Loading the Game of GraphQL data...')
+    data, fingerprint = tools.load_game_of_graphql_data(
+        primary_graph_location, graph_user, graph_password, snapshot_path=snapshot_path,
+        refresh_snapshot=force_rebuild, page_size=load_page_size)
+
+    region_ancestry, region_hierarchy_depth = new_dataset.compute_region_ancestry(data)
+    cost_estimator = QueryCostEstimator(
+        schema, *compute_graph_statistics(data, region_ancestry))
+
+    rewrite_query = None
+    if backend == 'memory':
+        app.logger.info(u'Loading the Game of GraphQL graph into memory...')
+        # Production mode workers are forked after this, and share the graph's memory pages.
+        memory_graph = InMemoryGraph(data)
+    else:
+        app.logger.info(u'Recreating the Game of GraphQL graph, if it is out of date...')
+        tools.recreate_game_of_graphql_graph(
+            primary_graph_location, graph_user, graph_password, data, fingerprint,
+            force_rebuild=force_rebuild, batch_size=build_batch_size,
+            incremental=(graph_update == 'incremental'), page_size=load_page_size)
+
+        rewrite_query = get_orientdb_query_rewrite(region_hierarchy_depth)
+        # Other servers may sync the graph to different data while this one runs.
+        dataset_check_interval = dataset_check_interval_option or None
+
+    # Using the fingerprint as the generation keeps ETags valid across server restarts,
+    # for as long as the data does not change.
+    result_cache.invalidate(generation=fingerprint)
+
+    compiled_query_cache = CompiledQueryCache(
+        schema, max_size=compiled_query_cache_size, rewrite_query=rewrite_query,
+        estimate_cost=cost_estimator.estimate)
+
+    if query_registry_path is not None:
+        # Registered queries are compiled before any worker starts, so no request for them
+        # ever waits for a compilation.
+        app.logger.info(u'Compiling the registered queries...')
+        query_registry = QueryRegistry(
+            read_query_registry_file(query_registry_path), compiled_query_cache.get,
+            reject_unregistered=reject_unregistered_queries)
+        for query_id, compiled_query in query_registry.items():
+            if max_query_cost is not None and compiled_query.estimated_cost > max_query_cost:
+                app.logger.warning(u'Registered query %s is estimated to visit %.0f vertices, '
+                                   u'and will be rejected.', query_id,
+                                   compiled_query.estimated_cost)
+        app.logger.info(u'Compiled %d registered queries.', len(query_registry))
+
+    start_worker = partial(
+        _start_worker, graph_configs, pool_size, pool_timeout, pool_health_check_interval,
+        max_concurrent_queries, max_queued_queries, admission_timeout,
+        slow_query_threshold or None, slow_query_log_path, slow_query_explain_interval or None,
+        server_mode == 'production')
+
+    serve_metrics = server_mode != 'production' or workers == 1
+    if not serve_metrics:
+        app.logger.warning(u'Not serving /metrics, since each of the %d worker processes keeps '
+                           u'metrics of its own. Run a single worker to serve them.', workers)
 
     app.logger.info(u'Starting server...')
-    app.run(host=host, port=port, debug=False)
+    if server_mode == 'production':
+        serving.serve(app, host, port, workers, threads, graceful_timeout,
+                      on_worker_start=start_worker, on_worker_exit=_stop_worker)
+    else:
+        start_worker()
+        try:
+            app.run(host=host, port=port, debug=False, threaded=True)
+        finally:
+            _stop_worker()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,53 @@
+# Copyright 2017 Kensho Technologies, Inc.
+"""Serve the app with a production-grade, multi-process and multi-threaded WSGI server."""
+from gunicorn.app.base import BaseApplication
+import six
+
+
+class _GunicornApplication(BaseApplication):
+    """A gunicorn application that serves a given WSGI app with the given settings."""
+
+    def __init__(self, wsgi_app, settings):
+        """Create the gunicorn application. Settings are gunicorn setting name -> value."""
+        self._wsgi_app = wsgi_app
+        self._settings = settings
+        super(_GunicornApplication, self).__init__()
+
+    def load_config(self):
+        """Apply the settings to gunicorn's configuration."""
+        for key, value in six.iteritems(self._settings):
+            self.cfg.set(key, value)
+
+    def load(self):
+        """Return the WSGI app to serve."""
+        return self._wsgi_app
+
+
+def serve(wsgi_app, host, port, workers, threads, graceful_timeout,
+          on_worker_start, on_worker_exit):
+    """Serve the WSGI app until the server is shut down with SIGINT or SIGTERM.
+
+    Args:
+        wsgi_app: the WSGI app to serve
+        host: str, ip address at which to serve
+        port: int, port at which to serve
+        workers: int, number of worker processes, each of which handles requests independently
+        threads: int, number of request-handling threads in each worker process
+        graceful_timeout: int, on shutdown, seconds to wait for in-flight requests to finish
+        on_worker_start: function taking no arguments, called in each worker process
+                         after it starts and before it handles any requests
+        on_worker_exit: function taking no arguments, called in each worker process
+                        after it has stopped handling requests
+    """
+    settings = {
+        'bind': '{}:{}'.format(host, port),
+        'workers': workers,
+        'threads': threads,
+        'worker_class': 'gthread',
+        'graceful_timeout': graceful_timeout,
+        # Anything that holds threads or database sessions must be created after the worker
+        # processes are forked from the master process, since neither survives the fork.
+        'post_worker_init': lambda worker: on_worker_start(),
+        'worker_exit': lambda server, worker: on_worker_exit(),
+    }
+    _GunicornApplication(wsgi_app, settings).run()
@@ -0,0 +1,115 @@
+# Copyright 2017 Kensho Technologies, Inc.
+"""Share a single execution of a piece of work among concurrent callers that need the same one."""
+import sys
+import threading
+
+import six
+
+
+class _Call(object):
+    """The state of one in-flight execution, shared by all callers waiting for it."""
+
+    def __init__(self):
+        """Create the state of an execution that has not finished yet."""
+        self.done = threading.Event()
+        self.result = None
+        self.exc_info = None
+
+
+class SingleFlight(object):
+    """Coalesce concurrent calls with the same key into a single call of the function."""
+
+    def __init__(self, follower_timeout=None, unshared_errors=()):
+        """Create a SingleFlight with no calls in flight.
+
+        Args:
+            follower_timeout: optional float, the number of seconds a call waits for the result
+                              of an earlier call with the same key. A call that waits longer
+                              calls the function itself. If None, calls wait indefinitely.
+            unshared_errors: tuple of exception types that are specific to the call that raised
+                             them, e.g. since it was turned away by an admission controller.
+                             Calls that waited for a call that raised one of them are not
+                             handed the exception, and try again instead.
+        """
+        self._follower_timeout = follower_timeout
+        self._unshared_errors = unshared_errors
+        self._lock = threading.Lock()
+        self._calls = {}  # key -> _Call
+        self._waiting = 0
+        self._counters = {
+            'executions': 0,
+            'coalesced': 0,
+            'follower_timeouts': 0,
+            'follower_retries': 0,
+        }
+
+    def run(self, key, func, *args):
+        """Return the tuple (func(*args), True if the result was shared with an earlier call).
+
+        If another call with the same key is already executing, its result is returned
+        instead of calling the function again, and any exception it raises is raised here too,
+        unless it is one of the unshared errors. The result is shared among all callers,
+        so they must not modify it.
+
+        A call that waits on another call must not hold any resource that the other call needs
+        to finish, such as a thread of the pool that the other call's work runs on.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = _Call()
+                self._calls[key] = call
+                self._counters['executions'] += 1
+            else:
+                self._waiting += 1
+
+        if not is_leader:
+            finished = call.done.wait(self._follower_timeout)
+            # The earlier call may have failed for reasons of its own, in which case this call
+            # tries again, possibly along with other calls that are trying again too.
+            retry = finished and call.exc_info is not None and isinstance(
+                call.exc_info[1], self._unshared_errors)
+            with self._lock:
+                self._waiting -= 1
+                if not finished:
+                    self._counters['follower_timeouts'] += 1
+                elif retry:
+                    self._counters['follower_retries'] += 1
+                else:
+                    self._counters['coalesced'] += 1
+
+            if not finished:
+                # The earlier call is taking too long, so stop waiting for it and call the
+                # function.
+                return func(*args), False
+            if retry:
+                return self.run(key, func, *args)
+            if call.exc_info is not None:
+                six.reraise(*call.exc_info)
+            return call.result, True
+
+        # pylint: disable=broad-except
+        try:
+            call.result = func(*args)
+        except BaseException:
+            # Any exception, including those raised when the process is shutting down,
+            # is handed to the waiting calls, which would otherwise get no result at all.
+            call.exc_info = sys.exc_info()
+            raise
+        finally:
+            # Calls arriving from now on start a new execution, and see any newer results.
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        # pylint: enable=broad-except
+
+        return call.result, False
+
+    def stats(self):
+        """Return a dict of execution counters, and the numbers of calls in flight and waiting."""
+        with self._lock:
+            result = dict(self._counters)
+            result['in_flight'] = len(self._calls)
+            result['waiting'] = self._waiting
+        return result
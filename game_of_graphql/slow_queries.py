@@ -0,0 +1,99 @@
+# Copyright 2017 Kensho Technologies, Inc.
+"""Keep a record of slow queries, with what is needed to find out why they were slow."""
+from collections import deque
+import json
+import logging
+from logging.handlers import RotatingFileHandler
+import threading
+import time
+
+import six
+
+from game_of_graphql.query_cache import LRUCache
+
+
+class SlowQueryLog(object):
+    """A thread-safe log of the most recent queries that took longer than a threshold.
+
+    Entries are kept in memory, and are also appended to a rotating file of JSON lines if
+    a log file path is given.
+    """
+
+    def __init__(self, threshold, max_entries=100, log_path=None, max_log_bytes=10 * 1024 * 1024,
+                 log_backup_count=5, explain_interval=None):
+        """Create a log of the queries that take at least "threshold" seconds.
+
+        Args:
+            threshold: float, the number of seconds above which a query is logged
+            max_entries: int, the number of most recent entries kept in memory
+            log_path: optional str, the path of the file to append entries to
+            max_log_bytes: int, the size at which the log file is rotated
+            log_backup_count: int, the number of rotated log files kept
+            explain_interval: optional float, the minimum number of seconds between two
+                              explanations of the same query. If None, queries are never
+                              explained, see should_explain().
+        """
+        self.threshold = threshold
+        self._entries = deque(maxlen=max_entries)  # JSON-encoded entries, oldest first
+        self._lock = threading.Lock()
+        self._recorded_count = 0
+
+        self._explain_interval = explain_interval
+        self._explain_times = LRUCache(1000)  # query fingerprint -> time of its last explanation
+
+        self._file_handler = None
+        self._file_logger = None
+        if log_path is not None:
+            self._file_handler = RotatingFileHandler(
+                log_path, maxBytes=max_log_bytes, backupCount=log_backup_count)
+            self._file_handler.setFormatter(logging.Formatter('%(message)s'))
+            # A logger of its own, so that the entries are not also sent to the app's log.
+            self._file_logger = logging.Logger(__name__)
+            self._file_logger.addHandler(self._file_handler)
+
+    def should_explain(self, fingerprint):
+        """Return True if the slow query with the given fingerprint should be explained now.
+
+        Explaining a query executes it once more, so each query is explained at most once
+        per explain interval.
+        """
+        if self._explain_interval is None:
+            return False
+
+        now = time.time()
+        with self._lock:
+            last_explain_time = self._explain_times.get(fingerprint)
+            if last_explain_time is not None and now - last_explain_time < self._explain_interval:
+                return False
+            self._explain_times.put(fingerprint, now)
+        return True
+
+    def record(self, entry):
+        """Add the entry, a dict describing a slow query, to the log."""
+        # Values that are not JSON-native, such as those in explanations, are logged as text.
+        entry_json = json.dumps(entry, sort_keys=True, default=six.text_type)
+        with self._lock:
+            self._entries.append(entry_json)
+            self._recorded_count += 1
+        if self._file_logger is not None:
+            self._file_logger.info(entry_json)
+
+    def entries(self):
+        """Return the list of the entries kept in memory, most recent first."""
+        with self._lock:
+            entries_json = list(self._entries)
+        return [json.loads(entry_json) for entry_json in reversed(entries_json)]
+
+    def stats(self):
+        """Return a dict of the number of entries recorded and kept in memory."""
+        with self._lock:
+            return {
+                'recorded': self._recorded_count,
+                'entries': len(self._entries),
+            }
+
+    def close(self):
+        """Close the log file, if there is one."""
+        if self._file_handler is not None:
+            self._file_logger.removeHandler(self._file_handler)
+            self._file_handler.close()
@@ -0,0 +1,268 @@
+# Copyright 2017 Kensho Technologies, Inc.
+"""Save and load the cleaned Game of GraphQL data as a compact binary snapshot file.
+
+The snapshot holds exactly the data returned by existing_dataset.load_all_data(), so that
+it can be used in its place without reading the GamesOfThrones database.
+
+File layout, with all integers little-endian:
+    8 bytes: the magic string SNAPSHOT_MAGIC
+    4 bytes: unsigned int, the snapshot format version
+    4 bytes: unsigned int, the length of the header
+    the header: UTF-8 JSON, describing each section of the file as its offset and length
+    the sections, starting at the first multiple of 8 bytes after the header. Each section
+    starts at a multiple of 8 bytes, and its offset is relative to the start of the sections.
+
+Every vertex and every other rid referenced by an edge is numbered, in the order of the
+"rids" string column: characters first, then houses, then regions, then referenced rids
+that are not vertices. Vertex properties are stored in columns in the same order, and
+edges are stored as two arrays of 32-bit integers: the numbers of their source and
+destination rids. String columns are stored as a UTF-8 blob and an array of offsets into it,
+and string list columns as a string column and an array of offsets into that column.
+"""
+from array import array
+from contextlib import closing
+import json
+import mmap
+import os
+import struct
+import sys
+
+import six
+
+from game_of_graphql.new_dataset import EDGE_CLASS_BY_DATA_KEY
+
+
+# Bump this whenever the snapshot layout changes, so that old snapshots are not misread.
+SNAPSHOT_FORMAT_VERSION = 1
+
+SNAPSHOT_MAGIC = b'GOGQLSNP'
+
+# The vertex tables of the data, in snapshot order, and their property columns.
+# All other data keys hold edges.
+VERTEX_TABLE_COLUMNS = (
+    ('characters', ('name', 'alias')),
+    ('houses', ('name', 'alias', 'motto')),
+    ('regions', ('name', 'alias')),
+)
+STRING_LIST_COLUMNS = frozenset({'alias', 'motto'})
+
+_PREAMBLE = struct.Struct('<8sII')
+_SECTION_ALIGNMENT = 8
+_INT32_TYPECODE = 'i'
+
+
+class SnapshotFormatError(ValueError):
+    """Raised when a snapshot file is malformed, or was written in an unsupported format."""
+
+
+def _align(offset):
+    """Return the first multiple of the section alignment that is at least the offset."""
+    return offset + (-offset % _SECTION_ALIGNMENT)
+
+
+def _int32_array(values=()):
+    """Return an array of 32-bit integers holding the given values."""
+    result = array(_INT32_TYPECODE, values)
+    if result.itemsize != 4:
+        raise AssertionError(u'Expected 4-byte integers for typecode {}, got {} bytes '
+                             u'instead.'.format(_INT32_TYPECODE, result.itemsize))
+    return result
+
+
+def _array_to_bytes(values):
+    """Return the little-endian byte representation of the integer array."""
+    if sys.byteorder != 'little':
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes() if six.PY3 else values.tostring()
+
+
+def _bytes_to_int32_array(data):
+    """Return the integer array represented by the little-endian bytes."""
+    result = _int32_array()
+    if six.PY3:
+        result.frombytes(data)
+    else:
+        result.fromstring(bytes(data))
+    if sys.byteorder != 'little':
+        result.byteswap()
+    return result
+
+
+def _encode_string_column(strings):
+    """Return the (UTF-8 blob, offsets array) tuple representing the list of strings."""
+    encoded = [x.encode('utf-8') for x in strings]
+    offsets = _int32_array([0])
+    for item in encoded:
+        offsets.append(offsets[-1] + len(item))
+    return b''.join(encoded), offsets
+
+
+def _decode_string_column(blob, offsets):
+    """Return the list of strings represented by the UTF-8 blob and offsets array."""
+    return [
+        blob[offsets[index]:offsets[index + 1]].decode('utf-8')
+        for index in six.moves.xrange(len(offsets) - 1)
+    ]
+
+
+def _get_columns(data):
+    """Return the dict of section name -> bytes that represents the data."""
+    rids = []
+    # Every column gets its sections, even those of empty vertex tables.
+    column_values = {
+        (table_name, column_name): []
+        for table_name, column_names in VERTEX_TABLE_COLUMNS
+        for column_name in column_names
+    }
+    for table_name, column_names in VERTEX_TABLE_COLUMNS:
+        for key, vertex in sorted(six.iteritems(data[table_name])):
+            if key != vertex['rid']:
+                raise AssertionError(u'Expected vertex to be keyed by its rid, but got key {} '
+                                     u'for vertex {}'.format(key, vertex))
+            rids.append(key)
+            for column_name in column_names:
+                column_values[(table_name, column_name)].append(vertex[column_name])
+
+    rid_numbers = {rid: index for index, rid in enumerate(rids)}
+    sections = {}
+    for key in sorted(EDGE_CLASS_BY_DATA_KEY):
+        sources = _int32_array()
+        destinations = _int32_array()
+        for edge in sorted(data[key]):
+            for rid, numbers in six.moves.zip(edge, (sources, destinations)):
+                if rid not in rid_numbers:
+                    rid_numbers[rid] = len(rids)
+                    rids.append(rid)
+                numbers.append(rid_numbers[rid])
+        sections[key + '.sources'] = _array_to_bytes(sources)
+        sections[key + '.destinations'] = _array_to_bytes(destinations)
+
+    for (table_name, column_name), values in six.iteritems(column_values):
+        prefix = u'{}.{}'.format(table_name, column_name)
+        if column_name in STRING_LIST_COLUMNS:
+            list_offsets = _int32_array([0])
+            for value in values:
+                list_offsets.append(list_offsets[-1] + len(value))
+            sections[prefix + '.lists'] = _array_to_bytes(list_offsets)
+            values = [item for value in values for item in value]
+
+        blob, offsets = _encode_string_column(values)
+        sections[prefix + '.strings'] = blob
+        sections[prefix + '.offsets'] = _array_to_bytes(offsets)
+
+    blob, offsets = _encode_string_column(rids)
+    sections['rids.strings'] = blob
+    sections['rids.offsets'] = _array_to_bytes(offsets)
+    return sections
+
+
+def write_snapshot(snapshot_path, data):
+    """Write the data returned by existing_dataset.load_all_data() to a snapshot file.
+
+    The snapshot is written to a temporary file first, and then moved into place,
+    so that an interrupted write does not leave a partial snapshot behind.
+    """
+    sections = _get_columns(data)
+    vertex_counts = {
+        table_name: len(data[table_name])
+        for table_name, _ in VERTEX_TABLE_COLUMNS
+    }
+
+    layout = {}
+    offset = 0
+    for name in sorted(sections):
+        layout[name] = [offset, len(sections[name])]
+        offset = _align(offset + len(sections[name]))
+
+    header = json.dumps({
+        'vertex_counts': vertex_counts,
+        'sections': layout,
+    }, sort_keys=True).encode('utf-8')
+    sections_start = _align(_PREAMBLE.size + len(header))
+
+    temporary_path = snapshot_path + '.tmp'
+    with open(temporary_path, 'wb') as f:
+        f.write(_PREAMBLE.pack(SNAPSHOT_MAGIC, SNAPSHOT_FORMAT_VERSION, len(header)))
+        f.write(header)
+        for name in sorted(sections):
+            f.write(b'\0' * (sections_start + layout[name][0] - f.tell()))
+            f.write(sections[name])
+    os.rename(temporary_path, snapshot_path)
+
+
+def _read_sections(contents):
+    """Return the (vertex counts dict, section name -> bytes dict) from the snapshot contents."""
+    if len(contents) < _PREAMBLE.size:
+        raise SnapshotFormatError(u'Snapshot file is truncated.')
+
+    magic, version, header_length = _PREAMBLE.unpack(contents[:_PREAMBLE.size])
+    if magic != SNAPSHOT_MAGIC:
+        raise SnapshotFormatError(u'Not a Game of GraphQL snapshot file.')
+    if version != SNAPSHOT_FORMAT_VERSION:
+        raise SnapshotFormatError(u'Snapshot format version {} is not supported, expected '
+                                  u'version {}.'.format(version, SNAPSHOT_FORMAT_VERSION))
+
+    try:
+        header_bytes = contents[_PREAMBLE.size:_PREAMBLE.size + header_length]
+        header = json.loads(header_bytes.decode('utf-8'))
+        sections_start = _align(_PREAMBLE.size + header_length)
+        sections = {}
+        for name, (offset, length) in six.iteritems(header['sections']):
+            start = sections_start + offset
+            if start + length > len(contents):
+                raise SnapshotFormatError(u'Snapshot file is truncated.')
+            sections[name] = contents[start:start + length]
+        return header['vertex_counts'], sections
+    except (KeyError, TypeError, ValueError) as e:
+        raise SnapshotFormatError(u'Malformed snapshot header: {}'.format(e))
+
+
+def read_snapshot(snapshot_path):
+    """Return the data stored in the snapshot file, as returned by load_all_data()."""
+    with open(snapshot_path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            raise SnapshotFormatError(u'Snapshot file is empty.')
+        # Only the sections are copied out of the mapped file, and never its padding.
+        with closing(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)) as contents:
+            vertex_counts, sections = _read_sections(contents)
+
+    def _read_strings(prefix):
+        """Return the list of strings in the string column with the given name prefix."""
+        return _decode_string_column(
+            sections[prefix + '.strings'], _bytes_to_int32_array(sections[prefix + '.offsets']))
+
+    try:
+        rids = _read_strings('rids')
+        data = {}
+        first_index = 0
+        for table_name, column_names in VERTEX_TABLE_COLUMNS:
+            vertex_count = vertex_counts[table_name]
+            table_rids = rids[first_index:first_index + vertex_count]
+            first_index += vertex_count
+
+            vertices = {rid: {'rid': rid} for rid in table_rids}
+            for column_name in column_names:
+                prefix = u'{}.{}'.format(table_name, column_name)
+                values = _read_strings(prefix)
+                if column_name in STRING_LIST_COLUMNS:
+                    list_offsets = _bytes_to_int32_array(sections[prefix + '.lists'])
+                    values = [
+                        values[list_offsets[index]:list_offsets[index + 1]]
+                        for index in six.moves.xrange(vertex_count)
+                    ]
+                for rid, value in six.moves.zip(table_rids, values):
+                    vertices[rid][column_name] = value
+            data[table_name] = vertices
+
+        for key in EDGE_CLASS_BY_DATA_KEY:
+            sources = _bytes_to_int32_array(sections[key + '.sources'])
+            destinations = _bytes_to_int32_array(sections[key + '.destinations'])
+            data[key] = set(
+                (rids[source], rids[destination])
+                for source, destination in six.moves.zip(sources, destinations)
+            )
+    except (IndexError, KeyError, ValueError) as e:
+        raise SnapshotFormatError(u'Malformed snapshot contents: {}'.format(e))
+
+    return data
@@ -0,0 +1,71 @@
+# Copyright 2017 Kensho Technologies, Inc.
+"""Stream query results out of OrientDB as they arrive, without holding them all in memory."""
+import threading
+
+from six.moves import queue
+
+
+_ROW = 'row'
+_ERROR = 'error'
+_END = 'end'
+
+
+def stream_query_rows(pool, match_query, buffer_size=256):
+    """Yield the result rows of the MATCH query one at a time, as OrientDB sends them.
+
+    Args:
+        pool: OrientDBConnectionPool, from which to check out a session for the query
+        match_query: str, the MATCH query to execute
+        buffer_size: int, maximum number of rows read from OrientDB but not yet consumed
+
+    Yields:
+        dict, output name -> value, for each result row
+
+    The query runs on a background thread that holds a pooled session until the results
+    have been fully read. Rows are handed over through a bounded buffer, so memory use does
+    not grow with the number of rows the query returns.
+    """
+    buffer = queue.Queue(maxsize=buffer_size)
+    cancelled = threading.Event()
+
+    def _put(item):
+        """Put the item in the buffer, unless the consumer went away before taking it."""
+        while not cancelled.is_set():
+            try:
+                buffer.put(item, timeout=1.0)
+                return
+            except queue.Full:
+                pass
+
+    def _on_record(record):
+        """Hand over a record read from OrientDB."""
+        # Records are read until the end of the response even after the consumer went away,
+        # so that the session is left in a usable state for its next user.
+        _put((_ROW, record.oRecordData))
+
+    def _run_query():
+        """Execute the query, handing over its results and any errors it raises."""
+        # pylint: disable=broad-except
+        try:
+            with pool.connection() as client:
+                client.query_async(match_query, -1, '*:0', _on_record)
+            _put((_END, None))
+        except Exception as e:
+            _put((_ERROR, e))
+        # pylint: enable=broad-except
+
+    thread = threading.Thread(target=_run_query, name='stream_query_rows')
+    thread.daemon = True
+    thread.start()
+
+    try:
+        while True:
+            kind, payload = buffer.get()
+            if kind == _ROW:
+                yield payload
+            elif kind == _ERROR:
+                raise payload
+            else:
+                return
+    finally:
+        cancelled.set()
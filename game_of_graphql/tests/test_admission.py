@@ -0,0 +1,90 @@
+# Copyright 2017 Kensho Technologies, Inc.
+import threading
+import time
+import unittest
+
+from game_of_graphql.admission import AdmissionController, AdmissionRejectedError
+
+
+def _wait_until(condition, timeout=5.0):
+    """Wait until the condition function returns True, failing if it takes too long."""
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:
+            raise AssertionError(u'Condition not met within {} seconds.'.format(timeout))
+        time.sleep(0.001)
+
+
+class AdmissionControllerTests(unittest.TestCase):
+    def test_waiting_query_is_admitted_once_the_holder_releases(self):
+        controller = AdmissionController(1, 1, 60.0)
+        controller.acquire()
+
+        admitted = threading.Event()
+
+        def _acquire_and_release():
+            """Wait to be admitted, then release right away."""
+            with controller.admit():
+                admitted.set()
+
+        waiter = threading.Thread(target=_acquire_and_release)
+        waiter.daemon = True
+        waiter.start()
+        _wait_until(lambda: controller.stats()['queued'] == 1)
+        self.assertFalse(admitted.is_set())
+
+        controller.release()
+        waiter.join()
+        self.assertTrue(admitted.is_set())
+        stats = controller.stats()
+        self.assertEqual(2, stats['admitted'])
+        self.assertEqual(0, stats['rejected'])
+        self.assertEqual(0, stats['active'])
+        self.assertEqual(0, stats['queued'])
+
+    def test_query_is_rejected_when_the_queue_is_full(self):
+        controller = AdmissionController(1, 0, 60.0)
+        controller.acquire()
+
+        start_time = time.time()
+        with self.assertRaises(AdmissionRejectedError):
+            controller.acquire()
+        # The query is rejected right away, rather than after the queue timeout.
+        self.assertLess(time.time() - start_time, 30.0)
+
+        stats = controller.stats()
+        self.assertEqual(1, stats['admitted'])
+        self.assertEqual(1, stats['rejected'])
+        self.assertEqual(1, stats['active'])
+
+        controller.release()
+        controller.acquire()
+        self.assertEqual(2, controller.stats()['admitted'])
+
+    def test_query_is_rejected_after_the_queue_timeout(self):
+        controller = AdmissionController(1, 1, 0.01)
+        controller.acquire()
+
+        with self.assertRaises(AdmissionRejectedError):
+            controller.acquire()
+
+        stats = controller.stats()
+        self.assertEqual(1, stats['rejected'])
+        self.assertEqual(0, stats['queued'])
+        self.assertEqual(1, stats['active'])
+
+    def test_admit_releases_on_error(self):
+        controller = AdmissionController(1, 0, 60.0)
+        with self.assertRaises(ValueError):
+            with controller.admit():
+                raise ValueError(u'The query failed.')
+
+        self.assertEqual(0, controller.stats()['active'])
+        with controller.admit():
+            self.assertEqual(1, controller.stats()['active'])
+
+    def test_invalid_limits_are_rejected(self):
+        with self.assertRaises(ValueError):
+            AdmissionController(0, 1, 1.0)
+        with self.assertRaises(ValueError):
+            AdmissionController(1, -1, 1.0)
@@ -0,0 +1,160 @@
+# Copyright 2017 Kensho Technologies, Inc.
+from contextlib import contextmanager
+import json
+import re
+import unittest
+
+from game_of_graphql import server
+from game_of_graphql.admission import AdmissionController
+from game_of_graphql.execution import QueryExecutor
+from game_of_graphql.query_cache import CompiledQueryCache, ResultCache
+from game_of_graphql.single_flight import SingleFlight
+
+
+OLD_FINGERPRINT = '0' * 64
+NEW_FINGERPRINT = '1' * 64
+
+REGIONS_QUERY = '''{
+    Region {
+        name @output(out_name: "name")
+    }
+}'''
+
+ANCESTORS_QUERY = '''{
+    Region {
+        name @output(out_name: "name")
+        out_Has_Parent_Region @recurse(depth: 2) {
+            name @output(out_name: "ancestor")
+        }
+    }
+}'''
+
+
+class _Record(object):
+    """A stand-in for the records returned by pyorient."""
+
+    def __init__(self, record_data):
+        """Create a record with the given data."""
+        self.oRecordData = record_data
+
+
+class _FakeDatabase(object):
+    """A stand-in for a pool of sessions to a database whose data is replaced by syncs."""
+
+    def __init__(self, fingerprint, region_hierarchy_depth, names):
+        """Create a database holding the named regions, built from data with the fingerprint."""
+        self.fingerprint = fingerprint
+        self.region_hierarchy_depth = region_hierarchy_depth
+        self.names = names
+        self.executed_queries = []
+
+    def sync(self, fingerprint, region_hierarchy_depth, names):
+        """Replace the data in the database, as a completed sync would."""
+        self.fingerprint = fingerprint
+        self.region_hierarchy_depth = region_hierarchy_depth
+        self.names = names
+
+    @contextmanager
+    def connection(self):
+        """Check out a session to the database."""
+        yield self
+
+    def query(self, query, limit):
+        """Return the DatasetInfo record."""
+        return [_Record({
+            'fingerprint': self.fingerprint,
+            'schema_fingerprint': None,
+            'region_hierarchy_depth': self.region_hierarchy_depth,
+        })]
+
+    def command(self, query):
+        """Return one row per region name, in the range selected by the MATCH query."""
+        self.executed_queries.append(query)
+        rows = [_Record({'name': name}) for name in self.names]
+        match = re.search(r' SKIP (\d+) LIMIT (-?\d+)$', query)
+        if match is not None:
+            skip, limit = int(match.group(1)), int(match.group(2))
+            rows = rows[skip:skip + limit] if limit >= 0 else rows[skip:]
+        return rows
+
+
+class DatasetChangeTests(unittest.TestCase):
+    def setUp(self):
+        self.database = _FakeDatabase(OLD_FINGERPRINT, 3, ['Westeros', 'Winterfell', 'Riverrun'])
+
+        global_values = {
+            'memory_graph': None,
+            'connection_pool': self.database,
+            'query_executor': QueryExecutor(2),
+            'batch_executor': QueryExecutor(2),
+            'compiled_query_cache': CompiledQueryCache(
+                server.schema, rewrite_query=server.get_orientdb_query_rewrite(3)),
+            'result_cache': ResultCache(),
+            'admission_controller': AdmissionController(2, 2, 1.0),
+            'query_single_flight': SingleFlight(),
+            'query_registry': None,
+            'max_query_cost': None,
+            'query_timeout': None,
+            'dataset_check_interval': 0.0,
+        }
+        for name, value in global_values.items():
+            self.addCleanup(setattr, server, name, getattr(server, name))
+            setattr(server, name, value)
+        self.addCleanup(server.query_executor.close)
+        self.addCleanup(server.batch_executor.close)
+        server.result_cache.invalidate(generation=OLD_FINGERPRINT)
+
+        self.client = server.app.test_client()
+
+    def _post_query(self, query, page_size=2, cursor=None, etag=None):
+        """Send the query to /graphql, and return the response."""
+        data = {'query': query, 'args': {}, 'page_size': page_size}
+        if cursor is not None:
+            data['cursor'] = cursor
+        headers = {'If-None-Match': etag} if etag is not None else {}
+        return self.client.post('/graphql', data=json.dumps(data), headers=headers)
+
+    def test_sync_changes_results_and_etags(self):
+        response = self._post_query(REGIONS_QUERY)
+        self.assertEqual(200, response.status_code)
+        result = json.loads(response.data.decode('utf-8'))
+        self.assertEqual([{'name': 'Westeros'}, {'name': 'Winterfell'}], result['output_data'])
+        old_etag = response.headers['ETag'].strip('"')
+
+        self.assertEqual(304, self._post_query(REGIONS_QUERY, etag=old_etag).status_code)
+
+        self.database.sync(NEW_FINGERPRINT, 3, ['Essos', 'Braavos'])
+
+        response = self._post_query(REGIONS_QUERY, etag=old_etag)
+        self.assertEqual(200, response.status_code)
+        result = json.loads(response.data.decode('utf-8'))
+        self.assertEqual([{'name': 'Essos'}, {'name': 'Braavos'}], result['output_data'])
+        self.assertNotEqual(old_etag, response.headers['ETag'].strip('"'))
+        self.assertEqual(NEW_FINGERPRINT, server.result_cache.generation)
+
+    def test_sync_invalidates_cursors(self):
+        response = self._post_query(REGIONS_QUERY)
+        cursor = json.loads(response.data.decode('utf-8'))['next_cursor']
+        self.assertIsNotNone(cursor)
+        self.assertEqual(200, self._post_query(REGIONS_QUERY, cursor=cursor).status_code)
+
+        self.database.sync(NEW_FINGERPRINT, 3, ['Essos', 'Braavos', 'Pentos'])
+
+        self.assertEqual(400, self._post_query(REGIONS_QUERY, cursor=cursor).status_code)
+
+    def test_sync_recompiles_queries_for_new_hierarchy_depth(self):
+        self._post_query(ANCESTORS_QUERY)
+        self.assertNotIn('Has_Ancestor_Region', self.database.executed_queries[-1])
+
+        self.database.sync(NEW_FINGERPRINT, 2, ['Westeros', 'Winterfell', 'Riverrun'])
+
+        self._post_query(ANCESTORS_QUERY)
+        self.assertIn('Has_Ancestor_Region', self.database.executed_queries[-1])
+
+    def test_results_are_not_cached_across_checks_during_sync(self):
+        self._post_query(REGIONS_QUERY)
+        self.database.sync(None, None, ['Westeros', 'Essos'])
+
+        self._post_query(REGIONS_QUERY)
+        self._post_query(REGIONS_QUERY)
+        self.assertEqual(3, len(self.database.executed_queries))
@@ -0,0 +1,156 @@
+# Copyright 2017 Kensho Technologies, Inc.
+import re
+import unittest
+
+from game_of_graphql.existing_dataset import (MISSING_PARENT_REGION_CHILD_NAMES,
+                                              MISSING_REGION_LINKS, WESTEROS_REGION_RID,
+                                              AmbiguousNameError, NameIndex, NameLookupError,
+                                              _load_missing_region_edges,
+                                              get_polymorphic_cluster_ids, iterate_query_records)
+from game_of_graphql.offline_benchmark import ReplayClient
+
+
+SCHEMA_CLASSES = [
+    {'name': 'V', 'superClass': None, 'clusterIds': [9]},
+    {'name': 'Abstract_Place', 'superClasses': ['V'], 'clusterIds': [-1]},
+    {'name': 'Region', 'superClasses': ['Abstract_Place'], 'clusterIds': [13, 14]},
+    {'name': 'Settlement', 'superClasses': ['Region'], 'clusterIds': [17]},
+    {'name': 'Character', 'superClass': 'V', 'clusterIds': [11]},
+    {'name': 'E', 'clusterIds': [10]},
+]
+
+
+def _make_region(rid, name, alias=()):
+    """Return the data of a region."""
+    return {'rid': rid, 'name': name, 'alias': list(alias)}
+
+
+def _make_linked_regions():
+    """Return a dict of rid -> region, with a region for each name in the missing links."""
+    names = set(MISSING_REGION_LINKS)
+    for children_names in (list(MISSING_PARENT_REGION_CHILD_NAMES.values()) +
+                           list(MISSING_REGION_LINKS.values())):
+        names.update(children_names)
+    return {
+        u'#1:{}'.format(index): _make_region(u'#1:{}'.format(index), name)
+        for index, name in enumerate(sorted(names))
+    }
+
+
+class _QueryLoggingClient(object):
+    """Wrap a client, recording the queries sent to it."""
+
+    def __init__(self, client):
+        """Record the queries sent to the given client."""
+        self._client = client
+        self.queries = []
+
+    def query(self, query, limit):
+        """Run the query, and record it."""
+        self.queries.append(query)
+        return self._client.query(query, limit)
+
+
+class PolymorphicClusterIdsTests(unittest.TestCase):
+    def test_clusters_of_subclasses_are_included(self):
+        self.assertEqual([9, 11, 13, 14, 17], get_polymorphic_cluster_ids(SCHEMA_CLASSES, 'V'))
+        self.assertEqual([13, 14, 17],
+                         get_polymorphic_cluster_ids(SCHEMA_CLASSES, 'Abstract_Place'))
+        self.assertEqual([17], get_polymorphic_cluster_ids(SCHEMA_CLASSES, 'Settlement'))
+        self.assertEqual([10], get_polymorphic_cluster_ids(SCHEMA_CLASSES, 'E'))
+
+    def test_unknown_class(self):
+        with self.assertRaises(ValueError):
+            get_polymorphic_cluster_ids(SCHEMA_CLASSES, 'Noble_house')
+
+
+class IterateQueryRecordsTests(unittest.TestCase):
+    def test_records_are_paged_through_one_cluster_at_a_time(self):
+        characters = [
+            {'rid': {'@rid': u'#{}:{}'.format(cluster_id, position)},
+             'name': u'Person{}{}'.format(cluster_id, position)}
+            for cluster_id, count in ((15, 2), (11, 3))
+            for position in range(count)
+        ]
+        client = _QueryLoggingClient(ReplayClient({'characters': characters}))
+
+        records = list(iterate_query_records(client, 'name', 'Character', None, 2))
+        self.assertEqual(['Person110', 'Person111', 'Person112', 'Person150', 'Person151'],
+                         [record['name'] for record in records])
+
+        page_queries = client.queries[1:]
+        self.assertEqual([11, 11, 15, 15], [
+            int(re.search(r' FROM cluster:(\d+)', query).group(1))
+            for query in page_queries
+        ])
+        self.assertIn(u'@rid > #11:1', page_queries[1])
+        self.assertNotIn(u'ORDER BY', page_queries[0])
+
+    def test_invalid_class_name(self):
+        with self.assertRaises(ValueError):
+            list(iterate_query_records(ReplayClient({}), 'name', 'V; DELETE VERTEX V', None, 2))
+
+
+class NameIndexTests(unittest.TestCase):
+    def setUp(self):
+        self.index = NameIndex({
+            '#1:0': _make_region('#1:0', 'Winterfell', ['Winter Castle']),
+            '#1:1': _make_region('#1:1', 'Castle Black', ['The Castle']),
+            '#1:2': _make_region('#1:2', 'Casterly Rock', ['The Castle', 'The Rock']),
+            '#1:3': _make_region('#1:3', 'The Rock'),
+            '#1:4': _make_region('#1:4', 'Oldtown'),
+            '#1:5': _make_region('#1:5', 'Oldtown'),
+        }, 'region')
+
+    def test_lookup_by_name(self):
+        self.assertEqual('#1:0', self.index.get_rid('Winterfell'))
+
+    def test_lookup_by_alias(self):
+        self.assertEqual('#1:0', self.index.get_rid('Winter Castle'))
+
+    def test_names_take_precedence_over_aliases(self):
+        self.assertEqual('#1:3', self.index.get_rid('The Rock'))
+
+    def test_ambiguous_name(self):
+        with self.assertRaises(AmbiguousNameError):
+            self.index.get_rid('Oldtown')
+        with self.assertRaises(AmbiguousNameError):
+            self.index.get_rid('The Castle')
+
+    def test_missing_name(self):
+        with self.assertRaises(NameLookupError) as context:
+            self.index.get_rid('Harrenhal')
+        self.assertNotIsInstance(context.exception, AmbiguousNameError)
+
+
+class MissingRegionEdgesTests(unittest.TestCase):
+    def test_all_links_are_filled_in(self):
+        regions = _make_linked_regions()
+        edges = _load_missing_region_edges(NameIndex(regions, 'region'))
+
+        rids_by_name = {region['name']: rid for rid, region in regions.items()}
+        self.assertIn((rids_by_name['The North'], WESTEROS_REGION_RID), edges)
+        self.assertIn((rids_by_name['Cerwyn'], rids_by_name['The North']), edges)
+
+    def test_links_of_ambiguous_names_are_skipped(self):
+        regions = _make_linked_regions()
+        rids_by_name = {region['name']: rid for rid, region in regions.items()}
+        regions['#2:0'] = _make_region('#2:0', 'The North')
+
+        with self.assertLogs('game_of_graphql.existing_dataset', 'WARNING') as logs:
+            edges = _load_missing_region_edges(NameIndex(regions, 'region'))
+
+        self.assertEqual(2, len(logs.records))
+        for edge in edges:
+            self.assertNotIn('#2:0', edge)
+            self.assertNotIn(rids_by_name['The North'], edge)
+        # Links of other regions are still filled in.
+        self.assertIn((rids_by_name['The Nightfort'], rids_by_name['The Wall']), edges)
+
+    def test_links_of_missing_names_are_an_error(self):
+        regions = _make_linked_regions()
+        rids_by_name = {region['name']: rid for rid, region in regions.items()}
+        del regions[rids_by_name['Cerwyn']]
+
+        with self.assertRaises(NameLookupError):
+            _load_missing_region_edges(NameIndex(regions, 'region'))
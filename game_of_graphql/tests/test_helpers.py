@@ -0,0 +1,73 @@
+# Copyright 2017 Kensho Technologies, Inc.
+
+
+def make_fixture_data():
+    """Return a small graph, in the form returned by existing_dataset.load_all_data()."""
+    region_names = [
+        ('#13:0', 'World', []),
+        ('#13:1', 'Westeros', ['The Seven Kingdoms']),
+        ('#13:2', 'The Riverlands', []),
+        ('#13:3', 'Riverrun', []),
+        ('#13:4', 'King\'s Landing', []),
+        ('#13:5', 'Great Sept of Baelor', []),
+        ('#13:6', 'Winterfell', []),
+        ('#13:7', 'Mormont Keep', []),
+    ]
+    house_names = [
+        ('#12:0', 'Tully', ['House Tully'], ['Family, Duty, Honor']),
+        ('#12:1', 'Stark', ['House Stark'], ['Winter is Coming']),
+        ('#12:2', 'Mormont', ['House Mormont'], ['Here We Stand']),
+    ]
+    character_names = [
+        ('#11:0', 'Sansa Stark', ['Little Bird']),
+        ('#11:1', 'Catelyn Stark', ['Catelyn Tully']),
+        ('#11:2', 'Edmure Tully', []),
+        ('#11:3', 'Hodor', []),
+        ('#11:4', 'Brynden Tully', ['Blackfish']),
+        ('#11:5', 'Arya Stark', []),
+    ]
+    return {
+        'regions': {
+            rid: {'rid': rid, 'name': name, 'alias': alias}
+            for rid, name, alias in region_names
+        },
+        'houses': {
+            rid: {'rid': rid, 'name': name, 'alias': alias, 'motto': motto}
+            for rid, name, alias, motto in house_names
+        },
+        'characters': {
+            rid: {'rid': rid, 'name': name, 'alias': alias}
+            for rid, name, alias in character_names
+        },
+        'has_parent_region': {
+            ('#13:1', '#13:0'),  # Westeros is in the World.
+            ('#13:2', '#13:1'),  # The Riverlands are in Westeros.
+            ('#13:3', '#13:2'),  # Riverrun is in the Riverlands.
+            ('#13:4', '#13:1'),  # King's Landing is in Westeros.
+            ('#13:5', '#13:4'),  # The Great Sept of Baelor is in King's Landing.
+            ('#13:6', '#13:1'),  # Winterfell is in Westeros.
+            ('#13:7', '#13:1'),  # Mormont Keep is in Westeros.
+        },
+        'has_seat': {
+            ('#12:0', '#13:3'),  # Tully -> Riverrun
+            ('#12:1', '#13:6'),  # Stark -> Winterfell
+            ('#12:2', '#13:7'),  # Mormont -> Mormont Keep
+        },
+        'lives_in': {
+            ('#11:0', '#13:6'),  # Sansa -> Winterfell
+            ('#11:1', '#13:3'),  # Catelyn -> Riverrun
+            ('#11:2', '#13:3'),  # Edmure -> Riverrun
+            ('#11:4', '#13:2'),  # Brynden -> The Riverlands
+        },
+        'owes_allegiance_to': {
+            ('#11:0', '#12:1'),  # Sansa -> Stark
+            ('#11:0', '#11:1'),  # Sansa -> Catelyn
+            ('#11:1', '#12:0'),  # Catelyn -> Tully
+            ('#11:1', '#12:1'),  # Catelyn -> Stark
+            ('#11:1', '#12:2'),  # Catelyn -> Mormont
+            ('#11:2', '#12:0'),  # Edmure -> Tully
+            ('#11:2', '#11:1'),  # Edmure -> Catelyn
+            ('#11:4', '#12:0'),  # Brynden -> Tully
+            ('#11:5', '#12:1'),  # Arya -> Stark
+        },
+    }
@@ -0,0 +1,242 @@
+# Copyright 2017 Kensho Technologies, Inc.
+import json
+import time
+import unittest
+
+from graphql_compiler import compile_graphql_to_match
+
+from game_of_graphql.demo_queries import DEMO_QUERIES
+from game_of_graphql.memory_backend import InMemoryGraph, QueryDeadlineError
+from game_of_graphql.new_dataset import compute_region_ancestry
+from game_of_graphql.server import get_orientdb_query_rewrite, schema
+from game_of_graphql.tests.test_helpers import make_fixture_data
+
+
+def _sort_rows(rows):
+    """Return the result rows in a canonical order, since queries promise none."""
+    return sorted(rows, key=lambda row: json.dumps(row, sort_keys=True))
+
+
+class InMemoryGraphTests(unittest.TestCase):
+    def setUp(self):
+        """Build the in-memory graph of the fixture data."""
+        self.maxDiff = None
+        self.data = make_fixture_data()
+        self.graph = InMemoryGraph(self.data)
+
+    def assertResultRows(self, query, args, expected_rows):
+        """Assert that the query is valid, and that it produces exactly the expected rows."""
+        compile_graphql_to_match(schema, query)
+        self.assertEqual(_sort_rows(expected_rows),
+                         _sort_rows(self.graph.execute(query, args)))
+
+    def assertDemoQueryRows(self, name, expected_rows, args=None):
+        """Assert that the named Demo query produces exactly the expected rows."""
+        demo_query, = [x for x in DEMO_QUERIES if x.name == name]
+        self.assertResultRows(
+            demo_query.query, demo_query.args if args is None else args, expected_rows)
+
+    def test_all_region_names(self):
+        self.assertDemoQueryRows('all_region_names', [
+            {'region_name': 'World'},
+            {'region_name': 'Westeros'},
+            {'region_name': 'The Riverlands'},
+            {'region_name': 'Riverrun'},
+            {'region_name': 'King\'s Landing'},
+            {'region_name': 'Great Sept of Baelor'},
+            {'region_name': 'Winterfell'},
+            {'region_name': 'Mormont Keep'},
+        ])
+
+    def test_houses_with_seat_named_after_them(self):
+        self.assertDemoQueryRows('houses_with_seat_named_after_them', [
+            {'house': 'Mormont', 'region': 'Mormont Keep'},
+        ])
+
+    def test_parent_regions_of_region(self):
+        # The recursion starts at the region's parent, and includes it.
+        self.assertDemoQueryRows('parent_regions_of_region', [
+            {'parent_region': 'King\'s Landing'},
+            {'parent_region': 'Westeros'},
+            {'parent_region': 'World'},
+        ])
+
+    def test_parent_regions_of_region_by_alias(self):
+        self.assertDemoQueryRows('parent_regions_of_region', [
+            {'parent_region': 'World'},
+        ], args={'region': 'The Seven Kingdoms'})
+
+    def test_parent_regions_of_unknown_region(self):
+        self.assertDemoQueryRows('parent_regions_of_region', [], args={'region': 'Essos'})
+
+    def test_people_living_in_region(self):
+        # Edmure's allegiance to Catelyn is left out of the fold, which only has noble houses.
+        self.assertDemoQueryRows('people_living_in_region', [
+            {
+                'region_name': 'The Riverlands',
+                'character_name': 'Brynden Tully',
+                'loyal_to_noble_houses': ['Tully'],
+            },
+            {
+                'region_name': 'Riverrun',
+                'character_name': 'Catelyn Stark',
+                'loyal_to_noble_houses': ['Tully', 'Stark', 'Mormont'],
+            },
+            {
+                'region_name': 'Riverrun',
+                'character_name': 'Edmure Tully',
+                'loyal_to_noble_houses': ['Tully'],
+            },
+        ])
+
+    def test_allegiances_of_character(self):
+        self.assertDemoQueryRows('allegiances_of_character', [
+            {
+                'allegiance_type': ['Character', 'NobleHouse'],
+                'allegiances': ['Catelyn Stark', 'Stark'],
+            },
+        ])
+
+    def test_allegiances_of_character_without_any(self):
+        # A fold over no edges still produces its row, with empty lists.
+        self.assertDemoQueryRows('allegiances_of_character', [
+            {'allegiance_type': [], 'allegiances': []},
+        ], args={'character': 'Hodor'})
+
+    def test_characters_with_many_allegiances(self):
+        self.assertDemoQueryRows('characters_with_many_allegiances', [
+            {'character': 'Catelyn Stark', 'allegiances': ['Tully', 'Stark', 'Mormont']},
+        ])
+
+    def test_characters_with_any_allegiances(self):
+        # Only allegiances to noble houses are counted, so Hodor is left out.
+        self.assertDemoQueryRows('characters_with_many_allegiances', [
+            {'character': 'Sansa Stark', 'allegiances': ['Stark']},
+            {'character': 'Catelyn Stark', 'allegiances': ['Tully', 'Stark', 'Mormont']},
+            {'character': 'Edmure Tully', 'allegiances': ['Tully']},
+            {'character': 'Brynden Tully', 'allegiances': ['Tully']},
+            {'character': 'Arya Stark', 'allegiances': ['Stark']},
+        ], args={'min_allegiances': 1})
+
+    def test_characters_owing_many_allegiances(self):
+        # Allegiances to characters are counted too.
+        self.assertDemoQueryRows('characters_owing_many_allegiances', [
+            {'character': 'Sansa Stark'},
+            {'character': 'Catelyn Stark'},
+            {'character': 'Edmure Tully'},
+        ], args={'min_allegiances': 2})
+
+    def test_optional_edge(self):
+        query = '''{
+            Character {
+                name @output(out_name: "character")
+                out_Lives_In @optional {
+                    name @output(out_name: "home")
+                }
+            }
+        }'''
+        self.assertResultRows(query, {}, [
+            {'character': 'Sansa Stark', 'home': 'Winterfell'},
+            {'character': 'Catelyn Stark', 'home': 'Riverrun'},
+            {'character': 'Edmure Tully', 'home': 'Riverrun'},
+            {'character': 'Hodor', 'home': None},
+            {'character': 'Brynden Tully', 'home': 'The Riverlands'},
+            {'character': 'Arya Stark', 'home': None},
+        ])
+
+    def test_filter_on_tag_from_missing_optional_edge(self):
+        # Filters on a tag of an optional scope whose edge is missing let all values through.
+        query = '''{
+            Character {
+                name @output(out_name: "character")
+                out_Lives_In @optional {
+                    name @tag(tag_name: "home")
+                }
+                out_Owes_Allegiance_To {
+                    ... on NobleHouse {
+                        out_Has_Seat {
+                            name @filter(op_name: "=", value: ["%home"])
+                                 @output(out_name: "seat")
+                        }
+                    }
+                }
+            }
+        }'''
+        self.assertResultRows(query, {}, [
+            {'character': 'Sansa Stark', 'seat': 'Winterfell'},
+            {'character': 'Catelyn Stark', 'seat': 'Riverrun'},
+            {'character': 'Edmure Tully', 'seat': 'Riverrun'},
+            {'character': 'Arya Stark', 'seat': 'Winterfell'},
+        ])
+
+    def test_list_and_collection_filters(self):
+        query = '''{
+            NobleHouse {
+                name @filter(op_name: "in_collection", value: ["$names"])
+                     @output(out_name: "house")
+                motto @filter(op_name: "contains", value: ["$motto"])
+            }
+        }'''
+        self.assertResultRows(query, {'names': ['Tully', 'Stark'], 'motto': 'Winter is Coming'}, [
+            {'house': 'Stark'},
+        ])
+        self.assertResultRows(query, {'names': ['Tully'], 'motto': 'Winter is Coming'}, [])
+
+    def test_comparison_filters(self):
+        query = '''{
+            Region {
+                name @filter(op_name: "!=", value: ["$excluded"])
+                     @filter(op_name: "has_substring", value: ["$substring"])
+                     @output(out_name: "region")
+            }
+        }'''
+        self.assertResultRows(query, {'excluded': 'Riverrun', 'substring': 'er'}, [
+            {'region': 'Westeros'},
+            {'region': 'The Riverlands'},
+            {'region': 'Winterfell'},
+        ])
+
+    def test_recursion_depth(self):
+        query = '''{
+            Region @filter(op_name: "name_or_alias", value: ["$region"]) {
+                out_Has_Parent_Region @recurse(depth: 1) {
+                    name @output(out_name: "ancestor")
+                }
+            }
+        }'''
+        self.assertResultRows(query, {'region': 'Riverrun'}, [
+            {'ancestor': 'Riverrun'},
+            {'ancestor': 'The Riverlands'},
+        ])
+
+    def test_degree_properties(self):
+        query = '''{
+            Region {
+                name @output(out_name: "region")
+                degree_in_Lives_In @filter(op_name: ">", value: ["$min_residents"])
+                                   @output(out_name: "residents")
+            }
+        }'''
+        self.assertResultRows(query, {'min_residents': 0}, [
+            {'region': 'The Riverlands', 'residents': 1},
+            {'region': 'Riverrun', 'residents': 2},
+            {'region': 'Winterfell', 'residents': 1},
+        ])
+
+    def test_deadline_is_checked_during_traversal(self):
+        demo_query, = [x for x in DEMO_QUERIES if x.name == 'people_living_in_region']
+        rows = self.graph.execute(demo_query.query, demo_query.args, deadline=time.time() - 1)
+        # The query is aborted while traversing the graph, before it produces its first row.
+        with self.assertRaises(QueryDeadlineError):
+            next(rows)
+
+    def test_rewritten_demo_queries(self):
+        # The queries the server executes in OrientDB are rewritten to use the precomputed
+        # region ancestry and degrees, and must produce the same rows as the originals.
+        _, region_hierarchy_depth = compute_region_ancestry(self.data)
+        rewrite_query = get_orientdb_query_rewrite(region_hierarchy_depth)
+        for demo_query in DEMO_QUERIES:
+            rewritten_query = rewrite_query(demo_query.query)
+            self.assertResultRows(
+                rewritten_query, demo_query.args,
+                list(self.graph.execute(demo_query.query, demo_query.args)))
@@ -0,0 +1,20 @@
+# Copyright 2017 Kensho Technologies, Inc.
+import unittest
+
+from game_of_graphql import server
+
+
+class MetricsEndpointTests(unittest.TestCase):
+    def setUp(self):
+        self.addCleanup(setattr, server, 'serve_metrics', server.serve_metrics)
+        self.client = server.app.test_client()
+
+    def test_metrics_are_served(self):
+        server.serve_metrics = True
+        response = self.client.get('/metrics')
+        self.assertEqual(200, response.status_code)
+        self.assertIn(b'game_of_graphql_query_phase_seconds', response.data)
+
+    def test_metrics_are_not_served_by_several_workers(self):
+        server.serve_metrics = False
+        self.assertEqual(404, self.client.get('/metrics').status_code)
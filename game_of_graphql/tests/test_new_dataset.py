@@ -0,0 +1,152 @@
+# Copyright 2017 Kensho Technologies, Inc.
+from copy import deepcopy
+import unittest
+
+from game_of_graphql.new_dataset import (REGION_ANCESTRY_EDGE_CLASS, _get_edge_records,
+                                         compute_graph_delta, get_vertex_records, get_vertex_uuid)
+
+
+def _make_data():
+    """Return a tiny dataset, in the form returned by existing_dataset.load_all_data()."""
+    return {
+        'regions': {
+            '#13:0': {'rid': '#13:0', 'name': 'Westeros', 'alias': []},
+            '#13:1': {'rid': '#13:1', 'name': 'Winterfell', 'alias': []},
+        },
+        'houses': {
+            '#12:0': {'rid': '#12:0', 'name': 'Stark', 'alias': ['House Stark'],
+                      'motto': ['Winter is Coming']},
+        },
+        'characters': {
+            '#11:0': {'rid': '#11:0', 'name': 'Arya Stark', 'alias': []},
+            '#11:1': {'rid': '#11:1', 'name': 'Hodor', 'alias': []},
+        },
+        'has_parent_region': {('#13:1', '#13:0')},
+        'has_seat': {('#12:0', '#13:1')},
+        'lives_in': {('#11:1', '#13:1')},
+        'owes_allegiance_to': {('#11:0', '#12:0')},
+    }
+
+
+def _get_graph_rid(rid):
+    """Return the rid that the graph built by _build_graph() gives the vertex with the rid."""
+    return u'#9{}'.format(rid[1:])
+
+
+def _build_graph(data):
+    """Return the (vertices, edges) of a graph built from the data, as read during a sync."""
+    vertices = {}
+    for class_name, _, records in get_vertex_records(data):
+        for rid, properties in records:
+            vertex_properties = dict(properties)
+            uuid = vertex_properties.pop('uuid')
+            vertices[uuid] = (_get_graph_rid(rid), class_name, vertex_properties)
+
+    edges = {}
+    for class_name, edge_rids in _get_edge_records(data):
+        for out_rid, in_rid in sorted(edge_rids):
+            key = (class_name, get_vertex_uuid(out_rid), get_vertex_uuid(in_rid))
+            edges.setdefault(key, []).append(u'#99:{}'.format(len(edges)))
+    return vertices, edges
+
+
+class GraphDeltaTests(unittest.TestCase):
+    def setUp(self):
+        self.data = _make_data()
+        self.graph_vertices, self.graph_edges = _build_graph(self.data)
+
+    def test_unchanged_data_is_a_no_op(self):
+        delta = compute_graph_delta(self.data, self.graph_vertices, self.graph_edges)
+        self.assertEqual([], delta.vertex_inserts)
+        self.assertEqual([], delta.vertex_updates)
+        self.assertEqual([], delta.vertex_deletes)
+        self.assertEqual([], delta.edge_inserts)
+        self.assertEqual([], delta.edge_deletes)
+        self.assertEqual(len(self.graph_vertices), len(delta.vertex_rids))
+
+    def test_vertex_insert(self):
+        self.data['regions']['#13:2'] = {'rid': '#13:2', 'name': 'The Wall', 'alias': []}
+        self.data['has_parent_region'].add(('#13:2', '#13:0'))
+
+        delta = compute_graph_delta(self.data, self.graph_vertices, self.graph_edges)
+        self.assertEqual(1, len(delta.vertex_inserts))
+        class_name, vertices = delta.vertex_inserts[0]
+        self.assertEqual('Region', class_name)
+        self.assertEqual([get_vertex_uuid('#13:2')], [uuid for uuid, _ in vertices])
+        self.assertEqual('The Wall', vertices[0][1]['name'])
+
+        new_uuid = get_vertex_uuid('#13:2')
+        westeros_uuid = get_vertex_uuid('#13:0')
+        edge_inserts = dict(delta.edge_inserts)
+        self.assertEqual({'Has_Parent_Region', REGION_ANCESTRY_EDGE_CLASS}, set(edge_inserts))
+        self.assertEqual([(new_uuid, westeros_uuid)], edge_inserts['Has_Parent_Region'])
+        self.assertEqual({(new_uuid, new_uuid), (new_uuid, westeros_uuid)},
+                         set(edge_inserts[REGION_ANCESTRY_EDGE_CLASS]))
+
+        # Westeros gains a child region, so its degree counts change.
+        self.assertEqual([(_get_graph_rid('#13:0'), {
+            'degree_in_Has_Parent_Region': 2,
+            'degree_in_Has_Ancestor_Region': 3,
+        })], delta.vertex_updates)
+        self.assertEqual([], delta.vertex_deletes)
+        self.assertEqual([], delta.edge_deletes)
+
+    def test_vertex_update(self):
+        self.data['characters']['#11:1']['alias'] = ['Wylis']
+
+        delta = compute_graph_delta(self.data, self.graph_vertices, self.graph_edges)
+        self.assertEqual([(_get_graph_rid('#11:1'), {'alias': ['Wylis']})], delta.vertex_updates)
+        self.assertEqual([], delta.vertex_inserts)
+        self.assertEqual([], delta.vertex_deletes)
+        self.assertEqual([], delta.edge_inserts)
+        self.assertEqual([], delta.edge_deletes)
+
+    def test_vertex_delete(self):
+        del self.data['characters']['#11:1']
+
+        delta = compute_graph_delta(self.data, self.graph_vertices, self.graph_edges)
+        self.assertEqual([_get_graph_rid('#11:1')], delta.vertex_deletes)
+        self.assertNotIn(get_vertex_uuid('#11:1'), delta.vertex_rids)
+        # Deleting the vertex deletes its edges, so they are not deleted on their own.
+        self.assertEqual([], delta.edge_deletes)
+        self.assertEqual([], delta.edge_inserts)
+        self.assertEqual([(_get_graph_rid('#13:1'), {'degree_in_Lives_In': 0})],
+                         delta.vertex_updates)
+
+    def test_vertex_whose_class_changed_is_recreated(self):
+        hodor = self.data['characters'].pop('#11:1')
+        self.data['houses']['#11:1'] = dict(hodor, motto=['Hodor'])
+
+        delta = compute_graph_delta(self.data, self.graph_vertices, self.graph_edges)
+        self.assertEqual([_get_graph_rid('#11:1')], delta.vertex_deletes)
+        self.assertEqual([('NobleHouse', [get_vertex_uuid('#11:1')])], [
+            (class_name, [uuid for uuid, _ in vertices])
+            for class_name, vertices in delta.vertex_inserts
+        ])
+
+    def test_edge_insert_and_delete(self):
+        self.data['lives_in'] = {('#11:0', '#13:1')}
+
+        delta = compute_graph_delta(self.data, self.graph_vertices, self.graph_edges)
+        self.assertEqual([
+            ('Lives_In', [(get_vertex_uuid('#11:0'), get_vertex_uuid('#13:1'))]),
+        ], delta.edge_inserts)
+        hodor_lives_in = ('Lives_In', get_vertex_uuid('#11:1'), get_vertex_uuid('#13:1'))
+        self.assertEqual(self.graph_edges[hodor_lives_in], delta.edge_deletes)
+        self.assertEqual([], delta.vertex_inserts)
+        self.assertEqual([], delta.vertex_deletes)
+
+    def test_duplicate_edges_are_deleted(self):
+        seat_key = ('Has_Seat', get_vertex_uuid('#12:0'), get_vertex_uuid('#13:1'))
+        self.graph_edges[seat_key].append('#99:100')
+
+        delta = compute_graph_delta(self.data, self.graph_vertices, self.graph_edges)
+        self.assertEqual(['#99:100'], delta.edge_deletes)
+        self.assertEqual([], delta.edge_inserts)
+
+    def test_vertex_uuids_are_stable_across_runs(self):
+        self.assertEqual('bcfd1347-d4fb-5fff-8863-58f042019377', get_vertex_uuid('#11:0'))
+
+        rebuilt_vertices, rebuilt_edges = _build_graph(deepcopy(self.data))
+        self.assertEqual(set(self.graph_vertices), set(rebuilt_vertices))
+        self.assertEqual(set(self.graph_edges), set(rebuilt_edges))
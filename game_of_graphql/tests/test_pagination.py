@@ -0,0 +1,112 @@
+# Copyright 2017 Kensho Technologies, Inc.
+import base64
+import json
+import unittest
+
+from game_of_graphql import server
+from game_of_graphql.pagination import (InvalidCursorError, decode_cursor, encode_cursor,
+                                        get_page_query)
+from game_of_graphql.query_cache import BoundQuery
+
+
+GENERATION = 'a' * 64
+
+
+MATCH_QUERY = (u'SELECT Region___1.name AS `name` FROM (MATCH {class: Region, as: Region___1} '
+               u'RETURN $matches)')
+
+
+def _make_bound_query(args):
+    """Return a BoundQuery of the MATCH query, with the given arguments."""
+    return BoundQuery(None, args, MATCH_QUERY, MATCH_QUERY)
+
+
+def _encode_payload(payload):
+    """Return a cursor holding the given payload."""
+    return base64.urlsafe_b64encode(json.dumps(payload).encode('utf-8')).decode('ascii')
+
+
+class CursorTests(unittest.TestCase):
+    def setUp(self):
+        self.bound_query = _make_bound_query({'region': 'Westeros'})
+
+    def test_cursor_round_trip(self):
+        for offset in (0, 1, 1000, 10 ** 12):
+            cursor = encode_cursor(self.bound_query, offset, GENERATION)
+            self.assertEqual(offset, decode_cursor(self.bound_query, cursor, GENERATION))
+
+    def test_cursor_of_other_arguments_is_rejected(self):
+        cursor = encode_cursor(self.bound_query, 10, GENERATION)
+        other_bound_query = _make_bound_query({'region': 'Essos'})
+        with self.assertRaises(InvalidCursorError):
+            decode_cursor(other_bound_query, cursor, GENERATION)
+
+    def test_cursor_of_other_generation_is_rejected(self):
+        cursor = encode_cursor(self.bound_query, 10, GENERATION)
+        with self.assertRaises(InvalidCursorError):
+            decode_cursor(self.bound_query, cursor, 'b' * 64)
+
+    def test_tampered_cursor_is_rejected(self):
+        cursor = encode_cursor(self.bound_query, 10, GENERATION)
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+        for offset in (-10, 10.5, '10', None, [10]):
+            tampered_payload = dict(payload, offset=offset)
+            with self.assertRaises(InvalidCursorError):
+                decode_cursor(self.bound_query, _encode_payload(tampered_payload), GENERATION)
+
+        with self.assertRaises(InvalidCursorError):
+            decode_cursor(self.bound_query, _encode_payload({'query': payload['query']}),
+                          GENERATION)
+
+    def test_garbage_cursor_is_rejected(self):
+        garbage_cursors = [
+            '',
+            'not a cursor',
+            'bm90IGpzb24=',  # "not json"
+            'WzEsIDJd',  # "[1, 2]"
+            u'été',
+            encode_cursor(self.bound_query, 10, GENERATION)[:-3],
+        ]
+        for cursor in garbage_cursors:
+            with self.assertRaises(InvalidCursorError):
+                decode_cursor(self.bound_query, cursor, GENERATION)
+
+    def test_page_query(self):
+        page_query = get_page_query(self.bound_query, 20, 11)
+        self.assertTrue(page_query.match_query.endswith(' SKIP 20 LIMIT 11'))
+        self.assertTrue(page_query.pretty_match_query.endswith(' SKIP 20 LIMIT 11'))
+        self.assertEqual(self.bound_query.args, page_query.args)
+
+
+class QueryRequestTests(unittest.TestCase):
+    def _parse(self, **data):
+        """Return the QueryRequest parsed from a request with the given data."""
+        request_data = {'query': '{ Region { name @output(out_name: "name") } }', 'args': {}}
+        request_data.update(data)
+        return server._parse_query_request(request_data)
+
+    def test_page_size_defaults_to_the_maximum(self):
+        self.assertEqual(server.max_page_size, self._parse().page_size)
+        self.assertIsNone(self._parse(stream=True).page_size)
+
+    def test_valid_page_sizes(self):
+        for page_size in (1, 10, server.max_page_size):
+            self.assertEqual(page_size, self._parse(page_size=page_size).page_size)
+            self.assertEqual(page_size, self._parse(page_size=page_size, stream=True).page_size)
+
+    def test_invalid_page_sizes_are_rejected(self):
+        for page_size in (0, -1, server.max_page_size + 1, 1.5, '10', True, [10]):
+            with self.assertRaises(server.InvalidRequestError):
+                self._parse(page_size=page_size)
+            with self.assertRaises(server.InvalidRequestError):
+                self._parse(page_size=page_size, stream=True)
+
+    def test_null_page_size_is_only_accepted_when_streaming(self):
+        with self.assertRaises(server.InvalidRequestError):
+            self._parse(page_size=None)
+        self.assertIsNone(self._parse(page_size=None, stream=True).page_size)
+
+    def test_non_string_cursor_is_rejected(self):
+        for cursor in (10, ['cursor'], {'offset': 10}):
+            with self.assertRaises(server.InvalidRequestError):
+                self._parse(cursor=cursor)
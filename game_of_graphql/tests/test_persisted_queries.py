@@ -0,0 +1,126 @@
+# Copyright 2017 Kensho Technologies, Inc.
+import json
+from os import path
+import shutil
+import tempfile
+import unittest
+
+from game_of_graphql import server
+from game_of_graphql.metrics import PhaseTimer
+from game_of_graphql.persisted_queries import (QueryRegistry, QueryRegistryError,
+                                               UnknownQueryIdError, UnregisteredQueryError,
+                                               read_query_registry_file)
+from game_of_graphql.query_cache import CompiledQueryCache
+
+
+REGION_NAMES_QUERY = '''{
+    Region {
+        name @output(out_name: "region")
+    }
+}'''
+
+REGION_BY_NAME_QUERY = '''{
+    Region {
+        name @filter(op_name: "=", value: ["$region"]) @output(out_name: "region")
+    }
+}'''
+
+REGISTERED_QUERIES = {
+    'region_names': REGION_NAMES_QUERY,
+    'region_by_name': REGION_BY_NAME_QUERY,
+}
+
+
+class ReadQueryRegistryFileTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.registry_path = path.join(self.directory, 'queries.json')
+
+    def _write_registry_file(self, contents):
+        """Replace the contents of the registry file."""
+        with open(self.registry_path, 'w') as f:
+            f.write(contents)
+
+    def test_read_registry(self):
+        self._write_registry_file(json.dumps(REGISTERED_QUERIES))
+        self.assertEqual(REGISTERED_QUERIES, read_query_registry_file(self.registry_path))
+
+    def test_invalid_json(self):
+        self._write_registry_file('{"region_names": ')
+        with self.assertRaises(QueryRegistryError):
+            read_query_registry_file(self.registry_path)
+
+    def test_not_an_object(self):
+        self._write_registry_file(json.dumps([REGION_NAMES_QUERY]))
+        with self.assertRaises(QueryRegistryError):
+            read_query_registry_file(self.registry_path)
+
+    def test_query_is_not_a_string(self):
+        for query in (None, '', 42, ['{ Region { name @output(out_name: "region") } }']):
+            self._write_registry_file(json.dumps({'region_names': query}))
+            with self.assertRaises(QueryRegistryError):
+                read_query_registry_file(self.registry_path)
+
+
+class QueryRegistryTests(unittest.TestCase):
+    def setUp(self):
+        self.compiled_query_cache = CompiledQueryCache(server.schema)
+
+    def test_lookup_by_id(self):
+        registry = QueryRegistry(REGISTERED_QUERIES, self.compiled_query_cache.get)
+        self.assertEqual(2, len(registry))
+        self.assertEqual(['region_by_name', 'region_names'], [x for x, _ in registry.items()])
+        self.assertIs(self.compiled_query_cache.get(REGION_NAMES_QUERY),
+                      registry.get('region_names'))
+
+    def test_unknown_id(self):
+        registry = QueryRegistry(REGISTERED_QUERIES, self.compiled_query_cache.get)
+        with self.assertRaises(UnknownQueryIdError):
+            registry.get('region_names_and_aliases')
+
+    def test_compile_failure(self):
+        queries = dict(REGISTERED_QUERIES)
+        queries['broken'] = '{ Region { no_such_field @output(out_name: "x") } }'
+        with self.assertRaises(QueryRegistryError):
+            QueryRegistry(queries, self.compiled_query_cache.get)
+
+    def test_unregistered_queries(self):
+        registry = QueryRegistry(REGISTERED_QUERIES, self.compiled_query_cache.get)
+        registry.check_query_text('{ Region { uuid @output(out_name: "uuid") } }')
+
+        registry = QueryRegistry(
+            REGISTERED_QUERIES, self.compiled_query_cache.get, reject_unregistered=True)
+        # Registered queries are recognized regardless of their whitespace.
+        registry.check_query_text(u' '.join(REGION_NAMES_QUERY.split()))
+        with self.assertRaises(UnregisteredQueryError):
+            registry.check_query_text('{ Region { uuid @output(out_name: "uuid") } }')
+
+
+class RegisteredQueryRequestTests(unittest.TestCase):
+    def setUp(self):
+        compiled_query_cache = CompiledQueryCache(server.schema)
+        global_values = {
+            'compiled_query_cache': compiled_query_cache,
+            'query_registry': QueryRegistry(REGISTERED_QUERIES, compiled_query_cache.get),
+            'max_query_cost': None,
+            'dataset_check_interval': None,
+        }
+        for name, value in global_values.items():
+            self.addCleanup(setattr, server, name, getattr(server, name))
+            setattr(server, name, value)
+
+    def test_registered_query_is_bound(self):
+        query_request = server._parse_query_request({
+            'query_id': 'region_by_name',
+            'args': {'region': 'The North'},
+        })
+        bound_query, _ = server._bind_query_request(query_request, PhaseTimer())
+        self.assertIs(server.query_registry.get('region_by_name'), bound_query.compiled_query)
+
+    def test_unknown_query_id_gets_a_404_response(self):
+        response = server.app.test_client().post('/graphql', data=json.dumps({
+            'query_id': 'region_names_and_aliases',
+            'args': {},
+        }))
+        self.assertEqual(404, response.status_code)
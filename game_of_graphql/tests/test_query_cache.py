@@ -0,0 +1,160 @@
+# Copyright 2017 Kensho Technologies, Inc.
+import unittest
+
+from game_of_graphql.query_cache import (CompiledQueryCache, LRUCache, ResultCache, bind_arguments,
+                                         normalize_query_text)
+from game_of_graphql.server import schema
+
+
+REGION_BY_NAME_QUERY = '''{
+    Region {
+        name @filter(op_name: "=", value: ["$region"]) @output(out_name: "region")
+    }
+}'''
+
+
+class NormalizeQueryTextTests(unittest.TestCase):
+    def test_whitespace_is_collapsed(self):
+        query = '''{
+            Region {
+                name   @output(out_name: "region")
+            }
+        }'''
+        self.assertEqual('{ Region { name @output(out_name: "region") } }',
+                         normalize_query_text(query))
+
+    def test_string_literals_are_left_intact(self):
+        query = '{ Region { name @filter(op_name: "=", value: ["  #a \\" b  "]) } }'
+        self.assertEqual(query, normalize_query_text(query))
+
+    def test_comments_are_dropped(self):
+        query = '''{
+            Region {  # All "regions"
+                # name @output(out_name: "commented_out")
+                name @output(out_name: "region")
+            }
+        }'''
+        self.assertEqual('{ Region { name @output(out_name: "region") } }',
+                         normalize_query_text(query))
+
+    def test_comments_do_not_swallow_the_next_line(self):
+        query = '{ Region { # comment\n name @output(out_name: "region") } }'
+        commented_out_query = '{ Region { # comment name @output(out_name: "region") } }'
+        self.assertNotEqual(normalize_query_text(query), normalize_query_text(commented_out_query))
+
+
+class LRUCacheTests(unittest.TestCase):
+    def test_least_recently_used_entries_are_evicted(self):
+        cache = LRUCache(3)
+        for key in ('a', 'b', 'c'):
+            cache.put(key, key.upper())
+        self.assertEqual('A', cache.get('a'))
+
+        cache.put('d', 'D')
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(['A', 'C', 'D'], [cache.get(key) for key in ('a', 'c', 'd')])
+        self.assertEqual(1, cache.stats()['evictions'])
+
+    def test_entries_are_evicted_by_weight(self):
+        cache = LRUCache(10, weigher=len)
+        cache.put('a', 'x' * 4)
+        cache.put('b', 'x' * 4)
+        self.assertEqual(8, cache.stats()['weight'])
+
+        # Making room for this entry takes evicting both earlier ones.
+        cache.put('c', 'x' * 9)
+        self.assertIsNone(cache.get('a'))
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual('x' * 9, cache.get('c'))
+        stats = cache.stats()
+        self.assertEqual(2, stats['evictions'])
+        self.assertEqual(1, stats['entries'])
+        self.assertEqual(9, stats['weight'])
+
+    def test_replacing_an_entry_updates_its_weight(self):
+        cache = LRUCache(10, weigher=len)
+        cache.put('a', 'x' * 8)
+        cache.put('a', 'x' * 2)
+        cache.put('b', 'x' * 8)
+        self.assertEqual('x' * 2, cache.get('a'))
+        self.assertEqual(10, cache.stats()['weight'])
+        self.assertEqual(0, cache.stats()['evictions'])
+
+    def test_values_heavier_than_the_cache_are_not_cached(self):
+        cache = LRUCache(10, weigher=len)
+        cache.put('a', 'x' * 4)
+        cache.put('b', 'x' * 11)
+        self.assertIsNone(cache.get('b'))
+        # Nothing is evicted to make room for a value that would not fit anyway.
+        self.assertEqual('x' * 4, cache.get('a'))
+        stats = cache.stats()
+        self.assertEqual(0, stats['evictions'])
+        self.assertEqual(4, stats['weight'])
+
+    def test_hits_and_misses_are_counted(self):
+        cache = LRUCache(2)
+        cache.put('a', 'A')
+        cache.get('a')
+        cache.get('b')
+        self.assertEqual('default', cache.get('b', 'default'))
+        stats = cache.stats()
+        self.assertEqual(1, stats['hits'])
+        self.assertEqual(2, stats['misses'])
+
+    def test_invalid_size(self):
+        with self.assertRaises(ValueError):
+            LRUCache(0)
+
+
+class ResultCacheTests(unittest.TestCase):
+    def setUp(self):
+        compiled_query_cache = CompiledQueryCache(schema)
+        self.bound_query = bind_arguments(compiled_query_cache.get(REGION_BY_NAME_QUERY),
+                                          {'region': 'The North'})
+        self.other_bound_query = bind_arguments(compiled_query_cache.get(REGION_BY_NAME_QUERY),
+                                                {'region': 'The Reach'})
+        self.rows = [{'region': 'The North'}]
+
+    def test_cached_results(self):
+        cache = ResultCache()
+        self.assertIsNone(cache.get(self.bound_query))
+        cache.put(self.bound_query, self.rows)
+        self.assertEqual(self.rows, cache.get(self.bound_query))
+        self.assertIsNone(cache.get(self.other_bound_query))
+
+    def test_etags_identify_the_query_and_its_arguments(self):
+        cache = ResultCache()
+        self.assertEqual(cache.etag(self.bound_query), cache.etag(self.bound_query))
+        self.assertNotEqual(cache.etag(self.bound_query), cache.etag(self.other_bound_query))
+
+    def test_invalidation_changes_the_etag_and_drops_results(self):
+        cache = ResultCache()
+        cache.invalidate(generation='fingerprint-1')
+        cache.put(self.bound_query, self.rows)
+        etag = cache.etag(self.bound_query)
+
+        # The same generation gives the same ETag, e.g. after a server restart.
+        same_generation_cache = ResultCache()
+        same_generation_cache.invalidate(generation='fingerprint-1')
+        self.assertEqual(etag, same_generation_cache.etag(self.bound_query))
+
+        cache.invalidate(generation='fingerprint-2')
+        self.assertEqual('fingerprint-2', cache.generation)
+        self.assertNotEqual(etag, cache.etag(self.bound_query))
+        self.assertIsNone(cache.get(self.bound_query))
+
+        previous_generation = cache.generation
+        cache.invalidate()
+        self.assertNotEqual(previous_generation, cache.generation)
+
+    def test_results_of_an_older_generation_are_not_returned(self):
+        cache = ResultCache()
+        old_generation = cache.generation
+        cache.invalidate()
+        cache.put(self.bound_query, self.rows, generation=old_generation)
+        self.assertIsNone(cache.get(self.bound_query))
+
+    def test_results_heavier_than_the_cache_are_not_cached(self):
+        cache = ResultCache(max_bytes=10)
+        cache.put(self.bound_query, self.rows)
+        self.assertIsNone(cache.get(self.bound_query))
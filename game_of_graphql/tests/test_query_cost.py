@@ -0,0 +1,110 @@
+# Copyright 2017 Kensho Technologies, Inc.
+import json
+import unittest
+
+from game_of_graphql import server
+from game_of_graphql.metrics import PhaseTimer
+from game_of_graphql.new_dataset import compute_region_ancestry
+from game_of_graphql.query_cache import CompiledQueryCache
+from game_of_graphql.query_cost import QueryCostError, QueryCostEstimator, compute_graph_statistics
+from game_of_graphql.tests.test_helpers import make_fixture_data
+
+
+ALL_REGIONS_QUERY = '''{
+    Region {
+        name @output(out_name: "region")
+    }
+}'''
+
+REGION_BY_NAME_QUERY = '''{
+    Region {
+        name @filter(op_name: "=", value: ["$region"]) @output(out_name: "region")
+    }
+}'''
+
+RESIDENTS_OF_ALL_REGIONS_QUERY = '''{
+    Region {
+        name @output(out_name: "region")
+        in_Lives_In {
+            name @output(out_name: "resident")
+        }
+    }
+}'''
+
+RECURSION_QUERY_TEMPLATE = u'''{{
+    Region {{
+        name @output(out_name: "region")
+        in_Has_Parent_Region @recurse(depth: {}) {{
+            name @output(out_name: "descendant")
+        }}
+    }}
+}}'''
+
+SHALLOW_RECURSION_QUERY = RECURSION_QUERY_TEMPLATE.format(1)
+DEEP_RECURSION_QUERY = RECURSION_QUERY_TEMPLATE.format(10)
+
+
+def _make_estimator():
+    """Return a QueryCostEstimator for the fixture graph."""
+    data = make_fixture_data()
+    region_ancestry, _ = compute_region_ancestry(data)
+    return QueryCostEstimator(server.schema, *compute_graph_statistics(data, region_ancestry))
+
+
+class QueryCostEstimatorTests(unittest.TestCase):
+    def setUp(self):
+        self.estimator = _make_estimator()
+
+    def test_scan_visits_every_vertex(self):
+        self.assertEqual(8.0, self.estimator.estimate(ALL_REGIONS_QUERY))
+
+    def test_indexed_filter_visits_one_vertex(self):
+        self.assertEqual(1.0, self.estimator.estimate(REGION_BY_NAME_QUERY))
+
+    def test_traversal_adds_the_vertices_it_visits(self):
+        # The fixture graph has 4 Lives_In edges.
+        self.assertEqual(8.0 + 4.0, self.estimator.estimate(RESIDENTS_OF_ALL_REGIONS_QUERY))
+
+    def test_deeper_recursions_cost_more(self):
+        shallow_cost = self.estimator.estimate(SHALLOW_RECURSION_QUERY)
+        deep_cost = self.estimator.estimate(DEEP_RECURSION_QUERY)
+        self.assertLess(8.0, shallow_cost)
+        self.assertLess(shallow_cost, deep_cost)
+        # A recursion visits at most every Region from each Region it starts from.
+        self.assertLessEqual(deep_cost, 8.0 + 8.0 * 8.0)
+
+
+class QueryCostLimitTests(unittest.TestCase):
+    def setUp(self):
+        global_values = {
+            'compiled_query_cache': CompiledQueryCache(
+                server.schema, estimate_cost=_make_estimator().estimate),
+            'query_registry': None,
+            'max_query_cost': 10.0,
+            'dataset_check_interval': None,
+        }
+        for name, value in global_values.items():
+            self.addCleanup(setattr, server, name, getattr(server, name))
+            setattr(server, name, value)
+
+    def _bind(self, query, args):
+        """Return the (BoundQuery, offset) tuple of a request for the query."""
+        query_request = server._parse_query_request({'query': query, 'args': args})
+        return server._bind_query_request(query_request, PhaseTimer())
+
+    def test_cheap_queries_are_accepted(self):
+        bound_query, offset = self._bind(REGION_BY_NAME_QUERY, {'region': 'The North'})
+        self.assertEqual(1.0, bound_query.compiled_query.estimated_cost)
+        self.assertEqual(0, offset)
+        self._bind(ALL_REGIONS_QUERY, {})
+
+    def test_expensive_queries_are_rejected(self):
+        with self.assertRaises(QueryCostError):
+            self._bind(RESIDENTS_OF_ALL_REGIONS_QUERY, {})
+
+    def test_expensive_queries_get_a_413_response(self):
+        response = server.app.test_client().post('/graphql', data=json.dumps({
+            'query': DEEP_RECURSION_QUERY,
+            'args': {},
+        }))
+        self.assertEqual(413, response.status_code)
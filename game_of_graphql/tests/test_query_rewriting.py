@@ -0,0 +1,183 @@
+# Copyright 2017 Kensho Technologies, Inc.
+import unittest
+
+from graphql import parse
+from graphql.language.printer import print_ast
+from graphql_compiler import compile_graphql_to_match
+
+from game_of_graphql.new_dataset import get_degree_property_name
+from game_of_graphql.query_rewriting import (rewrite_fold_counts_as_degrees,
+                                             rewrite_recursion_as_closure)
+from game_of_graphql.server import schema
+
+
+def _format_query(query):
+    """Return the query as the rewrites print it, to compare queries regardless of formatting."""
+    return print_ast(parse(query))
+
+
+def _rewrite_recursion(query, max_depth=3):
+    """Return the query with its Has_Parent_Region recursions rewritten as closure hops."""
+    return rewrite_recursion_as_closure(
+        query, edge_class='Has_Parent_Region', closure_edge_class='Has_Ancestor_Region',
+        max_depth=max_depth)
+
+
+def _rewrite_fold_counts(query):
+    """Return the query with its count-only folds rewritten as filters on degree fields."""
+    return rewrite_fold_counts_as_degrees(
+        query, schema=schema, get_degree_field_name=get_degree_property_name)
+
+
+class RecursionAsClosureTests(unittest.TestCase):
+    def test_deep_recursion_is_rewritten(self):
+        query = '''{
+            Region {
+                name @filter(op_name: "=", value: ["$region"])
+                out_Has_Parent_Region @recurse(depth: 5) {
+                    name @output(out_name: "ancestor")
+                }
+            }
+        }'''
+        expected_query = '''{
+            Region {
+                name @filter(op_name: "=", value: ["$region"])
+                out_Has_Ancestor_Region {
+                    name @output(out_name: "ancestor")
+                }
+            }
+        }'''
+
+        rewritten_query = _rewrite_recursion(query)
+        self.assertEqual(_format_query(expected_query), rewritten_query)
+        compile_graphql_to_match(schema, rewritten_query)
+
+    def test_recursion_of_exactly_the_hierarchy_depth_is_rewritten(self):
+        query = '''{
+            Region {
+                name @output(out_name: "region")
+                in_Has_Parent_Region @recurse(depth: 3) {
+                    name @output(out_name: "descendant")
+                }
+            }
+        }'''
+
+        rewritten_query = _rewrite_recursion(query)
+        self.assertIn('in_Has_Ancestor_Region {', rewritten_query)
+        self.assertNotIn('@recurse', rewritten_query)
+        compile_graphql_to_match(schema, rewritten_query)
+
+    def test_shallow_recursion_is_unchanged(self):
+        query = '''{
+            Region {
+                name @output(out_name: "region")
+                out_Has_Parent_Region @recurse(depth: 2) {
+                    name @output(out_name: "ancestor")
+                }
+            }
+        }'''
+        self.assertEqual(query, _rewrite_recursion(query))
+
+    def test_recursion_over_other_edges_is_unchanged(self):
+        query = '''{
+            Character {
+                name @output(out_name: "character")
+                out_Owes_Allegiance_To @recurse(depth: 5) {
+                    name @output(out_name: "liege")
+                }
+            }
+        }'''
+        self.assertEqual(query, _rewrite_recursion(query))
+
+
+class FoldCountsAsDegreesTests(unittest.TestCase):
+    def test_count_only_fold_is_rewritten(self):
+        query = '''{
+            Character {
+                name @output(out_name: "character")
+                out_Owes_Allegiance_To @fold {
+                    _x_count @filter(op_name: ">=", value: ["$min_allegiances"])
+                }
+                out_Lives_In {
+                    name @output(out_name: "home")
+                }
+            }
+        }'''
+        expected_query = '''{
+            Character {
+                name @output(out_name: "character")
+                degree_out_Owes_Allegiance_To @filter(op_name: ">=", value: ["$min_allegiances"])
+                out_Lives_In {
+                    name @output(out_name: "home")
+                }
+            }
+        }'''
+
+        rewritten_query = _rewrite_fold_counts(query)
+        self.assertEqual(_format_query(expected_query), rewritten_query)
+        compile_graphql_to_match(schema, rewritten_query)
+
+    def test_output_count_in_nested_scope_is_rewritten(self):
+        query = '''{
+            Character {
+                name @output(out_name: "character")
+                out_Lives_In {
+                    name @output(out_name: "home")
+                    in_Lives_In @fold {
+                        _x_count @output(out_name: "residents")
+                    }
+                }
+            }
+        }'''
+        expected_query = '''{
+            Character {
+                name @output(out_name: "character")
+                out_Lives_In {
+                    name @output(out_name: "home")
+                    degree_in_Lives_In @output(out_name: "residents")
+                }
+            }
+        }'''
+
+        rewritten_query = _rewrite_fold_counts(query)
+        self.assertEqual(_format_query(expected_query), rewritten_query)
+        compile_graphql_to_match(schema, rewritten_query)
+
+    def test_typed_fold_is_unchanged(self):
+        query = '''{
+            Character {
+                name @output(out_name: "character")
+                out_Owes_Allegiance_To @fold {
+                    ... on NobleHouse {
+                        _x_count @filter(op_name: ">=", value: ["$min_allegiances"])
+                    }
+                }
+            }
+        }'''
+        self.assertEqual(query, _rewrite_fold_counts(query))
+
+    def test_fold_with_outputs_is_unchanged(self):
+        query = '''{
+            Character {
+                name @output(out_name: "character")
+                out_Owes_Allegiance_To @fold {
+                    _x_count @filter(op_name: ">=", value: ["$min_allegiances"])
+                    name @output(out_name: "allegiances")
+                }
+            }
+        }'''
+        self.assertEqual(query, _rewrite_fold_counts(query))
+
+    def test_folds_within_scope_changing_directives_are_unchanged(self):
+        for directive in ('@fold', '@optional', '@recurse(depth: 2)'):
+            query = '''{
+                Region {
+                    name @output(out_name: "region")
+                    in_Has_Parent_Region %s {
+                        in_Lives_In @fold {
+                            _x_count @output(out_name: "residents")
+                        }
+                    }
+                }
+            }''' % directive
+            self.assertEqual(query, _rewrite_fold_counts(query))
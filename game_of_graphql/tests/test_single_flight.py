@@ -0,0 +1,157 @@
+# Copyright 2017 Kensho Technologies, Inc.
+import threading
+import time
+import unittest
+
+from game_of_graphql.single_flight import SingleFlight
+
+
+class _RejectedError(RuntimeError):
+    """An error specific to the call that raised it."""
+
+
+def _wait_until(condition, timeout=5.0):
+    """Wait until the condition function returns True, failing if it takes too long."""
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:
+            raise AssertionError(u'Condition not met within {} seconds.'.format(timeout))
+        time.sleep(0.001)
+
+
+class _CallThread(threading.Thread):
+    """A thread making a single call through a SingleFlight, recording its outcome."""
+
+    def __init__(self, single_flight, key, func, *args):
+        """Create a thread that calls single_flight.run(key, func, *args) once started."""
+        super(_CallThread, self).__init__()
+        self.daemon = True
+        self._call = (single_flight, key, func, args)
+        self.result = None
+        self.error = None
+
+    def run(self):
+        """Make the call, and record its result or the exception it raised."""
+        single_flight, key, func, args = self._call
+        # pylint: disable=broad-except
+        try:
+            self.result = single_flight.run(key, func, *args)
+        except Exception as e:
+            self.error = e
+        # pylint: enable=broad-except
+
+
+class _BlockingFunction(object):
+    """A function that blocks until released, then returns or raises the next outcome."""
+
+    def __init__(self, outcomes):
+        """Create a function returning each of the outcomes in turn, raising exceptions."""
+        self.released = threading.Event()
+        self.call_count = 0
+        self._outcomes = list(outcomes)
+        self._lock = threading.Lock()
+
+    def __call__(self, block=True):
+        """Wait to be released if asked to, then return or raise the next outcome."""
+        with self._lock:
+            self.call_count += 1
+            outcome = self._outcomes.pop(0)
+        if block:
+            self.released.wait()
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+class SingleFlightTests(unittest.TestCase):
+    def _start_calls(self, single_flight, func, follower_count):
+        """Start a leader call, then follower calls once the leader is in flight."""
+        leader = _CallThread(single_flight, 'key', func)
+        leader.start()
+        _wait_until(lambda: single_flight.stats()['in_flight'] == 1)
+
+        followers = [
+            _CallThread(single_flight, 'key', func)
+            for _ in range(follower_count)
+        ]
+        for follower in followers:
+            follower.start()
+        _wait_until(lambda: single_flight.stats()['waiting'] == follower_count)
+        return leader, followers
+
+    def test_concurrent_calls_share_one_execution(self):
+        single_flight = SingleFlight()
+        func = _BlockingFunction([['result']])
+        leader, followers = self._start_calls(single_flight, func, 2)
+        self.assertEqual(0, single_flight.stats()['coalesced'])
+
+        func.released.set()
+        for thread in [leader] + followers:
+            thread.join()
+
+        self.assertEqual((['result'], False), leader.result)
+        for follower in followers:
+            self.assertEqual((['result'], True), follower.result)
+            self.assertIs(leader.result[0], follower.result[0])
+        self.assertEqual(1, func.call_count)
+        stats = single_flight.stats()
+        self.assertEqual(1, stats['executions'])
+        self.assertEqual(2, stats['coalesced'])
+        self.assertEqual(0, stats['in_flight'])
+        self.assertEqual(0, stats['waiting'])
+
+    def test_later_calls_execute_again(self):
+        single_flight = SingleFlight()
+        func = _BlockingFunction(['first', 'second'])
+        self.assertEqual(('first', False), single_flight.run('key', func, False))
+        self.assertEqual(('second', False), single_flight.run('key', func, False))
+        self.assertEqual(0, single_flight.stats()['coalesced'])
+
+    def test_follower_timeout(self):
+        single_flight = SingleFlight(follower_timeout=0.01)
+        func = _BlockingFunction(['leader result', 'follower result'])
+        leader = _CallThread(single_flight, 'key', func)
+        leader.start()
+        _wait_until(lambda: single_flight.stats()['in_flight'] == 1)
+
+        # The follower stops waiting for the leader, and calls the function without blocking.
+        self.assertEqual(('follower result', False), single_flight.run('key', func, False))
+        stats = single_flight.stats()
+        self.assertEqual(1, stats['follower_timeouts'])
+        self.assertEqual(0, stats['coalesced'])
+
+        func.released.set()
+        leader.join()
+        self.assertEqual(('leader result', False), leader.result)
+
+    def test_errors_are_shared(self):
+        single_flight = SingleFlight(unshared_errors=(_RejectedError,))
+        error = ValueError('failed')
+        func = _BlockingFunction([error])
+        leader, followers = self._start_calls(single_flight, func, 2)
+
+        func.released.set()
+        for thread in [leader] + followers:
+            thread.join()
+
+        for thread in [leader] + followers:
+            self.assertIs(error, thread.error)
+        self.assertEqual(1, func.call_count)
+        self.assertEqual(2, single_flight.stats()['coalesced'])
+
+    def test_unshared_errors_are_retried(self):
+        single_flight = SingleFlight(unshared_errors=(_RejectedError,))
+        error = _RejectedError('not admitted')
+        func = _BlockingFunction([error, 'result'])
+        leader, followers = self._start_calls(single_flight, func, 1)
+
+        func.released.set()
+        leader.join()
+        followers[0].join()
+
+        self.assertIs(error, leader.error)
+        self.assertEqual(('result', False), followers[0].result)
+        self.assertEqual(2, func.call_count)
+        stats = single_flight.stats()
+        self.assertEqual(1, stats['follower_retries'])
+        self.assertEqual(0, stats['coalesced'])
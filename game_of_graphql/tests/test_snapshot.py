@@ -0,0 +1,65 @@
+# Copyright 2017 Kensho Technologies, Inc.
+from os import path
+import shutil
+import struct
+import tempfile
+import unittest
+
+from game_of_graphql.snapshot import (SNAPSHOT_FORMAT_VERSION, SNAPSHOT_MAGIC, SnapshotFormatError,
+                                      read_snapshot, write_snapshot)
+from game_of_graphql.tests.test_helpers import make_fixture_data
+
+
+class SnapshotTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.snapshot_path = path.join(self.directory, 'snapshot.bin')
+
+    def _read_snapshot_bytes(self):
+        """Return the contents of the snapshot file."""
+        with open(self.snapshot_path, 'rb') as f:
+            return f.read()
+
+    def _write_snapshot_bytes(self, contents):
+        """Replace the contents of the snapshot file."""
+        with open(self.snapshot_path, 'wb') as f:
+            f.write(contents)
+
+    def test_round_trip(self):
+        data = make_fixture_data()
+        write_snapshot(self.snapshot_path, data)
+        self.assertEqual(data, read_snapshot(self.snapshot_path))
+        self.assertFalse(path.exists(self.snapshot_path + '.tmp'))
+
+    def test_round_trip_of_empty_data(self):
+        data = make_fixture_data()
+        for key in data:
+            data[key] = type(data[key])()
+        write_snapshot(self.snapshot_path, data)
+        self.assertEqual(data, read_snapshot(self.snapshot_path))
+
+    def test_bad_magic(self):
+        write_snapshot(self.snapshot_path, make_fixture_data())
+        contents = self._read_snapshot_bytes()
+        self._write_snapshot_bytes(b'NOTASNAP' + contents[len(SNAPSHOT_MAGIC):])
+        with self.assertRaises(SnapshotFormatError):
+            read_snapshot(self.snapshot_path)
+
+    def test_wrong_version(self):
+        write_snapshot(self.snapshot_path, make_fixture_data())
+        contents = self._read_snapshot_bytes()
+        version_offset = len(SNAPSHOT_MAGIC)
+        self._write_snapshot_bytes(
+            contents[:version_offset] + struct.pack('<I', SNAPSHOT_FORMAT_VERSION + 1) +
+            contents[version_offset + 4:])
+        with self.assertRaises(SnapshotFormatError):
+            read_snapshot(self.snapshot_path)
+
+    def test_truncated_file(self):
+        write_snapshot(self.snapshot_path, make_fixture_data())
+        contents = self._read_snapshot_bytes()
+        for length in (0, 4, len(SNAPSHOT_MAGIC) + 6, 40, len(contents) // 2, len(contents) - 1):
+            self._write_snapshot_bytes(contents[:length])
+            with self.assertRaises(SnapshotFormatError):
+                read_snapshot(self.snapshot_path)
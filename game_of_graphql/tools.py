@@ -1,22 +1,89 @@
 # Copyright 2017 Kensho Technologies, Inc.
 """Utilities for running the Game of GraphQL server."""
+import logging
+from os import path
 from time import sleep
 
 from pyorient import PyOrientConnectionException
 from pyorient.ogm import Config, Graph
 
-from game_of_graphql import existing_dataset, new_dataset
+from game_of_graphql import existing_dataset, new_dataset, snapshot
 
 
-def recreate_game_of_graphql_graph(orientdb_location, username, password):
-    """If the Game of GraphQL graph isn't present, construct it from the GamesOfThrones one."""
-    exising_config = Config.from_url(
-        'plocal://{}/GamesOfThrones'.format(orientdb_location), username, password)
+logger = logging.getLogger(__name__)
+
+
+def load_game_of_graphql_data(orientdb_location, username, password, snapshot_path=None,
+                              refresh_snapshot=False,
+                              page_size=existing_dataset.DEFAULT_PAGE_SIZE):
+    """Load the Game of GraphQL data from a snapshot file, or the GamesOfThrones graph.
+
+    Args:
+        orientdb_location: str, OrientDB host and port
+        username: str, OrientDB username
+        password: str, OrientDB password
+        snapshot_path: optional str, path of the snapshot file to load the data from.
+                       If the file is missing or unreadable, the data is loaded from the
+                       GamesOfThrones graph instead, and saved to the file.
+        refresh_snapshot: bool, if True, load from the GamesOfThrones graph even if the
+                          snapshot file exists, and overwrite the file
+        page_size: int, number of records read per query from the GamesOfThrones graph
+
+    Returns:
+        tuple (dict of data as returned by existing_dataset.load_all_data(), str fingerprint)
+    """
+    data = None
+    if snapshot_path is not None and not refresh_snapshot and path.exists(snapshot_path):
+        try:
+            data = snapshot.read_snapshot(snapshot_path)
+            logger.info(u'Loaded the Game of GraphQL data from snapshot %s.', snapshot_path)
+        except snapshot.SnapshotFormatError as e:
+            logger.warning(u'Ignoring unreadable snapshot %s: %s', snapshot_path, e)
+
+    if data is None:
+        existing_config = Config.from_url(
+            'plocal://{}/GamesOfThrones'.format(orientdb_location), username, password)
+        data = existing_dataset.load_all_data(existing_config, page_size=page_size)
+        if snapshot_path is not None:
+            snapshot.write_snapshot(snapshot_path, data)
+            logger.info(u'Saved the Game of GraphQL data to snapshot %s.', snapshot_path)
+
+    return data, new_dataset.compute_dataset_fingerprint(data)
+
+
+def recreate_game_of_graphql_graph(orientdb_location, username, password, data, fingerprint,
+                                   force_rebuild=False, batch_size=500, incremental=False,
+                                   page_size=existing_dataset.DEFAULT_PAGE_SIZE):
+    """If the Game of GraphQL graph isn't up to date with the data, construct it from the data.
+
+    Args:
+        orientdb_location: str, OrientDB host and port
+        username: str, OrientDB username
+        password: str, OrientDB password
+        data: dict, the data returned by load_game_of_graphql_data()
+        fingerprint: str, the fingerprint of the data returned by load_game_of_graphql_data()
+        force_rebuild: bool, if True, rebuild the graph even if it appears to be up to date
+        batch_size: int, number of vertices or edges created per database round trip
+        incremental: bool, if True, only apply the changes between the graph and the data,
+                     instead of recreating the graph. The graph is still recreated if its
+                     schema changed, or if force_rebuild is True.
+        page_size: int, number of records read per query when reading the graph to sync it
+    """
     new_config = Config.from_url(
         'plocal://{}/game_of_graphql'.format(orientdb_location), username, password)
 
-    data = existing_dataset.load_all_data(exising_config)
-    new_dataset.create_game_of_graphql_graph(new_config, data)
+    if not force_rebuild:
+        stored_fingerprint = new_dataset.get_stored_dataset_fingerprint(new_config)
+        if stored_fingerprint == fingerprint:
+            logger.info(u'The Game of GraphQL graph is up to date, not rebuilding it.')
+            return
+
+        if incremental:
+            new_dataset.sync_game_of_graphql_graph(
+                new_config, data, batch_size=batch_size, page_size=page_size)
+            return
+
+    new_dataset.create_game_of_graphql_graph(new_config, data, batch_size=batch_size)
 
 
 def wait_for_orientdb_to_come_alive(orientdb_location, username, password):